@@ -4,6 +4,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# How long used or expired verification codes are kept before the TTL index removes them
+VERIFICATION_RETENTION_SECONDS = config('VERIFICATION_RETENTION_SECONDS', default=86400, cast=int)
+
 class Database:
     client: AsyncIOMotorClient = None
     database = None
@@ -31,7 +34,88 @@ async def connect_to_mongo():
             logger.info("Successfully created unique indexes for users collection")
         except Exception as idx_error:
             logger.warning(f"Could not create indexes (may already exist): {idx_error}")
-            
+        
+        # Indexes for coupons and coupon usage history. The unique per-user counter
+        # index that enforces per-user limits is created by CouponService at startup.
+        try:
+            await db.database.coupons.create_index("code", unique=True)
+            logger.info("Successfully created coupon code index")
+        except Exception as idx_error:
+            logger.warning(f"Could not create coupon code index (may already exist): {idx_error}")
+        
+        try:
+            await db.database.coupon_usage.create_index([("coupon_id", 1)])
+            await db.database.coupon_usage.create_index([("user_id", 1), ("used_at", -1)])
+            logger.info("Successfully created indexes for coupon usage collection")
+        except Exception as idx_error:
+            logger.warning(f"Could not create coupon usage indexes (may already exist): {idx_error}")
+        
+        # TTL indexes so expired verification codes and lapsed restrictions are removed by MongoDB
+        try:
+            await db.database.verification_codes.create_index(
+                "expires_at", expireAfterSeconds=VERIFICATION_RETENTION_SECONDS
+            )
+            await db.database.verification_codes.create_index(
+                [("email", 1), ("phone", 1), ("type", 1), ("status", 1)]
+            )
+            await db.database.account_restrictions.create_index(
+                "restricted_until", expireAfterSeconds=0
+            )
+            await db.database.account_restrictions.create_index([("email", 1)])
+            await db.database.account_restrictions.create_index([("phone", 1)])
+            logger.info("Successfully created indexes for verification collections")
+        except Exception as idx_error:
+            logger.warning(f"Could not create verification indexes (may already exist): {idx_error}")
+        
+        # Indexes for conversation-based messaging
+        try:
+            await db.database.messages.create_index(
+                [("conversation_id", 1), ("timestamp", -1), ("_id", -1)]
+            )
+            await db.database.messages.create_index(
+                [("to_id", 1), ("read", 1), ("conversation_id", 1)]
+            )
+            await db.database.conversations.create_index(
+                [("participants", 1), ("last_message_at", -1)]
+            )
+            logger.info("Successfully created indexes for messaging collections")
+        except Exception as idx_error:
+            logger.warning(f"Could not create messaging indexes (may already exist): {idx_error}")
+
+        # Meals are joined to chefs by chef_id for the browse catalog and searched by text,
+        # dietary tag and price
+        try:
+            await db.database.meals.create_index("chef_id")
+            await db.database.meals.create_index(
+                [("name", "text"), ("description", "text"), ("ingredients", "text"), ("dietary_info", "text")],
+                weights={"name": 10, "ingredients": 3, "dietary_info": 3, "description": 1},
+                name="meal_search"
+            )
+            await db.database.meals.create_index([("chef_id", 1), ("price", 1)])
+            await db.database.meals.create_index("dietary_tags")
+            logger.info("Successfully created indexes for meals collection")
+        except Exception as idx_error:
+            logger.warning(f"Could not create meals indexes (may already exist): {idx_error}")
+
+        # Idempotency keys for retried POSTs expire on their own
+        try:
+            await db.database.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+            logger.info("Successfully created idempotency key TTL index")
+        except Exception as idx_error:
+            logger.warning(f"Could not create idempotency key index (may already exist): {idx_error}")
+
+        # Per-provider schedule indexes used for appointment conflict checks
+        try:
+            await db.database.care_visit_requests.create_index(
+                [("caretaker_id", 1), ("appointment_date_time", 1)]
+            )
+            await db.database.psychologist_visit_requests.create_index(
+                [("psychologist_id", 1), ("appointment_date_time", 1)]
+            )
+            logger.info("Successfully created provider schedule indexes")
+        except Exception as idx_error:
+            logger.warning(f"Could not create provider schedule indexes (may already exist): {idx_error}")
+
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
         raise e
@@ -9,10 +9,18 @@ from pathlib import Path
 import asyncio
 from app.config.database import connect_to_mongo, close_mongo_connection, get_database
 from app.routers import (
-    auth, user, admin, vitals, meals, orders, appointments, messages, visit_requests, advertisements, coupons, subscription_plans
+    auth, user, admin, vitals, meals, orders, appointments, messages, visit_requests, advertisements, coupons, subscription_plans, events
 )
 from app.utils.cleanup import cleanup_expired_verifications
+from app.utils.background import background_tasks
+from app.utils.rate_limit import rate_limiter
 from app.utils.initial_setup import create_default_admins  # Add this import
+from app.services.coupon import CouponService
+from app.services.user import UserService
+from app.services.message import MessageService, MESSAGE_CHANGE_STREAM_ENABLED
+from app.services.meal import MealService
+from app.services.order import OrderService
+from decouple import config
 
 # Set up logging
 logging.basicConfig(
@@ -46,10 +54,75 @@ async def startup_event():
     # Create default admin users if needed
     db = await get_database()
     await create_default_admins(db)
+    
+    # Backfill and index normalized usernames used by case-insensitive login
+    try:
+        await UserService(db).migrate_username_lower()
+    except Exception as e:
+        logger.error(f"Username normalization backfill failed: {str(e)}")
+    
+    # Per-user coupon limits depend on this index; redemption stays off without it
+    await CouponService(db).ensure_user_usage_index()
+    
+    # Move legacy embedded coupon usage maps into their own collection
+    try:
+        await CouponService(db).migrate_embedded_usage_counts()
+    except Exception as e:
+        logger.error(f"Coupon usage migration failed: {str(e)}")
+    
+    # Tag older messages with their conversation and build conversation summaries
+    try:
+        await MessageService(db).migrate_conversation_ids()
+        await MessageService(db).migrate_unread_counters()
+    except Exception as e:
+        logger.error(f"Message conversation migration failed: {str(e)}")
+    
+    # Derive searchable dietary tags for older meals
+    try:
+        await MealService(db).migrate_dietary_tags()
+    except Exception as e:
+        logger.error(f"Meal dietary tag backfill failed: {str(e)}")
+    
+    # Record meal, chef and subscriber snapshots on older orders
+    try:
+        await OrderService(db).migrate_order_snapshots()
+    except Exception as e:
+        logger.error(f"Order snapshot backfill failed: {str(e)}")
+    
+    # Periodic maintenance jobs
+    background_tasks.register(
+        "verification-cleanup",
+        lambda: cleanup_expired_verifications(db),
+        interval_seconds=config('VERIFICATION_CLEANUP_INTERVAL_SECONDS', default=3600, cast=int),
+        timeout_seconds=300,
+        initial_delay_seconds=60
+    )
+    background_tasks.register(
+        "rate-limit-prune",
+        _prune_rate_limits,
+        interval_seconds=300
+    )
+    if MESSAGE_CHANGE_STREAM_ENABLED:
+        # Long-running relay; the interval is the retry delay after it stops
+        background_tasks.register(
+            "message-change-stream",
+            MessageService(db).relay_change_stream,
+            interval_seconds=5
+        )
+    background_tasks.start()
+
+async def _prune_rate_limits() -> int:
+    """Drop idle in-memory rate limit keys"""
+    return rate_limiter.prune()
+
+async def shutdown_event():
+    """Handle all shutdown tasks"""
+    await background_tasks.stop()
+    await close_mongo_connection()
 
 # Database connection events
 app.add_event_handler("startup", startup_event)
-app.add_event_handler("shutdown", close_mongo_connection)
+app.add_event_handler("shutdown", shutdown_event)
 
 # Include routers (rest of your router includes remain the same)
 app.include_router(auth.router, prefix="/api")
@@ -64,6 +137,7 @@ app.include_router(visit_requests.router, prefix="/api")
 app.include_router(advertisements.router, prefix="/api")
 app.include_router(coupons.router, prefix="/api")
 app.include_router(subscription_plans.router, prefix="/api")
+app.include_router(events.router, prefix="/api")
 
 @app.get("/api/health")
 def health_check():
@@ -1,6 +1,6 @@
 from enum import Enum
 from pydantic import BaseModel, Field, ConfigDict, validator
-from typing import Optional, List, Dict
+from typing import Optional, List
 from datetime import datetime
 from app.models.user import PyObjectId
 from bson import ObjectId
@@ -30,9 +30,6 @@ class Coupon(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
-    # Track usage count per user {user_id: count}
-    user_usage_count: Dict[str, int] = {}
-    
     model_config = ConfigDict(
         populate_by_name=True,
         arbitrary_types_allowed=True,
@@ -12,6 +12,7 @@ class Meal(BaseModel):
     price: float
     ingredients: List[str] = []
     dietary_info: Optional[str] = None
+    dietary_tags: List[str] = []
     meal_visibility: bool = True 
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -137,10 +137,15 @@ class Order(BaseModel):
     chef_id: PyObjectId
     meal_id: PyObjectId
     quantity: int = 1
+    subtotal: Optional[float] = None
+    discount: float = 0
+    coupon_code: Optional[str] = None
     total_price: float
     delivery_address: str
     status: OrderStatus = OrderStatus.PENDING
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    # Meal, chef and subscriber details as they were when the order was placed
+    snapshot: Optional[dict] = None
 
     model_config = ConfigDict(
         populate_by_name=True, 
@@ -167,6 +172,7 @@ class Message(BaseModel):
     id: Optional[PyObjectId] = Field(default=None, alias="_id")
     from_id: PyObjectId
     to_id: PyObjectId
+    conversation_id: Optional[str] = None
     content: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     read: bool = False
@@ -13,6 +13,7 @@ from app.routers import (
     advertisements,
     coupons,
     subscription_plans,
+    events,
 )
 
 # List all routers for easy registration
@@ -29,6 +30,7 @@ routers = [
     advertisements.router,
     coupons.router,
     subscription_plans.router,
+    events.router,
 ]
 
 __all__ = [
@@ -44,5 +46,6 @@ __all__ = [
     "routers",
     "advertisements",
     "coupons",
-    "subscription_plans"
+    "subscription_plans",
+    "events"
 ]
@@ -1,14 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from typing import List
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import User, UserRole, ApprovalStatus, SubscriptionStatus
 from app.schemas.user import UserResponse, SubscriptionUpdate
 from app.services.user import UserService
-from app.services.order import OrderService
+from app.services.order import OrderService, split_order_snapshot
 from app.schemas.order import OrderStatusUpdate
 from app.config.database import get_database
 from app.utils.dependencies import get_admin_user
+from app.utils.auth import password_hash_stats, benchmark_bcrypt_rounds_async
+from app.utils.background import background_tasks
+from app.utils.rate_limit import rate_limiter
+from app.utils.realtime import event_hub, status_hub
 import logging
 
 router = APIRouter(
@@ -57,23 +61,21 @@ async def get_chef_details(
     """Get all chefs with details (admin only)"""
     from app.services.meal import MealService
     
-    user_service = UserService(db)
     meal_service = MealService(db)
-    
-    # Get all chefs
-    chefs = await user_service.get_users_by_role(UserRole.CHEF)
-    
-    # Get meals for each chef
+
+    # Chefs and their meals in one aggregation
     chefs_with_details = []
-    for chef in chefs:
-        meals = await meal_service.get_meals_by_chef(str(chef.id))
+    for chef_doc in await meal_service.get_chefs_with_all_meals():
+        meals = chef_doc.pop("meals")
+        chef_doc['_id'] = str(chef_doc['_id'])
+        chef = User(**chef_doc)
         chef_dict = chef.dict(by_alias=True)
-        chef_dict["meals"] = [meal.dict(by_alias=True) for meal in meals]
+        chef_dict["meals"] = meals
         chef_dict["subscription_status"] = chef.subscription_status or "pending"
         chef_dict["subscription_plans"] = chef.subscription_plans or []
-        chef_dict["available"] = chef.available 
+        chef_dict["available"] = chef.available
         chefs_with_details.append(chef_dict)
-    
+
     return chefs_with_details
 
 @router.get("/chef-orders", response_model=List[dict])
@@ -82,51 +84,33 @@ async def get_all_chef_orders(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get all chef orders (admin only)"""
-    from app.services.meal import MealService
-    
-    user_service = UserService(db)
     order_service = OrderService(db)
-    meal_service = MealService(db)
-    
-    # Get all chefs
-    chefs = await user_service.get_users_by_role(UserRole.CHEF)
-    
-    # Get all subscribers
-    subscribers = await user_service.get_users_by_role(UserRole.SUBSCRIBER)
-    
+
     # Get all orders
     all_orders = await order_service.get_all_orders()
-    
-    # Prepare detailed orders
+
+    # Meal, chef and subscriber details come from each order's snapshot
     orders_with_details = []
     for order in all_orders:
-        meal = await meal_service.get_meal_by_id(str(order.meal_id))
-        chef = next((c for c in chefs if c.id == order.chef_id), None)
-        subscriber = next((s for s in subscribers if s.id == order.subscriber_id), None)
-        
-        order_detail = order.dict(by_alias=True)
-        order_detail["meal"] = meal.dict(by_alias=True) if meal else None
-        
-        if chef:
-            order_detail["chef"] = {
-                "id": str(chef.id),
-                "name": chef.name,
-                "experience": chef.experience
-            }
-        else:
-            order_detail["chef"] = None
-            
-        if subscriber:
-            order_detail["subscriber"] = {
-                "id": str(subscriber.id),
-                "name": subscriber.name,
-                "phone": subscriber.phone
-            }
-        else:
-            order_detail["subscriber"] = None
-            
+        order_detail, snapshot = split_order_snapshot(order)
+        order_detail["meal"] = snapshot.get("meal")
+
+        chef = snapshot.get("chef")
+        order_detail["chef"] = {
+            "id": chef.get("id"),
+            "name": chef.get("name"),
+            "experience": chef.get("experience")
+        } if chef else None
+
+        subscriber = snapshot.get("subscriber")
+        order_detail["subscriber"] = {
+            "id": subscriber.get("id"),
+            "name": subscriber.get("name"),
+            "phone": subscriber.get("phone")
+        } if subscriber else None
+
         orders_with_details.append(order_detail)
-    
+
     return orders_with_details
 
 @router.patch("/orders/{order_id}/status", status_code=status.HTTP_200_OK)
@@ -283,3 +267,46 @@ async def get_all_subscriptions(
         all_subscriptions[role.value] = role_subscriptions
     
     return all_subscriptions
+
+@router.get("/metrics/password-hashing", response_model=dict)
+async def get_password_hashing_metrics(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get queue depth and throughput of the password hashing pool (admin only)"""
+    return password_hash_stats()
+
+@router.get("/metrics/background-jobs", response_model=list)
+async def get_background_job_status(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get run history of periodic maintenance jobs on this worker (admin only)"""
+    return background_tasks.status()
+
+@router.get("/metrics/rate-limits", response_model=dict)
+async def get_rate_limit_metrics(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get auth rate limiter state on this worker (admin only)"""
+    return rate_limiter.stats()
+
+@router.get("/metrics/realtime", response_model=dict)
+async def get_realtime_metrics(
+    admin_user: User = Depends(get_admin_user)
+):
+    """Get live connection counts on this worker (admin only)"""
+    return {"messages": event_hub.stats(), "status_events": status_hub.stats()}
+
+@router.post("/metrics/password-hashing/benchmark", response_model=dict)
+async def benchmark_password_hashing(
+    min_rounds: int = Query(10, ge=4, le=16),
+    max_rounds: int = Query(14, ge=4, le=16),
+    samples: int = Query(3, ge=1, le=10),
+    admin_user: User = Depends(get_admin_user)
+):
+    """Time bcrypt cost factors on this node against the login latency SLO (admin only)"""
+    if min_rounds > max_rounds:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_rounds cannot be greater than max_rounds"
+        )
+    return await benchmark_bcrypt_rounds_async(min_rounds, max_rounds, samples)
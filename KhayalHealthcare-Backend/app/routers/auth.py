@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.schemas.user import UserCreate, UserResponse, UserLogin, PasswordChange
 from app.schemas.verification import (
@@ -7,17 +7,22 @@ from app.schemas.verification import (
     VerificationCodeResponse
 )
 from app.services.auth import AuthService
-from app.services.user import UserService
+from app.services.user import UserService, DuplicateUserError
 from app.services.verification import VerificationService
-from app.models.verification import VerificationType, VerificationMethod, VerificationStatus
+from app.models.verification import VerificationType, VerificationMethod
 from app.config.database import get_database
 import logging
 from datetime import datetime
 from bson import ObjectId
 import asyncio
 from app.models.user import User
-from app.utils.dependencies import get_current_user
-from app.utils.auth import verify_password, get_password_hash
+from app.utils.dependencies import get_current_user, get_admin_user
+from app.utils.auth import verify_password_async, get_password_hash_async
+from app.utils.rate_limit import enforce_rate_limit, enforce_failure_limit, record_failure, clear_failures
+from app.utils.background import background_tasks
+from app.utils.cleanup import (
+    OVERSIZED_PASSWORD_JOB, purge_oversized_registration_passwords, get_cleanup_progress
+)
 
 router = APIRouter(
     prefix="/auth",
@@ -27,39 +32,38 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
+REGISTER_DUPLICATE_MESSAGES = {
+    "username": "Username '{username}' is already taken. Please choose a different username.",
+    "email": "Email '{email}' is already registered. Please use a different email.",
+    "phone": "Phone number '{phone}' is already registered. Please use a different phone number."
+}
+
+VERIFY_DUPLICATE_MESSAGES = {
+    "username": "Username '{username}' is already taken. Please register again with a different username.",
+    "email": "Email '{email}' is already registered. Please register again with a different email.",
+    "phone": "Phone number '{phone}' is already registered. Please register again with a different phone number."
+}
+
 @router.post("/register", response_model=VerificationCodeResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def register(user_data: UserCreate, request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Register a new user - sends verification code"""
+    await enforce_rate_limit(request, "register", email=user_data.email, phone=user_data.phone)
     try:
         logger.info(f"Registration attempt for username: {user_data.username}")
         user_service = UserService(db)
         verification_service = VerificationService(db)
 
-        # Check if username exists
-        existing_user = await user_service.get_user_by_username(user_data.username)
-        if existing_user:
-            logger.warning(f"Registration failed - username exists: {user_data.username}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Username '{user_data.username}' is already taken. Please choose a different username."
-            )
-
-        # Check if email exists
-        existing_email = await user_service.get_user_by_email(user_data.email)
-        if existing_email:
-            logger.warning(f"Registration failed - email exists: {user_data.email}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Email '{user_data.email}' is already registered. Please use a different email."
-            )
-
-        # Check if phone number exists
-        existing_phone = await user_service.get_user_by_phone(user_data.phone)
-        if existing_phone:
-            logger.warning(f"Registration failed - phone exists: {user_data.phone}")
+        # Check username, email and phone in one query
+        conflicts = await user_service.find_conflicting_identifiers(
+            user_data.username, user_data.email, user_data.phone
+        )
+        if conflicts:
+            logger.warning(f"Registration failed - {conflicts[0]} exists for username: {user_data.username}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Phone number '{user_data.phone}' is already registered. Please use a different phone number."
+                detail=REGISTER_DUPLICATE_MESSAGES[conflicts[0]].format(
+                    username=user_data.username, email=user_data.email, phone=user_data.phone
+                )
             )
 
         # Additional password validation before storing
@@ -151,39 +155,23 @@ async def verify_registration(
                 detail="Password is too long. Please register again with a shorter password (maximum 72 bytes)."
             )
 
-        # Re-check for duplicates before creating user (prevent race conditions)
-        username = registration_data.get('username')
-        email = registration_data.get('email')
-        phone = registration_data.get('phone')
-        
-        existing_user = await user_service.get_user_by_username(username)
-        if existing_user:
-            logger.warning(f"Verification failed - username already exists: {username}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Username '{username}' is already taken. Please register again with a different username."
-            )
-        
-        existing_email = await user_service.get_user_by_email(email)
-        if existing_email:
-            logger.warning(f"Verification failed - email already exists: {email}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Email '{email}' is already registered. Please register again with a different email."
-            )
-        
-        existing_phone = await user_service.get_user_by_phone(phone)
-        if existing_phone:
-            logger.warning(f"Verification failed - phone already exists: {phone}")
+        # Create the user with verified status; the unique indexes catch
+        # identifiers registered since the code was sent
+        user_create = UserCreate(**registration_data)
+        try:
+            user = await user_service.create_user(user_create, email_verified=True, phone_verified=True)
+        except DuplicateUserError as e:
+            logger.warning(f"Verification failed - {e.fields or 'identifier'} already registered: {user_create.username}")
+            detail = str(e)
+            if e.fields:
+                detail = VERIFY_DUPLICATE_MESSAGES[e.fields[0]].format(
+                    username=user_create.username, email=user_create.email, phone=user_create.phone
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Phone number '{phone}' is already registered. Please register again with a different phone number."
+                detail=detail
             )
 
-        # Create the user with verified status
-        user_create = UserCreate(**registration_data)
-        user = await user_service.create_user(user_create, email_verified=True, phone_verified=True)
-
         logger.info(f"User registered and verified successfully: {user.id}")
 
         # Convert to response model
@@ -210,9 +198,11 @@ async def verify_registration(
 @router.post("/resend-code", response_model=VerificationCodeResponse)
 async def resend_verification_code(
     resend_data: ResendCodeRequest,
+    request: Request,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Resend verification code"""
+    await enforce_rate_limit(request, "resend-code", email=resend_data.email, phone=resend_data.phone)
     try:
         verification_service = VerificationService(db)
         
@@ -248,9 +238,11 @@ async def resend_verification_code(
 @router.post("/forgot-password", response_model=VerificationCodeResponse)
 async def forgot_password(
     reset_data: PasswordResetRequest,
+    request: Request,
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Request password reset"""
+    await enforce_rate_limit(request, "forgot-password", identifier=reset_data.identifier)
     try:
         user_service = UserService(db)
         verification_service = VerificationService(db)
@@ -339,8 +331,7 @@ async def reset_password(
             )
         
         # Update password
-        from app.utils.auth import get_password_hash
-        hashed_password = get_password_hash(reset_data.new_password)
+        hashed_password = await get_password_hash_async(reset_data.new_password)
         
         await db.users.update_one(
             {"_id": ObjectId(user.id)},
@@ -362,8 +353,11 @@ async def reset_password(
         )
 
 @router.post("/login")
-async def login(user_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_database)):
+async def login(user_data: UserLogin, request: Request, db: AsyncIOMotorDatabase = Depends(get_database)):
     """Authenticate user and return access token with user data"""
+    # Every attempt counts against the IP; only failed ones count against the account
+    await enforce_rate_limit(request, "login")
+    await enforce_failure_limit("login-failure", identifier=user_data.username)
     try:
         logger.info(f"Login attempt for username: {user_data.username}")
         auth_service = AuthService(db)
@@ -379,10 +373,13 @@ async def login(user_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_dat
         
         result = await auth_service.login_user(user_data)
         logger.info(f"Login successful for user: {user_data.username}")
+        await clear_failures("login-failure", identifier=user_data.username)
         return result
         
-    except HTTPException:
+    except HTTPException as e:
         logger.warning(f"Login failed for user: {user_data.username}")
+        if e.status_code == status.HTTP_401_UNAUTHORIZED:
+            await record_failure("login-failure", identifier=user_data.username)
         raise
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
@@ -403,7 +400,7 @@ async def change_password(
         logger.info(f"Password change attempt for user: {current_user.username}")
         
         # Verify current password
-        if not verify_password(password_data.current_password, current_user.password):
+        if not await verify_password_async(password_data.current_password, current_user.password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Current password is incorrect"
@@ -417,7 +414,7 @@ async def change_password(
             )
         
         # Hash the new password
-        new_hashed_password = get_password_hash(password_data.new_password)
+        new_hashed_password = await get_password_hash_async(password_data.new_password)
         
         # Update the password
         user_service = UserService(db)
@@ -508,43 +505,25 @@ If this wasn't you, please contact support immediately!
     except Exception as e:
         logger.error(f"Error sending password change notifications: {str(e)}")
 
-@router.post("/cleanup-verification-records")
-async def cleanup_verification_records(db: AsyncIOMotorDatabase = Depends(get_database)):
-    """Clean up verification records with passwords longer than 72 bytes"""
+@router.post("/cleanup-verification-records", status_code=status.HTTP_202_ACCEPTED)
+async def cleanup_verification_records(
+    batch_size: int = Query(500, ge=1, le=5000),
+    restart: bool = Query(False, description="Start over instead of resuming from the last checkpoint"),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Start the cleanup of verification records with passwords longer than 72 bytes (admin only)"""
     try:
-        verification_service = VerificationService(db)
-
-        # Find and delete verification records with long passwords
-        verifications_collection = db.verification_codes
-
-        # Find all pending verification records
-        cursor = verifications_collection.find({"status": VerificationStatus.PENDING})
-        records_to_delete = []
-        total_checked = 0
-
-        async for record in cursor:
-            total_checked += 1
-            registration_data = record.get('registration_data', {})
-            password = registration_data.get('password', '')
-
-            # Check if password is too long
-            if password and len(password.encode('utf-8')) > 72:
-                records_to_delete.append(record['_id'])
-                logger.info(f"Found verification record with long password: {record.get('email', 'unknown')} - {len(password.encode('utf-8'))} bytes")
-
-        # Delete problematic records
-        deleted_count = 0
-        if records_to_delete:
-            result = await verifications_collection.delete_many({
-                '_id': {'$in': records_to_delete}
-            })
-            deleted_count = result.deleted_count
-            logger.info(f"Deleted {deleted_count} verification records with long passwords")
-
+        started = background_tasks.run_once(
+            OVERSIZED_PASSWORD_JOB,
+            lambda: purge_oversized_registration_passwords(db, batch_size=batch_size, restart=restart)
+        )
+        progress = await get_cleanup_progress(db)
+        
         return {
-            "message": f"Cleanup completed. Checked {total_checked} records, deleted {deleted_count} records with long passwords.",
-            "total_checked": total_checked,
-            "deleted_count": deleted_count
+            "message": "Cleanup started" if started else "Cleanup is already running",
+            "started": started,
+            "progress": progress
         }
 
     except Exception as e:
@@ -553,3 +532,13 @@ async def cleanup_verification_records(db: AsyncIOMotorDatabase = Depends(get_da
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Cleanup failed. Please try again later."
         )
+
+@router.get("/cleanup-verification-records")
+async def get_cleanup_verification_records_progress(
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get progress of the verification record cleanup (admin only)"""
+    progress = await get_cleanup_progress(db)
+    progress["running"] = background_tasks.is_running(OVERSIZED_PASSWORD_JOB)
+    return progress
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from typing import List
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import User
@@ -6,7 +6,7 @@ from app.schemas.coupon import (
     CouponCreate, CouponResponse, CouponUpdate, CouponApply,
     CouponValidateResponse, BulkCouponCreate
 )
-from app.services.coupon import CouponService
+from app.services.coupon import CouponService, BulkCouponGenerationError
 from app.config.database import get_database
 from app.utils.dependencies import get_current_user, get_admin_user
 import logging
@@ -60,6 +60,11 @@ async def create_bulk_coupons(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
+    except BulkCouponGenerationError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Failed to create bulk coupons: {str(e)}")
         raise HTTPException(
@@ -213,28 +218,13 @@ async def apply_coupon_to_order(
 
 @router.get("/my-usage", response_model=List[dict])
 async def get_my_coupon_usage(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get coupon usage history for the current user"""
+    """Get coupon usage history for the current user (newest first, paginated)"""
     coupon_service = CouponService(db)
-    usage_records = await coupon_service.get_user_coupon_usage(str(current_user.id))
-    
-    # Get coupon details for each usage
-    usage_with_details = []
-    for usage in usage_records:
-        usage_dict = usage.dict(by_alias=True)
-        
-        # Get coupon details
-        coupon = await coupon_service.get_coupon_by_id(str(usage.coupon_id))
-        if coupon:
-            usage_dict["coupon"] = {
-                "code": coupon.code,
-                "type": coupon.type,
-                "discount_percentage": coupon.discount_percentage,
-                "discount_amount": coupon.discount_amount
-            }
-        
-        usage_with_details.append(usage_dict)
-    
-    return usage_with_details
+    return await coupon_service.get_user_coupon_usage_with_details(
+        str(current_user.id), skip=skip, limit=limit
+    )
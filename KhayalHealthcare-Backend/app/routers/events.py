@@ -0,0 +1,76 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.models.user import UserRole
+from app.config.database import get_database
+from app.utils.dependencies import get_user_from_token
+from app.utils.realtime import status_hub, ADMIN_TOPIC
+import asyncio
+import json
+import logging
+
+router = APIRouter(
+    prefix="/events",
+    tags=["events"],
+    responses={401: {"description": "Unauthorized"}},
+)
+
+logger = logging.getLogger(__name__)
+
+# Comment frames keep proxies from closing idle streams
+HEARTBEAT_SECONDS = 15
+
+def _format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+
+@router.get("/stream")
+async def stream_status_events(
+    request: Request,
+    token: Optional[str] = Query(None, description="Access token, for clients that cannot set headers"),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Server-sent events for visit-request and order status changes.
+
+    Subscribers, providers and chefs receive transitions on their own requests
+    and orders; admins receive all of them.
+    """
+    if not token:
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:]
+
+    user = await get_user_from_token(token, db)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    topic = ADMIN_TOPIC if user.role == UserRole.ADMIN else str(user.id)
+    subscription = status_hub.subscribe(topic)
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                if subscription.overflowed:
+                    # Too far behind; the client reconnects and refreshes
+                    break
+                yield _format_event(event)
+        finally:
+            status_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
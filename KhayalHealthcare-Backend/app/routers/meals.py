@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import User, UserRole
-from app.schemas.meal import MealCreate, MealResponse
-from app.services.meal import MealService
+from app.schemas.meal import MealCreate, MealResponse, MealSearchResult
+from app.services.meal import MealService, MEAL_SEARCH_SORTS
 from app.config.database import get_database
 from app.utils.dependencies import get_current_user
 from pydantic import BaseModel
@@ -53,32 +53,61 @@ async def get_all_meals(
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
     """Get all meals from all available chefs with chef details"""
-    from app.services.user import UserService
-    
     meal_service = MealService(db)
-    user_service = UserService(db)
-    
-    # Get all chefs
-    chefs = await user_service.get_users_by_role(UserRole.CHEF)
-    
-    # Get all meals
-    all_meals = []
-    for chef in chefs:
-        # Check if chef is approved AND available
-        if chef.approval_status == "approved" and chef.available:
-            meals = await meal_service.get_meals_by_chef(str(chef.id))
-            for meal in meals:
-                if meal.meal_visibility:  # Still check meal visibility
-                    meal_dict = meal.dict(by_alias=True)
-                    meal_dict["chef"] = {
-                        "id": str(chef.id),
-                        "name": chef.name,
-                        "experience": chef.experience,
-                        "degree": chef.degree
-                    }
-                    all_meals.append(meal_dict)
-    
-    return all_meals
+    catalog = await meal_service.get_catalog()
+
+    return [
+        dict(meal, chef={
+            "id": chef["id"],
+            "name": chef["name"],
+            "experience": chef["experience"],
+            "degree": chef["degree"]
+        })
+        for chef in catalog
+        for meal in chef["meals"]
+    ]
+
+
+@router.get("/search", response_model=MealSearchResult)
+async def search_meals(
+    q: Optional[str] = Query(None, min_length=2, max_length=100, description="Words to match in name, description, ingredients or dietary info"),
+    dietary: Optional[List[str]] = Query(None, description="Dietary tags the meal must all have"),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    chef_id: Optional[str] = Query(None),
+    sort: str = Query("relevance", description="relevance, price_asc, price_desc or newest"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    include_facets: bool = Query(False, description="Include tag, chef and price-range counts"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Search and filter meals from available chefs, one page at a time"""
+    if sort != "relevance" and sort not in MEAL_SEARCH_SORTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid sort. Allowed values: relevance, {', '.join(MEAL_SEARCH_SORTS)}"
+        )
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_price cannot be greater than max_price"
+        )
+
+    meal_service = MealService(db)
+    result = await meal_service.search_meals(
+        query=q,
+        dietary_tags=dietary,
+        min_price=min_price,
+        max_price=max_price,
+        chef_id=chef_id,
+        sort=sort,
+        page=page,
+        page_size=page_size
+    )
+    if include_facets:
+        result["facets"] = await meal_service.get_search_facets()
+    return result
 
 
 @router.post("", response_model=MealResponse, status_code=status.HTTP_201_CREATED)
@@ -180,36 +209,8 @@ async def get_chefs_with_meals(
             detail="Only subscribers and chefs can access this endpoint"
         )
     
-    from app.services.user import UserService
-    
     meal_service = MealService(db)
-    user_service = UserService(db)
-    
-    chefs = await user_service.get_users_by_role(UserRole.CHEF)
-    chefs_with_meals = []
-    
-    for chef in chefs:
-        # Check if chef is approved AND available
-        if chef.approval_status == "approved" and chef.available:
-            meals = await meal_service.get_meals_by_chef(str(chef.id))
-            formatted_meals = []
-            for meal in meals:
-                if meal.meal_visibility:
-                    meal_dict = meal.dict(by_alias=True)
-                    formatted_meals.append(meal_dict)
-            
-            chef_data = {
-                "id": str(chef.id),
-                "name": chef.name,
-                "experience": chef.experience,
-                "degree": chef.degree,
-                "available": chef.available,
-                "meals": formatted_meals
-            }
-            
-            chefs_with_meals.append(chef_data)
-    
-    return chefs_with_meals
+    return await meal_service.get_catalog()
 
 @router.patch("/{meal_id}/visibility", response_model=MealResponse)
 async def update_meal_visibility(
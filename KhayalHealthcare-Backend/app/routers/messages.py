@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+import asyncio
+import logging
+from typing import List, Optional
+from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import User
-from app.schemas.message import MessageCreate, MessageResponse
+from app.schemas.message import (
+    MessageCreate, MessageResponse, ConversationSummary, ConversationPage,
+    MarkReadRequest, ConversationReadResult
+)
 from app.services.message import MessageService
 from app.config.database import get_database
-from app.utils.dependencies import get_current_user
+from app.utils.dependencies import get_current_user, get_user_from_token
+from app.utils.realtime import event_hub
 
 router = APIRouter(
     prefix="/messages",
@@ -13,6 +21,117 @@ router = APIRouter(
     responses={401: {"description": "Unauthorized"}},
 )
 
+logger = logging.getLogger(__name__)
+
+@router.websocket("/ws")
+async def messages_websocket(
+    websocket: WebSocket,
+    token: str = Query(...),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Push new messages for the authenticated user as they are created"""
+    user = await get_user_from_token(token, db)
+    if not user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = event_hub.subscribe(str(user.id))
+    # Incoming frames are only read to notice when the client goes away
+    receiver = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        while True:
+            getter = asyncio.create_task(subscription.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                getter.cancel()
+                break
+
+            if subscription.overflowed:
+                # Too far behind; the client reloads conversations on reconnect
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                break
+            await websocket.send_json(jsonable_encoder(getter.result()))
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Message websocket error for user {user.id}: {str(e)}")
+    finally:
+        event_hub.unsubscribe(subscription)
+        receiver.cancel()
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        return
+
+@router.get("/conversations", response_model=List[ConversationSummary])
+async def get_conversations(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """List the current user's conversations with last message and unread count"""
+    message_service = MessageService(db)
+    return await message_service.get_conversations(str(current_user.id), skip=skip, limit=limit)
+
+@router.get("/unread-count", response_model=dict)
+async def get_unread_count(
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Get the current user's total unread message count"""
+    message_service = MessageService(db)
+    return {"unread_count": await message_service.get_unread_count(str(current_user.id))}
+
+@router.post("/read", response_model=List[ConversationReadResult])
+async def mark_messages_read(
+    read_data: MarkReadRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Mark messages read up to a timestamp in each given conversation"""
+    message_service = MessageService(db)
+    try:
+        return await message_service.mark_read(
+            str(current_user.id),
+            [(mark.conversation_id, mark.up_to) for mark in read_data.conversations]
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+
+@router.get("/conversations/{other_user_id}", response_model=ConversationPage)
+async def get_conversation_messages(
+    other_user_id: str,
+    before: Optional[str] = Query(None, description="Cursor from a previous page's next_cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Page backwards through the conversation with another user"""
+    if not ObjectId.is_valid(other_user_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid user ID"
+        )
+    
+    message_service = MessageService(db)
+    try:
+        return await message_service.get_conversation_page(
+            str(current_user.id), other_user_id, before=before, limit=limit
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
 @router.get("/{user_id}", response_model=List[MessageResponse])
 async def get_messages_for_user(
     user_id: str,
@@ -1,14 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from typing import List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
 from app.models.user import User, UserRole
 from app.schemas.order import OrderCreate, OrderResponse, OrderStatusUpdate
-from app.services.order import OrderService
-from app.services.user import UserService
-from app.services.meal import MealService
+from app.services.order import OrderService, OrderValidationError, split_order_snapshot
 from app.config.database import get_database
 from app.utils.dependencies import get_current_user
+from app.utils.idempotency import (
+    IdempotencyStore, IdempotencyKeyConflict, IdempotencyKeyMismatch,
+    request_fingerprint, IDEMPOTENCY_KEY_MAX_LENGTH, COMPLETED
+)
+from pymongo.errors import DuplicateKeyError
 import logging
 
 router = APIRouter(
@@ -19,6 +22,23 @@ router = APIRouter(
 
 logger = logging.getLogger(__name__)
 
+ORDER_IDEMPOTENCY_SCOPE = "orders.create"
+
+def _created_order_response(order) -> dict:
+    """Complete order details from the snapshot taken at creation"""
+    order_dict, snapshot = split_order_snapshot(order)
+    chef = snapshot.get("chef")
+    return {
+        "order": order_dict,
+        "meal": snapshot.get("meal"),
+        "chef": {
+            "id": chef.get("id"),
+            "name": chef.get("name"),
+            "experience": chef.get("experience"),
+            "degree": chef.get("degree")
+        } if chef else None
+    }
+
 @router.get("/chef/my-orders", response_model=List[dict])
 async def get_orders_by_chef(
     current_user: User = Depends(get_current_user),
@@ -37,52 +57,23 @@ async def get_orders_by_chef(
         chef_id = str(current_user.id)
         
         order_service = OrderService(db)
-        user_service = UserService(db)
-        meal_service = MealService(db)
 
         # Get orders for the chef
         orders = await order_service.get_orders_by_chef(chef_id)
-        
-        # Get all subscribers
-        subscribers = await user_service.get_users_by_role(UserRole.SUBSCRIBER)
 
-        # Add subscriber and meal details to each order
+        # Subscriber and meal details come from each order's snapshot
         orders_with_details = []
         for order in orders:
-            order_dict = order.dict(by_alias=True)
-            
-            # Convert subscriber_id to string for comparison
-            subscriber_id_str = str(order.subscriber_id)
-            
-            # Find matching subscriber
-            subscriber = None
-            for s in subscribers:
-                if str(s.id) == subscriber_id_str:
-                    subscriber = s
-                    break
-            
-            if subscriber:
-                order_dict["subscriber"] = {
-                    "name": subscriber.name,
-                    "phone": subscriber.phone,
-                    "address": subscriber.address,
-                    "city": subscriber.city,
-                    "previous_illness": subscriber.previous_illness
-                }
-            else:
-                order_dict["subscriber"] = None
-            
-            # Get meal details
-            try:
-                meal = await meal_service.get_meal_by_id(str(order.meal_id))
-                if meal:
-                    order_dict["meal"] = meal.dict(by_alias=True)
-                else:
-                    order_dict["meal"] = None
-            except Exception as e:
-                logger.warning(f"Failed to get meal details for meal_id {order.meal_id}: {str(e)}")
-                order_dict["meal"] = None
-
+            order_dict, snapshot = split_order_snapshot(order)
+            subscriber = snapshot.get("subscriber")
+            order_dict["subscriber"] = {
+                "name": subscriber.get("name"),
+                "phone": subscriber.get("phone"),
+                "address": subscriber.get("address"),
+                "city": subscriber.get("city"),
+                "previous_illness": subscriber.get("previous_illness")
+            } if subscriber else None
+            order_dict["meal"] = snapshot.get("meal")
             orders_with_details.append(order_dict)
 
         return orders_with_details
@@ -114,50 +105,24 @@ async def get_my_orders(
         subscriber_id = str(current_user.id)
         
         order_service = OrderService(db)
-        meal_service = MealService(db)
-        user_service = UserService(db)
-        
+
         # Get orders for the subscriber
         orders = await order_service.get_orders_by_subscriber(subscriber_id)
-        
-        # Get all chefs
-        chefs = await user_service.get_users_by_role(UserRole.CHEF)
-        
-        # Add chef and meal details to each order
+
+        # Chef and meal details come from each order's snapshot
         orders_with_details = []
         for order in orders:
-            order_dict = order.dict(by_alias=True)
-            
-            # Find matching chef
-            chef = None
-            for c in chefs:
-                if str(c.id) == str(order.chef_id):
-                    chef = c
-                    break
-            
-            if chef:
-                order_dict["chef"] = {
-                    "id": str(chef.id),
-                    "name": chef.name,
-                    "experience": chef.experience,
-                    "degree": chef.degree
-                }
-            else:
-                order_dict["chef"] = None
-            
-            # Get meal details
-            try:
-                meal = await meal_service.get_meal_by_id(str(order.meal_id))
-                if meal:
-                    order_dict["meal"] = meal.dict(by_alias=True)
-                else:
-                    order_dict["meal"] = None
-            except Exception as e:
-                logger.warning(f"Failed to get meal details for meal_id {order.meal_id}: {str(e)}")
-                order_dict["meal"] = None
-            
+            order_dict, snapshot = split_order_snapshot(order)
+            chef = snapshot.get("chef")
+            order_dict["chef"] = {
+                "id": chef.get("id"),
+                "name": chef.get("name"),
+                "experience": chef.get("experience"),
+                "degree": chef.get("degree")
+            } if chef else None
+            order_dict["meal"] = snapshot.get("meal")
             orders_with_details.append(order_dict)
-        
+
         return orders_with_details
         
     except HTTPException:
@@ -173,13 +138,52 @@ async def get_my_orders(
 @router.post("", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def create_order(
     order_data: OrderCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(
+        None, alias="Idempotency-Key", description="Retries with the same key return the original order"
+    ),
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Create new order - notifications will be sent automatically"""
+    """Create new order - notifications will be sent automatically.
+
+    The total is computed on the server from the meal price, quantity and
+    optional coupon_code. With an Idempotency-Key header, a retried request
+    returns the first request's result instead of placing another order.
+    """
     order_service = OrderService(db)
-    meal_service = MealService(db)
-    user_service = UserService(db)
+    idempotency_store = IdempotencyStore(db)
+    user_id = str(current_user.id)
+    order_id = None
+
+    if idempotency_key is not None:
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters"
+            )
+        try:
+            previous = await idempotency_store.begin(
+                ORDER_IDEMPOTENCY_SCOPE, user_id, idempotency_key, request_fingerprint(order_data.dict())
+            )
+        except IdempotencyKeyMismatch as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except IdempotencyKeyConflict as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        if previous and previous["status"] == COMPLETED:
+            response.status_code = previous["status_code"]
+            response.headers["Idempotent-Replayed"] = "true"
+            return previous["response"]
+        if previous and previous.get("resource_id"):
+            # Taken over from an attempt whose lease lapsed: it may already have
+            # created the order, and retrying reuses its id so it cannot create two
+            order_id = ObjectId(previous["resource_id"])
+            existing = await order_service.get_order_by_id(previous["resource_id"])
+            if existing:
+                result = _created_order_response(existing)
+                await _complete_idempotent_order(idempotency_store, user_id, idempotency_key, result)
+                response.headers["Idempotent-Replayed"] = "true"
+                return result
 
     try:
         # Validate ObjectIds
@@ -192,33 +196,51 @@ async def create_order(
                     detail=f"Invalid {field} format: {value}"
                 )
         
-        # Create order - notifications will be sent automatically in the service
-        order = await order_service.create_order(order_data)
+        if idempotency_key:
+            order_id = order_id or ObjectId()
+            await idempotency_store.set_resource(ORDER_IDEMPOTENCY_SCOPE, user_id, idempotency_key, str(order_id))
 
-        # Get related data for response
-        meal = await meal_service.get_meal_by_id(str(order.meal_id))
-        chef = await user_service.get_user_by_id(str(order.chef_id))
+        # Create order - notifications will be sent automatically in the service
+        try:
+            order = await order_service.create_order(order_data, order_id=order_id)
+        except DuplicateKeyError:
+            # The attempt this one took over inserted the order in the meantime
+            order = await order_service.get_order_by_id(str(order_id)) if order_id else None
+            if not order:
+                raise
+            response.headers["Idempotent-Replayed"] = "true"
 
-        # Return complete order details
-        return {
-            "order": order.dict(by_alias=True),
-            "meal": meal.dict(by_alias=True) if meal else None,
-            "chef": {
-                "id": str(chef.id),
-                "name": chef.name,
-                "experience": chef.experience,
-                "degree": chef.degree
-            } if chef else None
-        }
-    except HTTPException:
-        raise
+        result = _created_order_response(order)
     except Exception as e:
+        if idempotency_key:
+            # Nothing was created, so let the client retry with the same key
+            await idempotency_store.release(ORDER_IDEMPOTENCY_SCOPE, user_id, idempotency_key)
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, OrderValidationError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
         logger.error(f"Failed to create order: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create order: {str(e)}"
         )
 
+    if idempotency_key:
+        await _complete_idempotent_order(idempotency_store, user_id, idempotency_key, result)
+    return result
+
+async def _complete_idempotent_order(idempotency_store: IdempotencyStore, user_id: str, key: str, result: dict):
+    try:
+        await idempotency_store.complete(
+            ORDER_IDEMPOTENCY_SCOPE, user_id, key, result, status.HTTP_201_CREATED
+        )
+    except Exception as e:
+        # The order exists; a retry after the claim's lease lapses finds it by resource_id
+        logger.error(f"Failed to store idempotent response for order: {str(e)}")
+
 @router.patch("/{order_id}/status", status_code=status.HTTP_200_OK)
 async def update_order_status(
     order_id: str,
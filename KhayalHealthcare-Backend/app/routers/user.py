@@ -65,31 +65,9 @@ async def get_assigned_subscribers_for_caretaker(
     
     from app.services.visit_request import VisitRequestService
     from app.models.user import CareVisitRequestStatus
-    
-    user_service = UserService(db)
+
     visit_request_service = VisitRequestService(db)
-    
-    # Get all care visit requests for this caretaker with in_progress status
-    all_requests = await visit_request_service.get_care_visit_requests_by_caretaker(str(current_user.id))
-    
-    # Filter only in_progress requests
-    in_progress_requests = [
-        req for req in all_requests 
-        if req.status == CareVisitRequestStatus.IN_PROGRESS
-    ]
-    
-    # Get unique subscriber IDs
-    subscriber_ids = list(set([str(req.subscriber_id) for req in in_progress_requests]))
-    
-    # Get subscriber details
-    subscribers = []
-    for sub_id in subscriber_ids:
-        subscriber = await user_service.get_user_by_id(sub_id)
-        if subscriber:
-            subscribers.append({
-                "id": str(subscriber.id),
-                "name": subscriber.name
-            })
-    
-    return subscribers
+    return await visit_request_service.get_caretaker_subscribers(
+        str(current_user.id), [CareVisitRequestStatus.IN_PROGRESS]
+    )
 
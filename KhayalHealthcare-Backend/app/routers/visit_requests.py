@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional
+from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import User, UserRole, ApprovalStatus
 from app.schemas.visit_request import (
@@ -7,6 +8,7 @@ from app.schemas.visit_request import (
     PsychologistVisitRequestCreate, PsychologistVisitRequestResponse, PsychologistVisitRequestAssign
 )
 from app.services.visit_request import VisitRequestService
+from app.services.visit_workflow import VisitRequestNotFound, VisitRequestNotAssigned, InvalidStatusTransition, ScheduleConflict
 from app.services.user import UserService
 from app.config.database import get_database
 from app.utils.dependencies import get_current_user, get_admin_user
@@ -108,6 +110,16 @@ async def assign_caretaker_to_request(
             assignment.appointment_date_time  # Add this parameter
         )
         return {"message": "Caretaker assigned successfully"}
+    except VisitRequestNotFound as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except (InvalidStatusTransition, ScheduleConflict) as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -204,6 +216,16 @@ async def assign_psychologist_to_request(
             assignment.appointment_date_time
         )
         return {"message": "Psychologist assigned successfully"}
+    except VisitRequestNotFound as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except (InvalidStatusTransition, ScheduleConflict) as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -259,57 +281,107 @@ async def get_available_psychologists(
     
     return available_psychologists
 
+@router.post("/care/match", response_model=dict)
+async def match_care_requests(
+    limit: int = Query(200, ge=1, le=1000, description="Pending requests to consider"),
+    apply: bool = Query(False, description="Assign the proposals instead of only returning them"),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Propose caretakers for pending care visit requests (admin only)"""
+    visit_request_service = VisitRequestService(db)
+    return await visit_request_service.match_care_requests(limit, apply)
+
+@router.post("/psychologist/match", response_model=dict)
+async def match_psychologist_requests(
+    limit: int = Query(200, ge=1, le=1000, description="Pending requests to consider"),
+    apply: bool = Query(False, description="Assign the proposals instead of only returning them"),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Propose psychologists for pending psychology visit requests (admin only)"""
+    visit_request_service = VisitRequestService(db)
+    return await visit_request_service.match_psychologist_requests(limit, apply)
+
+def _check_window(start: datetime, end: Optional[datetime]):
+    if end and end <= start:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="end must be after start"
+        )
+
+@router.get("/caretakers/available", response_model=List[dict])
+async def get_free_caretakers(
+    start: datetime = Query(..., description="Start of the appointment window"),
+    end: Optional[datetime] = Query(None, description="End of the window; defaults to one appointment slot"),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Approved caretakers with no appointment in the time window (admin only)"""
+    _check_window(start, end)
+    visit_request_service = VisitRequestService(db)
+    caretakers = await visit_request_service.get_free_caretakers(start, end)
+
+    return [
+        {
+            "id": str(caretaker.id),
+            "name": caretaker.name,
+            "experience": caretaker.experience,
+            "email": caretaker.email,
+            "phone": caretaker.phone,
+            "city": caretaker.city,
+            "subscription_status": caretaker.subscription_status or "pending"
+        }
+        for caretaker in caretakers
+    ]
+
+@router.get("/psychologists/available", response_model=List[dict])
+async def get_free_psychologists(
+    start: datetime = Query(..., description="Start of the appointment window"),
+    end: Optional[datetime] = Query(None, description="End of the window; defaults to one appointment slot"),
+    admin_user: User = Depends(get_admin_user),
+    db: AsyncIOMotorDatabase = Depends(get_database)
+):
+    """Approved psychologists with no appointment in the time window (admin only)"""
+    _check_window(start, end)
+    visit_request_service = VisitRequestService(db)
+    psychologists = await visit_request_service.get_free_psychologists(start, end)
+
+    return [
+        {
+            "id": str(psychologist.id),
+            "name": psychologist.name,
+            "experience": psychologist.experience,
+            "degree": psychologist.degree,
+            "phone": psychologist.phone,
+            "email": psychologist.email,
+            "subscription_status": psychologist.subscription_status or "pending"
+        }
+        for psychologist in psychologists
+    ]
+
 @router.get("/care/caretaker/assignments", response_model=List[dict])
 async def get_caretaker_assignments(
+    status_filter: Optional[List[CareVisitRequestStatus]] = Query(None, alias="status", description="Only these statuses"),
+    start: Optional[datetime] = Query(None, description="Appointments at or after this time"),
+    end: Optional[datetime] = Query(None, description="Appointments before this time"),
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all assignments for the current caretaker with subscriber details"""
+    """Get assignments for the current caretaker with subscriber details"""
     # Verify user is a caretaker
     if current_user.role != UserRole.CARETAKER:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access restricted to caretakers only"
         )
-    
+    if start and end:
+        _check_window(start, end)
+
     visit_request_service = VisitRequestService(db)
-    user_service = UserService(db)
-    
-    # Get assignments for this caretaker
-    assignments = await visit_request_service.get_care_visit_requests_by_caretaker(str(current_user.id))
-    
-    # Get subscriber details
-    subscriber_ids = list(set([req.subscriber_id for req in assignments]))
-    subscribers = []
-    for sub_id in subscriber_ids:
-        subscriber = await user_service.get_user_by_id(str(sub_id))
-        if subscriber:
-            subscribers.append(subscriber)
-    
-    # Build response with subscriber details
-    assignments_with_details = []
-    for assignment in assignments:
-        assignment_dict = assignment.dict(by_alias=True)
-        
-        # Find subscriber details
-        subscriber = next((s for s in subscribers if str(s.id) == str(assignment.subscriber_id)), None)
-        if subscriber:
-            assignment_dict["subscriber"] = {
-                "id": str(subscriber.id),
-                "name": subscriber.name,
-                "phone": subscriber.phone,
-                "email": subscriber.email,
-                "address": subscriber.address,
-                "city": subscriber.city,
-                "age": subscriber.age,
-                "previous_illness": subscriber.previous_illness
-            }
-        else:
-            assignment_dict["subscriber"] = None
-            
-        assignments_with_details.append(assignment_dict)
-    
-    return assignments_with_details
+    return await visit_request_service.get_caretaker_assignments(
+        str(current_user.id), status_filter, start, end
+    )
 
 
 @router.patch("/care/{request_id}/caretaker-status", status_code=status.HTTP_200_OK)
@@ -338,89 +410,63 @@ async def update_care_request_status_by_caretaker(
         )
     
     visit_request_service = VisitRequestService(db)
-    
-    # Verify the request is assigned to this caretaker
-    request = await visit_request_service.get_care_visit_request_by_id(request_id)
-    if not request:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Care visit request not found"
-        )
-    
-    if str(request.caretaker_id) != str(current_user.id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only update requests assigned to you"
-        )
-    
-    # Update status
+
+    # One conditional update checks the assignment and the transition
     try:
         status_enum = CareVisitRequestStatus(new_status)
-        await visit_request_service.update_care_visit_status(request_id, status_enum)
-        
+        await visit_request_service.update_care_visit_status(
+            request_id, status_enum, caretaker_id=str(current_user.id)
+        )
+
         return {
             "message": f"Care visit request status updated to {new_status}",
             "request_id": request_id,
             "new_status": new_status
         }
+    except VisitRequestNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Care visit request not found"
+        )
+    except VisitRequestNotAssigned as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except InvalidStatusTransition as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update status: {str(e)}"
         )
-    
+
 
 @router.get("/psychologist/psychologist/assignments", response_model=List[dict])
 async def get_psychologist_assignments(
+    status_filter: Optional[List[CareVisitRequestStatus]] = Query(None, alias="status", description="Only these statuses"),
+    start: Optional[datetime] = Query(None, description="Appointments at or after this time"),
+    end: Optional[datetime] = Query(None, description="Appointments before this time"),
     current_user: User = Depends(get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_database)
 ):
-    """Get all assignments for the current psychologist with subscriber details"""
+    """Get assignments for the current psychologist with subscriber details"""
     # Verify user is a psychologist
     if current_user.role != UserRole.PSYCHOLOGIST:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access restricted to psychologists only"
         )
-    
+    if start and end:
+        _check_window(start, end)
+
     visit_request_service = VisitRequestService(db)
-    user_service = UserService(db)
-    
-    # Get assignments for this psychologist
-    assignments = await visit_request_service.get_psychologist_visit_requests_by_psychologist(str(current_user.id))
-    
-    # Get subscriber details
-    subscriber_ids = list(set([req.subscriber_id for req in assignments]))
-    subscribers = []
-    for sub_id in subscriber_ids:
-        subscriber = await user_service.get_user_by_id(str(sub_id))
-        if subscriber:
-            subscribers.append(subscriber)
-    
-    # Build response with subscriber details
-    assignments_with_details = []
-    for assignment in assignments:
-        assignment_dict = assignment.dict(by_alias=True)
-        
-        # Find subscriber details
-        subscriber = next((s for s in subscribers if str(s.id) == str(assignment.subscriber_id)), None)
-        if subscriber:
-            assignment_dict["subscriber"] = {
-                "id": str(subscriber.id),
-                "name": subscriber.name,
-                "phone": subscriber.phone,
-                "email": subscriber.email,
-                "address": subscriber.address,
-                "city": subscriber.city,
-                "age": subscriber.age,
-                "previous_illness": subscriber.previous_illness
-            }
-        else:
-            assignment_dict["subscriber"] = None
-            
-        assignments_with_details.append(assignment_dict)
-    
-    return assignments_with_details
+    return await visit_request_service.get_psychologist_assignments(
+        str(current_user.id), status_filter, start, end
+    )
 
 @router.patch("/psychologist/{request_id}/psychologist-status", status_code=status.HTTP_200_OK)
 async def update_psychologist_request_status_by_psychologist(
@@ -448,33 +494,36 @@ async def update_psychologist_request_status_by_psychologist(
         )
     
     visit_request_service = VisitRequestService(db)
-    
-    # Verify the request is assigned to this psychologist
-    request = await visit_request_service.get_psychologist_visit_request_by_id(request_id)
-    if not request:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Psychologist visit request not found"
-        )
-    
-    if str(request.psychologist_id) != str(current_user.id):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only update requests assigned to you"
-        )
+
+    # One conditional update checks the assignment and the transition
     try:
         status_enum = CareVisitRequestStatus(new_status)
-        await visit_request_service.update_psychologist_visit_status(request_id, status_enum)
-        
+        await visit_request_service.update_psychologist_visit_status(
+            request_id, status_enum, psychologist_id=str(current_user.id)
+        )
+
         return {
             "message": f"Psychologist visit request status updated to {new_status}",
             "request_id": request_id,
             "new_status": new_status
         }
+    except VisitRequestNotFound:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Psychologist visit request not found"
+        )
+    except VisitRequestNotAssigned as e:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=str(e)
+        )
+    except InvalidStatusTransition as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update status: {str(e)}"
         )
-
-
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict, validator
-from typing import Optional, List, Dict
+from typing import Optional, List
 from datetime import datetime
 from app.models.coupon import CouponType, CouponStatus
 
@@ -74,7 +74,6 @@ class CouponResponse(BaseModel):
     created_by: str
     created_at: datetime
     updated_at: datetime
-    user_usage_count: Dict[str, int]
     
     model_config = ConfigDict(populate_by_name=True)
 
@@ -107,6 +106,6 @@ class BulkCouponCreate(BaseModel):
     
     @validator('quantity')
     def validate_quantity(cls, v):
-        if v < 1 or v > 1000:
-            raise ValueError('Quantity must be between 1 and 1000')
+        if v < 1 or v > 10000:
+            raise ValueError('Quantity must be between 1 and 10000')
         return v
@@ -18,7 +18,39 @@ class MealResponse(BaseModel):
     price: float
     ingredients: List[str]
     dietary_info: Optional[str] = None
+    dietary_tags: List[str] = []
     meal_visibility: bool
     created_at: datetime
 
     model_config = ConfigDict(populate_by_name=True)
+
+class MealSearchChef(BaseModel):
+    id: str
+    name: str
+    experience: Optional[int] = None
+    degree: Optional[str] = None
+
+class MealSearchItem(MealResponse):
+    chef: MealSearchChef
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class PriceBucket(BaseModel):
+    min_price: float
+    max_price: Optional[float] = None
+    count: int
+
+class MealSearchFacets(BaseModel):
+    dietary_tags: List[FacetCount]
+    chefs: List[FacetCount]
+    price_ranges: List[PriceBucket]
+    total_meals: int
+
+class MealSearchResult(BaseModel):
+    items: List[MealSearchItem]
+    total: int
+    page: int
+    page_size: int
+    facets: Optional[MealSearchFacets] = None
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
+from typing import List, Optional
 from datetime import datetime
 
 class MessageCreate(BaseModel):
@@ -10,8 +11,43 @@ class MessageResponse(BaseModel):
     id: str = Field(alias="_id")
     from_id: str
     to_id: str
+    conversation_id: Optional[str] = None
     content: str
     timestamp: datetime
     read: bool
 
-    model_config = ConfigDict(populate_by_name=True)
\ No newline at end of file
+    model_config = ConfigDict(populate_by_name=True)
+
+class LastMessage(BaseModel):
+    id: str = Field(alias="_id")
+    from_id: str
+    to_id: str
+    content: str
+    timestamp: datetime
+
+    model_config = ConfigDict(populate_by_name=True)
+
+class ConversationSummary(BaseModel):
+    conversation_id: str
+    participant_id: str
+    last_message: LastMessage
+    last_message_at: datetime
+    unread_count: int = 0
+
+class ConversationPage(BaseModel):
+    conversation_id: str
+    messages: List[MessageResponse]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+class ConversationReadMark(BaseModel):
+    conversation_id: str
+    up_to: datetime  # Messages at or before this timestamp are marked read
+
+class MarkReadRequest(BaseModel):
+    conversations: List[ConversationReadMark] = Field(..., min_length=1, max_length=100)
+
+class ConversationReadResult(BaseModel):
+    conversation_id: str
+    marked_read: int
+    unread_count: int
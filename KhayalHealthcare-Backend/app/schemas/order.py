@@ -8,8 +8,10 @@ class OrderCreate(BaseModel):
     chef_id: str
     meal_id: str
     quantity: int = 1
-    total_price: float
+    # Ignored: the total is computed on the server from the meal price and coupon
+    total_price: Optional[float] = None
     delivery_address: str
+    coupon_code: Optional[str] = None
 
 class OrderResponse(BaseModel):
     id: str = Field(alias="_id")
@@ -17,6 +19,9 @@ class OrderResponse(BaseModel):
     chef_id: str
     meal_id: str
     quantity: int
+    subtotal: Optional[float] = None
+    discount: float = 0
+    coupon_code: Optional[str] = None
     total_price: float
     delivery_address: str
     status: OrderStatus
@@ -1,6 +1,6 @@
 from datetime import timedelta
 from fastapi import HTTPException, status
-from app.utils.auth import verify_password, get_password_hash, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.utils.auth import verify_and_update_password_async, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
 from app.services.user import UserService
 from app.schemas.user import UserLogin, Token
 import logging
@@ -22,9 +22,18 @@ class AuthService:
                 return False
             
             # Verify password
-            if not verify_password(password, user.password):
+            valid, new_hash = await verify_and_update_password_async(password, user.password)
+            if not valid:
                 logger.info(f"Authentication failed - incorrect password for user: {username}")
                 return False
+
+            # Upgrade plain text or outdated-cost hashes while we have the password
+            if new_hash:
+                if await self.user_service.update_user_password(str(user.id), new_hash):
+                    user.password = new_hash
+                    logger.info(f"Upgraded password hash for user: {username}")
+                else:
+                    logger.warning(f"Could not upgrade password hash for user: {username}")
             
             logger.info(f"Authentication successful for user: {username}")
             return user
@@ -1,39 +1,93 @@
-from typing import List, Optional, Tuple
+from typing import Awaitable, Callable, List, Optional, Tuple
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure, DuplicateKeyError, BulkWriteError
 from app.models.coupon import Coupon, CouponUsage, CouponType, CouponStatus
 from app.schemas.coupon import CouponCreate, CouponUpdate, BulkCouponCreate
+from app.utils.cache import TTLCache, MISSING
 from datetime import datetime, timedelta
-import random
+from decouple import config
+import asyncio
+import secrets
 import string
+import logging
+
+logger = logging.getLogger(__name__)
+
+# MongoDB error code returned when transactions are used against a standalone server
+ILLEGAL_OPERATION_CODE = 20
+DUPLICATE_KEY_CODE = 11000
+
+CODE_ALPHABET = string.ascii_uppercase + string.digits
+
+# Keep un-migrated per-user usage maps out of coupon reads
+LEGACY_USAGE_PROJECTION = {"user_usage_count": 0}
+
+# Coupon definitions used by validation; live counters are always read from the database
+DEFINITION_PROJECTION = {
+    "code": 1, "type": 1, "status": 1,
+    "discount_percentage": 1, "discount_amount": 1,
+    "usage_limit": 1, "per_user_limit": 1,
+    "valid_from": 1, "valid_until": 1
+}
+
+COUPON_CACHE_TTL_SECONDS = config('COUPON_CACHE_TTL_SECONDS', default=30, cast=int)
+COUPON_NEGATIVE_CACHE_TTL_SECONDS = config('COUPON_NEGATIVE_CACHE_TTL_SECONDS', default=10, cast=int)
+
+# Shared by every CouponService instance in this process, keyed by upper-cased code
+coupon_definition_cache = TTLCache(ttl_seconds=COUPON_CACHE_TTL_SECONDS, max_entries=5000)
+
+class BulkCouponGenerationError(RuntimeError):
+    """Bulk generation failed part way; `created` coupons were already stored"""
+
+    def __init__(self, message: str, created: int):
+        super().__init__(message)
+        self.created = created
+
+class _PerUserLimitReached(Exception):
+    """The user's counter is already at the coupon's per-user limit (aborts the transaction)"""
 
 class CouponService:
+    # Flipped off the first time the server rejects a transaction (standalone mongod)
+    transactions_supported = True
+    # Off when the unique per-user counter index is missing, since per-user limits
+    # could not be enforced without it
+    redemption_enabled = True
+    
+    # Bulk generation settings
+    BULK_CODE_LENGTH = 8
+    BULK_INSERT_CHUNK_SIZE = 500
+    BULK_MAX_ATTEMPTS = 10
+    BULK_PROGRESS_LOG_THRESHOLD = 2000
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         self.collection = db.coupons
         self.usage_collection = db.coupon_usage
+        # Per-user redemption counters {coupon_id, user_id, count}, unique on (coupon_id, user_id)
+        self.user_usage_collection = db.coupon_user_usage
     
     async def create_coupon(self, coupon_data: CouponCreate, admin_id: str) -> Coupon:
         """Create a new coupon"""
-        # Check if coupon code already exists
-        existing = await self.collection.find_one({"code": coupon_data.code.upper()})
-        if existing:
-            raise ValueError(f"Coupon with code '{coupon_data.code}' already exists")
-        
         coupon_dict = coupon_data.dict()
         coupon_dict['code'] = coupon_dict['code'].upper()
         coupon_dict['created_by'] = ObjectId(admin_id)
         coupon_dict['created_at'] = datetime.utcnow()
         coupon_dict['updated_at'] = datetime.utcnow()
         coupon_dict['current_usage'] = 0
-        coupon_dict['user_usage_count'] = {}
         coupon_dict['status'] = CouponStatus.ACTIVE
         
         # Set default valid_from to 1 minute in the past if not provided
         if not coupon_dict.get('valid_from'):
             coupon_dict['valid_from'] = datetime.utcnow() - timedelta(minutes=1)
         
-        result = await self.collection.insert_one(coupon_dict)
+        # The unique index on code is the existence check
+        try:
+            result = await self.collection.insert_one(coupon_dict)
+        except DuplicateKeyError:
+            raise ValueError(f"Coupon with code '{coupon_data.code}' already exists")
+        coupon_definition_cache.invalidate(coupon_dict['code'])
         
         # Convert ObjectId to string for Pydantic model
         coupon_dict['_id'] = str(result.inserted_id)
@@ -41,60 +95,122 @@ class CouponService:
         
         return Coupon(**coupon_dict)
     
-    async def generate_bulk_coupons(self, bulk_data: BulkCouponCreate, admin_id: str) -> List[Coupon]:
-        """Generate multiple coupons with unique codes"""
-        coupons = []
+    async def generate_bulk_coupons(
+        self,
+        bulk_data: BulkCouponCreate,
+        admin_id: str
+    ) -> List[Coupon]:
+        """Generate multiple coupons with unique codes.
+
+        Codes are drawn locally from a CSPRNG and written with unordered
+        insert_many batches; the unique index on ``code`` is the collision check,
+        so only the codes that hit a duplicate are regenerated and retried.
+        Any other write error raises BulkCouponGenerationError with the number
+        of coupons already stored.
+        """
+        # Validate the shared discount settings once instead of per coupon
+        CouponCreate(
+            code=self._generate_unique_code(bulk_data.prefix),
+            type=bulk_data.type,
+            discount_percentage=bulk_data.discount_percentage,
+            discount_amount=bulk_data.discount_amount,
+            usage_limit=bulk_data.usage_limit,
+            per_user_limit=bulk_data.per_user_limit,
+            valid_from=bulk_data.valid_from,
+            valid_until=bulk_data.valid_until
+        )
         
-        for i in range(bulk_data.quantity):
-            # Generate unique code
-            unique_code = self._generate_unique_code(bulk_data.prefix)
-            
-            # Check if code exists
-            attempts = 0
-            while await self.collection.find_one({"code": unique_code}) and attempts < 10:
-                unique_code = self._generate_unique_code(bulk_data.prefix)
-                attempts += 1
+        now = datetime.utcnow()
+        template = {
+            "type": bulk_data.type,
+            "discount_percentage": bulk_data.discount_percentage,
+            "discount_amount": bulk_data.discount_amount,
+            "usage_limit": bulk_data.usage_limit,
+            "per_user_limit": bulk_data.per_user_limit,
+            "valid_from": bulk_data.valid_from or now - timedelta(minutes=1),
+            "valid_until": bulk_data.valid_until,
+            "created_by": ObjectId(admin_id),
+            "created_at": now,
+            "updated_at": now,
+            "current_usage": 0,
+            "status": CouponStatus.ACTIVE
+        }
+        
+        created_docs = []
+        pending = bulk_data.quantity
+        attempts = 0
+        
+        while pending > 0:
+            if attempts >= self.BULK_MAX_ATTEMPTS:
+                raise ValueError(f"Failed to generate unique codes. Generated {len(created_docs)} out of {bulk_data.quantity}")
+            attempts += 1
             
-            if attempts >= 10:
-                raise ValueError(f"Failed to generate unique codes. Generated {len(coupons)} out of {bulk_data.quantity}")
+            # Codes are unique within the batch; collisions with stored codes are left to the index
+            codes = set()
+            while len(codes) < pending:
+                codes.add(self._generate_unique_code(bulk_data.prefix))
+            candidates = [{**template, "code": code} for code in codes]
             
-            # Create coupon data
-            coupon_data = CouponCreate(
-                code=unique_code,
-                type=bulk_data.type,
-                discount_percentage=bulk_data.discount_percentage,
-                discount_amount=bulk_data.discount_amount,
-                usage_limit=bulk_data.usage_limit,
-                per_user_limit=bulk_data.per_user_limit,
-                valid_from=bulk_data.valid_from,
-                valid_until=bulk_data.valid_until
-            )
+            duplicates = 0
+            for start in range(0, len(candidates), self.BULK_INSERT_CHUNK_SIZE):
+                chunk = candidates[start:start + self.BULK_INSERT_CHUNK_SIZE]
+                failed_indexes = set()
+                other_error = None
+                try:
+                    await self.collection.insert_many(chunk, ordered=False)
+                except BulkWriteError as e:
+                    for write_error in e.details.get("writeErrors", []):
+                        failed_indexes.add(write_error["index"])
+                        if write_error.get("code") == DUPLICATE_KEY_CODE:
+                            duplicates += 1
+                        elif other_error is None:
+                            other_error = write_error
+                
+                for i, doc in enumerate(chunk):
+                    if i not in failed_indexes:
+                        coupon_definition_cache.invalidate(doc["code"])
+                        created_docs.append(doc)
+                
+                if other_error is not None:
+                    logger.error(
+                        f"Bulk coupon generation stopped after creating {len(created_docs)} of "
+                        f"{bulk_data.quantity} coupons: {other_error.get('errmsg')}"
+                    )
+                    raise BulkCouponGenerationError(
+                        f"Failed to create all coupons; {len(created_docs)} of {bulk_data.quantity} were created",
+                        len(created_docs)
+                    )
+                
+                if bulk_data.quantity >= self.BULK_PROGRESS_LOG_THRESHOLD:
+                    logger.info(f"Bulk coupon generation: {len(created_docs)}/{bulk_data.quantity} created")
             
-            # Create coupon
-            coupon = await self.create_coupon(coupon_data, admin_id)
-            coupons.append(coupon)
+            pending = duplicates
         
+        coupons = []
+        for coupon_doc in created_docs:
+            coupon_doc['_id'] = str(coupon_doc['_id'])
+            coupon_doc['created_by'] = str(coupon_doc['created_by'])
+            coupons.append(Coupon(**coupon_doc))
         return coupons
     
     def _generate_unique_code(self, prefix: str) -> str:
-        """Generate a unique coupon code"""
-        suffix = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        """Generate a random coupon code using a CSPRNG"""
+        suffix = ''.join(secrets.choice(CODE_ALPHABET) for _ in range(self.BULK_CODE_LENGTH))
         return f"{prefix.upper()}-{suffix}"
     
     async def get_coupon_by_code(self, code: str) -> Optional[Coupon]:
         """Get coupon by code"""
-        coupon_doc = await self.collection.find_one({"code": code.upper()})
+        coupon_doc = await self.collection.find_one({"code": code.upper()}, LEGACY_USAGE_PROJECTION)
         if coupon_doc:
             # Convert ObjectId fields to strings
             coupon_doc['_id'] = str(coupon_doc['_id'])
             coupon_doc['created_by'] = str(coupon_doc['created_by'])
-            # user_usage_count should already be in correct format
             return Coupon(**coupon_doc)
         return None
     
     async def get_all_coupons(self) -> List[Coupon]:
         """Get all coupons (admin only)"""
-        cursor = self.collection.find()
+        cursor = self.collection.find({}, LEGACY_USAGE_PROJECTION)
         coupons = []
         async for coupon_doc in cursor:
             # Convert ObjectId fields to strings
@@ -115,13 +231,16 @@ class CouponService:
             )
             
             if result.modified_count > 0:
-                return await self.get_coupon_by_id(coupon_id)
+                coupon = await self.get_coupon_by_id(coupon_id)
+                if coupon:
+                    coupon_definition_cache.invalidate(coupon.code)
+                return coupon
         return None
     
     async def get_coupon_by_id(self, coupon_id: str) -> Optional[Coupon]:
         """Get coupon by ID"""
         try:
-            coupon_doc = await self.collection.find_one({"_id": ObjectId(coupon_id)})
+            coupon_doc = await self.collection.find_one({"_id": ObjectId(coupon_id)}, LEGACY_USAGE_PROJECTION)
             if coupon_doc:
                 # Convert ObjectId fields to strings
                 coupon_doc['_id'] = str(coupon_doc['_id'])
@@ -134,48 +253,86 @@ class CouponService:
     async def delete_coupon(self, coupon_id: str) -> bool:
         """Delete coupon"""
         try:
-            result = await self.collection.delete_one({"_id": ObjectId(coupon_id)})
-            return result.deleted_count > 0
+            coupon_doc = await self.collection.find_one_and_delete(
+                {"_id": ObjectId(coupon_id)},
+                projection={"code": 1}
+            )
+            if not coupon_doc:
+                return False
+            coupon_definition_cache.invalidate(coupon_doc["code"])
+            await self.user_usage_collection.delete_many({"coupon_id": ObjectId(coupon_id)})
+            return True
         except:
             return False
     
+    async def get_coupon_definition(self, code: str) -> Optional[dict]:
+        """Get the cached definition (status, type, dates, limits) of a coupon by code.
+
+        Unknown codes are cached too, so repeated probing of invalid codes does
+        not reach the database. Usage counters are deliberately not cached.
+        """
+        code = code.upper()
+        definition = coupon_definition_cache.get(code)
+        if definition is MISSING:
+            return None
+        if definition is not None:
+            return definition
+        
+        definition = await self.collection.find_one({"code": code}, DEFINITION_PROJECTION)
+        if definition:
+            coupon_definition_cache.set(code, definition)
+        else:
+            coupon_definition_cache.set(code, MISSING, ttl_seconds=COUPON_NEGATIVE_CACHE_TTL_SECONDS)
+        return definition
+    
     async def validate_coupon(self, code: str, user_id: str, order_total: float) -> Tuple[bool, str, Optional[float], Optional[dict]]:
         """Validate if a coupon can be used by a user"""
-        coupon = await self.get_coupon_by_code(code)
+        coupon = await self.get_coupon_definition(code)
 
         if not coupon:
             return False, "Invalid coupon code", None, None
 
-        # Debug log to check times
         now = datetime.utcnow()
 
         # Check if coupon is active
-        if coupon.status != CouponStatus.ACTIVE:
+        if coupon["status"] != CouponStatus.ACTIVE:
             return False, "Coupon is not active", None, None
 
         # Check validity dates
-        if coupon.valid_from and now < coupon.valid_from:
+        if coupon.get("valid_from") and now < coupon["valid_from"]:
             return False, "Coupon is not yet valid", None, None
         
-        # Check total usage limit
-        if coupon.usage_limit is not None and coupon.current_usage >= coupon.usage_limit:
-            return False, "Coupon has reached its total usage limit", None, None
+        if coupon.get("valid_until") and now > coupon["valid_until"]:
+            return False, "Coupon has expired", None, None
+        
+        usage_limit = coupon.get("usage_limit")
+        per_user_limit = coupon.get("per_user_limit")
+        
+        # Live counters: total usage (only when limited) and this user's usage
+        if usage_limit is not None:
+            totals, user_usage = await asyncio.gather(
+                self.collection.find_one({"_id": coupon["_id"]}, {"current_usage": 1}),
+                self.get_user_usage_count(str(coupon["_id"]), user_id)
+            )
+            # Check total usage limit
+            if not totals or totals.get("current_usage", 0) >= usage_limit:
+                return False, "Coupon has reached its total usage limit", None, None
+        else:
+            user_usage = await self.get_user_usage_count(str(coupon["_id"]), user_id)
         
         # Check per-user usage limit
-        user_usage = coupon.user_usage_count.get(user_id, 0)
-        if coupon.per_user_limit is not None and user_usage >= coupon.per_user_limit:
-            return False, f"You have already used this coupon {user_usage} times (limit: {coupon.per_user_limit})", None, None
+        if per_user_limit is not None and user_usage >= per_user_limit:
+            return False, f"You have already used this coupon {user_usage} times (limit: {per_user_limit})", None, None
         
         # Calculate discount
-        if coupon.type == CouponType.PERCENTAGE:
-            discount = (order_total * coupon.discount_percentage) / 100
-        else:
-            discount = min(coupon.discount_amount, order_total)
+        discount = self._calculate_discount(
+            coupon["type"], coupon.get("discount_percentage"), coupon.get("discount_amount"), order_total
+        )
         
         # Calculate remaining uses for user
         remaining_uses = None
-        if coupon.per_user_limit is not None:
-            remaining_uses = coupon.per_user_limit - user_usage
+        if per_user_limit is not None:
+            remaining_uses = per_user_limit - user_usage
         
         usage_info = {
             "user_usage_count": user_usage,
@@ -184,41 +341,180 @@ class CouponService:
         
         return True, "Coupon is valid", discount, usage_info
     
-    async def apply_coupon(self, code: str, user_id: str, order_id: str, order_total: float) -> Tuple[bool, str, Optional[float]]:
-        """Apply a coupon to an order"""
-        # Validate coupon first
-        is_valid, message, discount, usage_info = await self.validate_coupon(code, user_id, order_total)
-        
-        if not is_valid:
-            return False, message, None
-        
-        coupon = await self.get_coupon_by_code(code)
+    async def apply_coupon(
+        self,
+        code: str,
+        user_id: str,
+        order_id: str,
+        order_total: float,
+        on_redeemed: Optional[Callable[[float, object], Awaitable[None]]] = None
+    ) -> Tuple[bool, str, Optional[float]]:
+        """Apply a coupon to an order.
+
+        Redemption is a single conditional find_one_and_update: the filter encodes
+        status, validity window, total limit and per-user limit, so concurrent
+        requests can never push a coupon past its limits. The usage record is
+        written in the same transaction when the server supports it; concurrent
+        redemptions that conflict inside transactions are retried.
+
+        `on_redeemed(discount, session)` lets the caller write the order in the
+        same transaction. Without transactions, the redemption is reversed if
+        the callback raises.
+        """
+        if not CouponService.redemption_enabled:
+            return False, "Coupon redemption is temporarily unavailable", None
         
-        # Update coupon usage
-        update_ops = {
-            "$inc": {
-                "current_usage": 1,
-                f"user_usage_count.{user_id}": 1
-            }
+        now = datetime.utcnow()
+        redeem_filter = {
+            "code": code.upper(),
+            "status": CouponStatus.ACTIVE,
+            "valid_from": {"$lte": now},
+            "$and": [
+                {"$or": [{"valid_until": None}, {"valid_until": {"$gte": now}}]},
+                {"$or": [
+                    {"usage_limit": None},
+                    {"$expr": {"$lt": ["$current_usage", "$usage_limit"]}}
+                ]}
+            ]
         }
-        
-        await self.collection.update_one(
-            {"_id": ObjectId(coupon.id)},
-            update_ops
-        )
-        
-        # Record usage
+        redeem_update = {"$inc": {"current_usage": 1}}
         usage_record = {
-            "coupon_id": ObjectId(coupon.id),
             "user_id": ObjectId(user_id),
             "order_id": ObjectId(order_id) if order_id else None,
-            "used_at": datetime.utcnow(),
-            "discount_applied": discount
+            "used_at": now
         }
         
-        await self.usage_collection.insert_one(usage_record)
+        coupon_doc = None
+        if CouponService.transactions_supported:
+            try:
+                async with await self.db.client.start_session() as session:
+                    async def redeem(txn_session):
+                        return await self._redeem(
+                            redeem_filter, redeem_update, usage_record, order_total, txn_session, on_redeemed
+                        )
+                    # with_transaction retries the whole redemption on write conflicts
+                    # (TransientTransactionError) and retries an unknown commit result
+                    try:
+                        coupon_doc = await session.with_transaction(redeem)
+                    except _PerUserLimitReached:
+                        # The counter upsert collided: either the limit is reached or a
+                        # concurrent first redemption by this user created the counter.
+                        # One fresh transaction matches that counter; a second miss is the limit.
+                        coupon_doc = await session.with_transaction(redeem)
+            except _PerUserLimitReached:
+                # Per-user limit reached; the transaction has been rolled back
+                coupon_doc = None
+            except OperationFailure as e:
+                if e.code != ILLEGAL_OPERATION_CODE:
+                    raise
+                logger.warning("MongoDB transactions unavailable, recording coupon usage without a transaction")
+                CouponService.transactions_supported = False
+        
+        if not CouponService.transactions_supported:
+            coupon_doc = await self._redeem(redeem_filter, redeem_update, usage_record, order_total)
+            if coupon_doc and on_redeemed:
+                try:
+                    await on_redeemed(usage_record["discount_applied"], None)
+                except Exception:
+                    await self._reverse_redemption(usage_record)
+                    raise
+        
+        if not coupon_doc:
+            # Slow path only: work out why the conditional update did not match
+            is_valid, message, _, _ = await self.validate_coupon(code, user_id, order_total)
+            if is_valid:
+                message = "Coupon has reached its usage limit"
+            return False, message, None
+        
+        return True, "Coupon applied successfully", usage_record["discount_applied"]
+    
+    async def _redeem(self, redeem_filter: dict, redeem_update: dict, usage_record: dict,
+                      order_total: float, session=None, on_redeemed=None) -> Optional[dict]:
+        """Atomically consume one use of a coupon and record it.
+
+        Inside a transaction, `on_redeemed` runs as part of it.
+        """
+        coupon_doc = await self.collection.find_one_and_update(
+            redeem_filter,
+            redeem_update,
+            projection={"type": 1, "discount_percentage": 1, "discount_amount": 1, "per_user_limit": 1},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not coupon_doc:
+            return None
+        
+        # Conditional upsert on the per-user counter: when the user is already at
+        # the limit the filter misses and the upsert collides with the unique index
+        counter_filter = {"coupon_id": coupon_doc["_id"], "user_id": usage_record["user_id"]}
+        if coupon_doc.get("per_user_limit") is not None:
+            counter_filter["count"] = {"$lt": coupon_doc["per_user_limit"]}
+        for attempt in range(2):
+            try:
+                await self.user_usage_collection.update_one(
+                    counter_filter,
+                    {"$inc": {"count": 1}, "$set": {"last_used_at": usage_record["used_at"]}},
+                    upsert=True,
+                    session=session
+                )
+                break
+            except DuplicateKeyError:
+                if session:
+                    # The transaction is aborted; apply_coupon retries it once
+                    raise _PerUserLimitReached()
+                if attempt == 0:
+                    # A concurrent first redemption by this user may have created the
+                    # counter; the retry matches it, and only a second miss is the limit
+                    continue
+                # No transaction to roll back, so give back the total use taken above
+                await self.collection.update_one({"_id": coupon_doc["_id"]}, {"$inc": {"current_usage": -1}})
+                return None
         
-        return True, "Coupon applied successfully", discount
+        usage_record["coupon_id"] = coupon_doc["_id"]
+        usage_record["discount_applied"] = self._calculate_discount(
+            coupon_doc["type"],
+            coupon_doc.get("discount_percentage"),
+            coupon_doc.get("discount_amount"),
+            order_total
+        )
+        # Copy so a retried attempt does not reuse an _id assigned by insert_one
+        await self.usage_collection.insert_one(dict(usage_record), session=session)
+        if session and on_redeemed:
+            await on_redeemed(usage_record["discount_applied"], session)
+        return coupon_doc
+    
+    async def _reverse_redemption(self, usage_record: dict):
+        """Give back a use taken by _redeem when the order it was for was not written"""
+        try:
+            await self.collection.update_one(
+                {"_id": usage_record["coupon_id"]}, {"$inc": {"current_usage": -1}}
+            )
+            await self.user_usage_collection.update_one(
+                {"coupon_id": usage_record["coupon_id"], "user_id": usage_record["user_id"], "count": {"$gt": 0}},
+                {"$inc": {"count": -1}}
+            )
+            await self.usage_collection.delete_one({
+                "coupon_id": usage_record["coupon_id"],
+                "user_id": usage_record["user_id"],
+                "order_id": usage_record["order_id"]
+            })
+        except Exception as e:
+            logger.error(f"Could not reverse coupon redemption for order {usage_record['order_id']}: {str(e)}")
+    
+    async def get_user_usage_count(self, coupon_id: str, user_id: str) -> int:
+        """Get how many times a user has redeemed a coupon"""
+        counter = await self.user_usage_collection.find_one(
+            {"coupon_id": ObjectId(coupon_id), "user_id": ObjectId(user_id)},
+            {"count": 1}
+        )
+        return counter.get("count", 0) if counter else 0
+    
+    def _calculate_discount(self, coupon_type: CouponType, discount_percentage: Optional[float],
+                            discount_amount: Optional[float], order_total: float) -> float:
+        """Calculate the discount a coupon gives on an order total"""
+        if coupon_type == CouponType.PERCENTAGE:
+            return (order_total * discount_percentage) / 100
+        return min(discount_amount, order_total)
     
     async def get_user_coupon_usage(self, user_id: str) -> List[CouponUsage]:
         """Get coupon usage history for a user"""
@@ -234,35 +530,134 @@ class CouponService:
             usage_records.append(CouponUsage(**usage_doc))
         return usage_records
     
+    async def get_user_coupon_usage_with_details(self, user_id: str, skip: int = 0, limit: int = 50) -> List[dict]:
+        """Get a page of a user's coupon usage, newest first, joined to coupon details"""
+        pipeline = [
+            {"$match": {"user_id": ObjectId(user_id)}},
+            {"$sort": {"used_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$lookup": {
+                "from": self.collection.name,
+                "localField": "coupon_id",
+                "foreignField": "_id",
+                "pipeline": [
+                    {"$project": {
+                        "_id": 0,
+                        "code": 1,
+                        "type": 1,
+                        "discount_percentage": 1,
+                        "discount_amount": 1
+                    }}
+                ],
+                "as": "coupon"
+            }}
+        ]
+        
+        usage_records = []
+        async for usage_doc in self.usage_collection.aggregate(pipeline):
+            coupon = usage_doc.pop("coupon")
+            usage_doc['_id'] = str(usage_doc['_id'])
+            usage_doc['coupon_id'] = str(usage_doc['coupon_id'])
+            usage_doc['user_id'] = str(usage_doc['user_id'])
+            if usage_doc.get('order_id'):
+                usage_doc['order_id'] = str(usage_doc['order_id'])
+            usage_dict = CouponUsage(**usage_doc).dict(by_alias=True)
+            if coupon:
+                usage_dict["coupon"] = coupon[0]
+            usage_records.append(usage_dict)
+        return usage_records
+    
     async def get_coupon_statistics(self, coupon_id: str) -> dict:
         """Get detailed statistics for a coupon (admin only)"""
         coupon = await self.get_coupon_by_id(coupon_id)
         if not coupon:
             return None
         
-        # Get total discount given
+        # Totals and top users in a single pass over the usage records
         pipeline = [
             {"$match": {"coupon_id": ObjectId(coupon_id)}},
-            {"$group": {
-                "_id": None,
-                "total_discount": {"$sum": "$discount_applied"},
-                "total_uses": {"$sum": 1}
+            {"$facet": {
+                "totals": [
+                    {"$group": {
+                        "_id": None,
+                        "total_discount": {"$sum": "$discount_applied"},
+                        "total_uses": {"$sum": 1}
+                    }}
+                ],
+                "top_users": [
+                    {"$group": {
+                        "_id": "$user_id",
+                        "usage_count": {"$sum": 1},
+                        "total_discount": {"$sum": "$discount_applied"}
+                    }},
+                    {"$sort": {"usage_count": -1}},
+                    {"$limit": 10}
+                ]
             }}
         ]
         
         stats_cursor = self.usage_collection.aggregate(pipeline)
-        stats = await stats_cursor.to_list(1)
+        stats = (await stats_cursor.to_list(1))[0]
+        totals = stats["totals"][0] if stats["totals"] else {}
         
-        total_discount = stats[0]["total_discount"] if stats else 0
-        total_uses = stats[0]["total_uses"] if stats else 0
+        unique_users = await self.user_usage_collection.count_documents({"coupon_id": ObjectId(coupon_id)})
         
         return {
             "coupon_code": coupon.code,
-            "total_uses": total_uses,
-            "unique_users": len(coupon.user_usage_count),
-            "total_discount_given": total_discount,
+            "total_uses": totals.get("total_uses", 0),
+            "unique_users": unique_users,
+            "total_discount_given": totals.get("total_discount", 0),
             "usage_limit": coupon.usage_limit,
             "per_user_limit": coupon.per_user_limit,
             "remaining_uses": (coupon.usage_limit - coupon.current_usage) if coupon.usage_limit else None,
-            "user_usage_breakdown": coupon.user_usage_count
+            "top_users": [
+                {
+                    "user_id": str(user["_id"]),
+                    "usage_count": user["usage_count"],
+                    "total_discount": user["total_discount"]
+                }
+                for user in stats["top_users"]
+            ]
         }
+    
+    async def ensure_user_usage_index(self) -> bool:
+        """Create the unique (coupon_id, user_id) counter index, or disable redemption without it"""
+        try:
+            await self.user_usage_collection.create_index(
+                [("coupon_id", 1), ("user_id", 1)], unique=True
+            )
+            CouponService.redemption_enabled = True
+        except Exception as idx_error:
+            logger.error(
+                f"Could not create unique coupon_user_usage index, coupon redemption is disabled: {idx_error}"
+            )
+            CouponService.redemption_enabled = False
+        return CouponService.redemption_enabled
+    
+    async def migrate_embedded_usage_counts(self) -> int:
+        """Move legacy embedded user_usage_count maps into the coupon_user_usage collection"""
+        migrated = 0
+        cursor = self.collection.find({"user_usage_count": {"$exists": True}}, {"user_usage_count": 1})
+        async for coupon_doc in cursor:
+            operations = [
+                UpdateOne(
+                    {"coupon_id": coupon_doc["_id"], "user_id": ObjectId(user_id)},
+                    {"$max": {"count": count}},
+                    upsert=True
+                )
+                for user_id, count in (coupon_doc.get("user_usage_count") or {}).items()
+                if ObjectId.is_valid(user_id)
+            ]
+            if operations:
+                await self.user_usage_collection.bulk_write(operations, ordered=False)
+            
+            await self.collection.update_one(
+                {"_id": coupon_doc["_id"]},
+                {"$unset": {"user_usage_count": ""}}
+            )
+            migrated += 1
+        
+        if migrated:
+            logger.info(f"Migrated per-user usage counts for {migrated} coupons")
+        return migrated
@@ -1,9 +1,57 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.meal import Meal
+from app.models.user import UserRole, ApprovalStatus
 from app.schemas.meal import MealCreate
+from app.utils.cache import TTLCache
 from datetime import datetime
+from decouple import config
+from pymongo import UpdateOne
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Other workers learn about catalog changes when their cached copy expires
+MEAL_CATALOG_CACHE_TTL_SECONDS = config('MEAL_CATALOG_CACHE_TTL_SECONDS', default=60, cast=int)
+
+# Browse catalog (approved, available chefs with their visible meals), keyed by catalog version
+meal_catalog_cache = TTLCache(ttl_seconds=MEAL_CATALOG_CACHE_TTL_SECONDS, max_entries=4)
+_catalog_version = 0
+
+def invalidate_meal_catalog():
+    """Start a new catalog version after a meal or chef change.
+
+    Builds that started under the old version store their result under the
+    old key, so a slow rebuild can never bring back pre-change data.
+    """
+    global _catalog_version
+    _catalog_version += 1
+    meal_catalog_cache.clear()
+
+# Lower bounds of the price ranges reported in search facets; the last range is open-ended
+PRICE_FACET_BOUNDARIES = [0, 500, 1000, 2000]
+
+MEAL_SEARCH_SORTS = {
+    "price_asc": [("price", 1), ("_id", 1)],
+    "price_desc": [("price", -1), ("_id", 1)],
+    "newest": [("created_at", -1), ("_id", -1)],
+}
+
+def dietary_tags_for(dietary_info: Optional[str]) -> List[str]:
+    """Normalized tags from free-text dietary info, e.g. "Vegan, Gluten-Free" -> ["vegan", "gluten-free"]"""
+    if not dietary_info:
+        return []
+    tags = []
+    for part in re.split(r"[,;/|]", dietary_info):
+        tag = " ".join(part.split()).lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+# Chef fields shown alongside meals on the browse pages
+CATALOG_CHEF_PROJECTION = {"name": 1, "experience": 1, "degree": 1, "available": 1, "meals": 1}
 
 
 class MealService:
@@ -15,9 +63,11 @@ class MealService:
         """Create new meal"""
         meal_dict = meal_data.dict()
         meal_dict['chef_id'] = ObjectId(chef_id)  # Store as ObjectId in DB
+        meal_dict['dietary_tags'] = dietary_tags_for(meal_data.dietary_info)
         meal_dict['created_at'] = datetime.utcnow()
 
         result = await self.collection.insert_one(meal_dict)
+        invalidate_meal_catalog()
 
         # Convert ObjectId to string for Pydantic model
         meal_dict['_id'] = str(result.inserted_id)
@@ -53,6 +103,7 @@ class MealService:
         """Update meal"""
         try:
             update_dict = meal_data.dict()
+            update_dict['dietary_tags'] = dietary_tags_for(meal_data.dietary_info)
             update_dict['updated_at'] = datetime.utcnow()
 
             result = await self.collection.update_one(
@@ -61,6 +112,7 @@ class MealService:
             )
 
             if result.modified_count > 0:
+                invalidate_meal_catalog()
                 return await self.get_meal_by_id(meal_id)
             return None
         except:
@@ -70,6 +122,8 @@ class MealService:
         """Delete meal"""
         try:
             result = await self.collection.delete_one({"_id": ObjectId(meal_id)})
+            if result.deleted_count > 0:
+                invalidate_meal_catalog()
             return result.deleted_count > 0
         except:
             return False
@@ -94,8 +148,215 @@ class MealService:
             )
     
             if result.modified_count > 0:
+                invalidate_meal_catalog()
                 return await self.get_meal_by_id(meal_id)
             return None
         except:
             return None
 
+
+    def _to_meal_dict(self, meal_doc: dict) -> dict:
+        meal_doc['_id'] = str(meal_doc['_id'])
+        meal_doc['chef_id'] = str(meal_doc['chef_id'])
+        return Meal(**meal_doc).dict(by_alias=True)
+
+    async def get_catalog(self) -> List[dict]:
+        """Approved, available chefs with their visible meals, served from the catalog cache"""
+        version = _catalog_version
+        catalog = meal_catalog_cache.get(version)
+        if catalog is None:
+            catalog = await self._build_catalog()
+            meal_catalog_cache.set(version, catalog)
+        return catalog
+
+    async def _build_catalog(self) -> List[dict]:
+        """One aggregation: chefs joined to their meals, filtered on visibility and availability"""
+        cursor = self.db.users.aggregate([
+            {"$match": {
+                "role": UserRole.CHEF,
+                "approval_status": ApprovalStatus.APPROVED,
+                # Chefs without the field predate it and default to available
+                "available": {"$ne": False}
+            }},
+            {"$lookup": {
+                "from": "meals",
+                "localField": "_id",
+                "foreignField": "chef_id",
+                "as": "meals"
+            }},
+            {"$set": {"meals": {"$filter": {
+                "input": "$meals",
+                "cond": {"$ne": ["$$this.meal_visibility", False]}
+            }}}},
+            {"$project": CATALOG_CHEF_PROJECTION}
+        ])
+
+        catalog = []
+        async for chef_doc in cursor:
+            catalog.append({
+                "id": str(chef_doc["_id"]),
+                "name": chef_doc.get("name"),
+                "experience": chef_doc.get("experience"),
+                "degree": chef_doc.get("degree"),
+                "available": chef_doc.get("available", True),
+                "meals": [self._to_meal_dict(meal_doc) for meal_doc in chef_doc["meals"]]
+            })
+        return catalog
+
+    async def get_chefs_with_all_meals(self) -> List[dict]:
+        """Every chef with every meal in one aggregation (admin view, uncached)"""
+        cursor = self.db.users.aggregate([
+            {"$match": {"role": UserRole.CHEF}},
+            {"$lookup": {
+                "from": "meals",
+                "localField": "_id",
+                "foreignField": "chef_id",
+                "as": "meals"
+            }}
+        ])
+        chefs = []
+        async for chef_doc in cursor:
+            chef_doc["meals"] = [self._to_meal_dict(meal_doc) for meal_doc in chef_doc["meals"]]
+            chefs.append(chef_doc)
+        return chefs
+
+    async def get_search_facets(self) -> dict:
+        """Dietary tag, chef and price-range counts over the browse catalog (cached with it)"""
+        version = _catalog_version
+        facets = meal_catalog_cache.get(("facets", version))
+        if facets is None:
+            facets = self._compute_facets(await self.get_catalog())
+            meal_catalog_cache.set(("facets", version), facets)
+        return facets
+
+    def _compute_facets(self, catalog: List[dict]) -> dict:
+        tag_counts: Dict[str, int] = {}
+        price_counts = [0] * len(PRICE_FACET_BOUNDARIES)
+        chefs = []
+        total = 0
+        for chef in catalog:
+            if chef["meals"]:
+                chefs.append({"value": chef["id"], "count": len(chef["meals"])})
+            for meal in chef["meals"]:
+                total += 1
+                for tag in meal.get("dietary_tags") or dietary_tags_for(meal.get("dietary_info")):
+                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
+                for index in range(len(PRICE_FACET_BOUNDARIES) - 1, -1, -1):
+                    if meal["price"] >= PRICE_FACET_BOUNDARIES[index]:
+                        price_counts[index] += 1
+                        break
+
+        price_ranges = []
+        for index, lower in enumerate(PRICE_FACET_BOUNDARIES):
+            upper = PRICE_FACET_BOUNDARIES[index + 1] if index + 1 < len(PRICE_FACET_BOUNDARIES) else None
+            price_ranges.append({"min_price": lower, "max_price": upper, "count": price_counts[index]})
+
+        return {
+            "dietary_tags": sorted(
+                ({"value": tag, "count": count} for tag, count in tag_counts.items()),
+                key=lambda facet: (-facet["count"], facet["value"])
+            ),
+            "chefs": sorted(chefs, key=lambda facet: -facet["count"]),
+            "price_ranges": price_ranges,
+            "total_meals": total
+        }
+
+    async def search_meals(
+        self,
+        query: Optional[str] = None,
+        dietary_tags: Optional[List[str]] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        chef_id: Optional[str] = None,
+        sort: str = "relevance",
+        page: int = 1,
+        page_size: int = 20
+    ) -> dict:
+        """Search visible meals of approved, available chefs.
+
+        Matching and paging run in MongoDB (text index plus filter indexes);
+        total and page come back from one $facet round trip. Chef details are
+        attached from the cached catalog.
+        """
+        catalog = await self.get_catalog()
+        chefs = {chef["id"]: chef for chef in catalog}
+        chef_ids = [ObjectId(cid) for cid in chefs if not chef_id or cid == chef_id]
+        if not chef_ids:
+            return {"items": [], "total": 0, "page": page, "page_size": page_size}
+
+        match: dict = {
+            "chef_id": {"$in": chef_ids},
+            "meal_visibility": {"$ne": False}
+        }
+        if query:
+            match["$text"] = {"$search": query}
+        if dietary_tags:
+            match["dietary_tags"] = {"$all": [tag.strip().lower() for tag in dietary_tags]}
+        if min_price is not None or max_price is not None:
+            match["price"] = {}
+            if min_price is not None:
+                match["price"]["$gte"] = min_price
+            if max_price is not None:
+                match["price"]["$lte"] = max_price
+
+        pipeline = [{"$match": match}]
+        if query and sort == "relevance":
+            pipeline.append({"$set": {"_score": {"$meta": "textScore"}}})
+            sort_stage = {"_score": -1, "_id": 1}
+        else:
+            sort_stage = dict(MEAL_SEARCH_SORTS.get(sort, MEAL_SEARCH_SORTS["newest"]))
+        pipeline.append({"$facet": {
+            "items": [
+                {"$sort": sort_stage},
+                {"$skip": (page - 1) * page_size},
+                {"$limit": page_size},
+                {"$unset": "_score"}
+            ],
+            "total": [{"$count": "count"}]
+        }})
+
+        rows = await self.collection.aggregate(pipeline).to_list(length=1)
+        result = rows[0] if rows else {"items": [], "total": []}
+
+        items = []
+        for meal_doc in result["items"]:
+            meal = self._to_meal_dict(meal_doc)
+            chef = chefs[meal["chef_id"]]
+            meal["chef"] = {
+                "id": chef["id"],
+                "name": chef["name"],
+                "experience": chef["experience"],
+                "degree": chef["degree"]
+            }
+            items.append(meal)
+
+        return {
+            "items": items,
+            "total": result["total"][0]["count"] if result["total"] else 0,
+            "page": page,
+            "page_size": page_size
+        }
+
+    async def migrate_dietary_tags(self, batch_size: int = 500) -> int:
+        """Backfill dietary_tags for meals created before search existed"""
+        migrated = 0
+        operations = []
+        cursor = self.collection.find({"dietary_tags": {"$exists": False}}, {"dietary_info": 1})
+        async for meal_doc in cursor:
+            operations.append(UpdateOne(
+                {"_id": meal_doc["_id"]},
+                {"$set": {"dietary_tags": dietary_tags_for(meal_doc.get("dietary_info"))}}
+            ))
+            if len(operations) >= batch_size:
+                await self.collection.bulk_write(operations, ordered=False)
+                migrated += len(operations)
+                operations = []
+
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+            migrated += len(operations)
+
+        if migrated:
+            invalidate_meal_catalog()
+            logger.info(f"Backfilled dietary_tags for {migrated} meals")
+        return migrated
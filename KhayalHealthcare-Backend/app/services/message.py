@@ -1,27 +1,115 @@
-from typing import List
+from typing import List, Optional, Tuple
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import Message
 from app.schemas.message import MessageCreate
+from app.utils.realtime import event_hub
 from datetime import datetime
+from decouple import config
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Relay new messages to every worker through a change stream (requires a replica set)
+MESSAGE_CHANGE_STREAM_ENABLED = config('MESSAGE_CHANGE_STREAM_ENABLED', default=False, cast=bool)
+
+def conversation_id_for(user_a: str, user_b: str) -> str:
+    """Conversation key for a pair of users: the sorted participant ids"""
+    first, second = sorted([str(user_a), str(user_b)])
+    return f"{first}_{second}"
+
+def encode_message_cursor(message_doc: dict) -> str:
+    return f"{message_doc['timestamp'].isoformat()}_{message_doc['_id']}"
+
+def decode_message_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    """Parse a cursor from encode_message_cursor; raises ValueError if it is malformed"""
+    timestamp, message_id = cursor.rsplit("_", 1)
+    if not ObjectId.is_valid(message_id):
+        raise ValueError(f"Invalid message id in cursor: {message_id}")
+    return datetime.fromisoformat(timestamp), ObjectId(message_id)
 
 class MessageService:
+    # Publish new messages to this worker's hub directly unless the change stream relays them
+    publish_locally = not MESSAGE_CHANGE_STREAM_ENABLED
+    _resume_token = None
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         self.collection = db.messages
+        self.conversations = db.conversations
 
     async def create_message(self, message_data: MessageCreate) -> Message:
         """Create new message"""
         message_dict = message_data.dict()
         message_dict['from_id'] = ObjectId(message_data.from_id)
         message_dict['to_id'] = ObjectId(message_data.to_id)
+        message_dict['conversation_id'] = conversation_id_for(message_data.from_id, message_data.to_id)
         message_dict['timestamp'] = datetime.utcnow()
         message_dict['read'] = False
 
         result = await self.collection.insert_one(message_dict)
         message_dict['_id'] = result.inserted_id
-        
-        return Message(**message_dict)
+
+        await self._update_conversation_summary(message_dict)
+
+        if MessageService.publish_locally:
+            self._publish(message_dict)
+
+        return Message(**self._serialize(message_dict))
+
+    def _publish(self, message_doc: dict):
+        """Push a new message to both participants' live connections"""
+        event_hub.publish(
+            [message_doc['from_id'], message_doc['to_id']],
+            {"type": "message.created", "message": self._serialize(message_doc)}
+        )
+
+    async def relay_change_stream(self):
+        """Publish messages inserted by any worker to this worker's connections.
+
+        Runs until cancelled. If change streams are unavailable (standalone
+        MongoDB) the worker falls back to publishing its own messages.
+        """
+        pipeline = [{"$match": {"operationType": "insert"}}]
+        try:
+            async with self.collection.watch(pipeline, resume_after=MessageService._resume_token) as stream:
+                MessageService.publish_locally = False
+                logger.info("Relaying new messages from the change stream")
+                async for change in stream:
+                    MessageService._resume_token = stream.resume_token
+                    self._publish(change["fullDocument"])
+        except OperationFailure as e:
+            MessageService.publish_locally = True
+            # The resume point may have fallen off the oplog; start fresh next time
+            MessageService._resume_token = None
+            logger.warning(f"Message change stream unavailable, publishing locally: {str(e)}")
+            raise
+        except Exception:
+            MessageService.publish_locally = True
+            raise
+
+    async def _update_conversation_summary(self, message_dict: dict):
+        """Keep the conversation's last message and the recipient's unread count current"""
+        await self.conversations.update_one(
+            {"_id": message_dict['conversation_id']},
+            {
+                "$inc": {f"unread.{message_dict['to_id']}": 1},
+                "$set": {
+                    "participants": sorted([message_dict['from_id'], message_dict['to_id']]),
+                    "last_message": {
+                        "_id": message_dict['_id'],
+                        "from_id": message_dict['from_id'],
+                        "to_id": message_dict['to_id'],
+                        "content": message_dict['content'],
+                        "timestamp": message_dict['timestamp']
+                    },
+                    "last_message_at": message_dict['timestamp']
+                }
+            },
+            upsert=True
+        )
 
     async def get_messages_for_user(self, user_id: str) -> List[Message]:
         """Get all messages for a user (sent or received)"""
@@ -29,8 +117,214 @@ class MessageService:
         cursor = self.collection.find({
             "$or": [{"from_id": user_oid}, {"to_id": user_oid}]
         }).sort("timestamp", 1)
-        
+
         messages = []
         async for message_doc in cursor:
             messages.append(Message(**message_doc))
         return messages
+
+    async def get_conversations(self, user_id: str, skip: int = 0, limit: int = 50) -> List[dict]:
+        """List a user's conversations, most recent first, with last message and unread count"""
+        user_oid = ObjectId(user_id)
+        cursor = self.conversations.find(
+            {"participants": user_oid}
+        ).sort("last_message_at", -1).skip(skip).limit(limit)
+        summaries = await cursor.to_list(length=limit)
+
+        conversations = []
+        for summary in summaries:
+            other_ids = [p for p in summary.get("participants", []) if p != user_oid]
+            conversations.append({
+                "conversation_id": summary["_id"],
+                "participant_id": str(other_ids[0] if other_ids else user_oid),
+                "last_message": self._serialize(summary["last_message"]),
+                "last_message_at": summary["last_message_at"],
+                "unread_count": max((summary.get("unread") or {}).get(user_id, 0), 0)
+            })
+        return conversations
+
+    async def get_unread_count(self, user_id: str) -> int:
+        """Total unread messages for a user, summed from the conversation counters"""
+        cursor = self.conversations.aggregate([
+            {"$match": {"participants": ObjectId(user_id)}},
+            {"$group": {"_id": None, "total": {"$sum": {"$max": [
+                {"$ifNull": [f"$unread.{user_id}", 0]}, 0
+            ]}}}}
+        ])
+        rows = await cursor.to_list(length=1)
+        return rows[0]["total"] if rows else 0
+
+    async def mark_read(self, user_id: str, marks: List[Tuple[str, datetime]]) -> List[dict]:
+        """Mark messages read up to a high-water-mark timestamp per conversation.
+
+        Each conversation takes one update_many over the unread messages sent to
+        the user. Its unread counter is then recounted from the messages rather
+        than decremented, so concurrent marks and new messages cannot make it drift.
+        """
+        user_oid = ObjectId(user_id)
+        now = datetime.utcnow()
+        results = []
+        for conversation_id, up_to in marks:
+            if user_id not in conversation_id.split("_"):
+                raise ValueError(f"Not a participant in conversation {conversation_id}")
+
+            result = await self.collection.update_many(
+                {
+                    "conversation_id": conversation_id,
+                    "to_id": user_oid,
+                    "read": False,
+                    "timestamp": {"$lte": up_to}
+                },
+                {"$set": {"read": True, "read_at": now}}
+            )
+
+            # Indexed count on (to_id, read, conversation_id)
+            remaining = await self.collection.count_documents({
+                "conversation_id": conversation_id,
+                "to_id": user_oid,
+                "read": False
+            })
+            summary = await self.conversations.find_one_and_update(
+                {"_id": conversation_id},
+                {"$set": {f"unread.{user_id}": remaining}},
+                projection={"unread": 1, "participants": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            unread_count = (summary.get("unread") or {}).get(user_id, 0) if summary else 0
+
+            if result.modified_count and summary:
+                # Read receipt for the other participant's live connections
+                event_hub.publish(
+                    [p for p in summary.get("participants", []) if p != user_oid],
+                    {
+                        "type": "messages.read",
+                        "conversation_id": conversation_id,
+                        "reader_id": user_id,
+                        "up_to": up_to
+                    }
+                )
+
+            results.append({
+                "conversation_id": conversation_id,
+                "marked_read": result.modified_count,
+                "unread_count": unread_count
+            })
+        return results
+
+    async def migrate_unread_counters(self) -> int:
+        """Initialise unread counters on conversation summaries that predate them"""
+        missing = [
+            doc["_id"] async for doc in
+            self.conversations.find({"unread": {"$exists": False}}, {"_id": 1})
+        ]
+        if not missing:
+            return 0
+
+        for start in range(0, len(missing), 500):
+            batch = missing[start:start + 500]
+            await self.conversations.update_many({"_id": {"$in": batch}}, {"$set": {"unread": {}}})
+            operations = [
+                UpdateOne(
+                    {"_id": row["_id"]["conversation_id"]},
+                    {"$set": {f"unread.{row['_id']['to_id']}": row["count"]}}
+                )
+                async for row in self.collection.aggregate([
+                    {"$match": {"conversation_id": {"$in": batch}, "read": False}},
+                    {"$group": {
+                        "_id": {"conversation_id": "$conversation_id", "to_id": "$to_id"},
+                        "count": {"$sum": 1}
+                    }}
+                ])
+            ]
+            if operations:
+                await self.conversations.bulk_write(operations, ordered=False)
+
+        logger.info(f"Initialised unread counters for {len(missing)} conversations")
+        return len(missing)
+
+    async def get_conversation_page(
+        self,
+        user_id: str,
+        other_user_id: str,
+        before: Optional[str] = None,
+        limit: int = 50
+    ) -> dict:
+        """Page backwards through one conversation.
+
+        Returns up to `limit` messages older than the `before` cursor, oldest
+        first, plus the cursor for the next (older) page.
+        """
+        conversation_id = conversation_id_for(user_id, other_user_id)
+        query = {"conversation_id": conversation_id}
+        if before:
+            before_timestamp, before_id = decode_message_cursor(before)
+            query["$or"] = [
+                {"timestamp": {"$lt": before_timestamp}},
+                {"timestamp": before_timestamp, "_id": {"$lt": before_id}}
+            ]
+
+        cursor = self.collection.find(query).sort([("timestamp", -1), ("_id", -1)]).limit(limit + 1)
+        message_docs = await cursor.to_list(length=limit + 1)
+
+        has_more = len(message_docs) > limit
+        message_docs = message_docs[:limit]
+        next_cursor = encode_message_cursor(message_docs[-1]) if has_more else None
+
+        return {
+            "conversation_id": conversation_id,
+            "messages": [self._serialize(doc) for doc in reversed(message_docs)],
+            "next_cursor": next_cursor,
+            "has_more": has_more
+        }
+
+    async def migrate_conversation_ids(self) -> int:
+        """Backfill conversation_id on older messages and build their conversation summaries"""
+        result = await self.collection.update_many(
+            {"conversation_id": {"$exists": False}},
+            [{"$set": {"conversation_id": {"$cond": [
+                {"$lt": ["$from_id", "$to_id"]},
+                {"$concat": [{"$toString": "$from_id"}, "_", {"$toString": "$to_id"}]},
+                {"$concat": [{"$toString": "$to_id"}, "_", {"$toString": "$from_id"}]}
+            ]}}}]
+        )
+        if not result.modified_count:
+            return 0
+
+        # One-off rebuild of every conversation summary from the message history
+        await self.collection.aggregate([
+            {"$sort": {"conversation_id": 1, "timestamp": -1}},
+            {"$group": {
+                "_id": "$conversation_id",
+                "from_id": {"$first": "$from_id"},
+                "to_id": {"$first": "$to_id"},
+                "last_message": {"$first": {
+                    "_id": "$_id",
+                    "from_id": "$from_id",
+                    "to_id": "$to_id",
+                    "content": "$content",
+                    "timestamp": "$timestamp"
+                }},
+                "last_message_at": {"$first": "$timestamp"}
+            }},
+            {"$project": {
+                "participants": {"$cond": [
+                    {"$lt": ["$from_id", "$to_id"]},
+                    ["$from_id", "$to_id"],
+                    ["$to_id", "$from_id"]
+                ]},
+                "last_message": 1,
+                "last_message_at": 1
+            }},
+            {"$merge": {"into": "conversations", "whenMatched": "merge", "whenNotMatched": "insert"}}
+        ], allowDiskUse=True).to_list(length=None)
+
+        logger.info(f"Backfilled conversation_id on {result.modified_count} messages")
+        return result.modified_count
+
+    def _serialize(self, message_doc: dict) -> dict:
+        """Stringify ObjectIds so the document fits Message/MessageResponse"""
+        message_doc = dict(message_doc)
+        for field in ("_id", "from_id", "to_id"):
+            if isinstance(message_doc.get(field), ObjectId):
+                message_doc[field] = str(message_doc[field])
+        return message_doc
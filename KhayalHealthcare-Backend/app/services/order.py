@@ -2,14 +2,55 @@ from typing import List, Optional, Tuple
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import Order, OrderStatus, UserRole
+from app.models.meal import Meal
 from app.schemas.order import OrderCreate
 from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne
 from app.services.notification import send_notification, send_message
+from app.services.coupon import CouponService
+from app.utils.realtime import status_hub, ADMIN_TOPIC
 import logging
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+class OrderValidationError(ValueError):
+    """The order does not match the meal it is for"""
+
+def build_order_snapshot(meal: dict, chef: Optional[dict], subscriber: Optional[dict]) -> dict:
+    """Denormalized copy of everything order listings and notifications show"""
+    meal = dict(meal)
+    meal['_id'] = str(meal['_id'])
+    meal['chef_id'] = str(meal['chef_id'])
+    chef = chef or {}
+    subscriber = subscriber or {}
+    return {
+        "meal": Meal(**meal).dict(by_alias=True),
+        "chef": {
+            "id": str(chef['_id']) if chef.get('_id') else None,
+            "name": chef.get('name'),
+            "experience": chef.get('experience'),
+            "degree": chef.get('degree'),
+            "email": chef.get('email'),
+            "phone": chef.get('phone')
+        },
+        "subscriber": {
+            "id": str(subscriber['_id']) if subscriber.get('_id') else None,
+            "name": subscriber.get('name'),
+            "phone": subscriber.get('phone'),
+            "email": subscriber.get('email'),
+            "address": subscriber.get('address'),
+            "city": subscriber.get('city'),
+            "previous_illness": subscriber.get('previous_illness')
+        }
+    }
+
+def split_order_snapshot(order: Order) -> Tuple[dict, dict]:
+    """The order as a response dict without its snapshot, and the snapshot (empty if missing)"""
+    order_dict = order.dict(by_alias=True)
+    snapshot = order_dict.pop('snapshot', None) or {}
+    return order_dict, snapshot
+
 class OrderService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
@@ -17,30 +58,93 @@ class OrderService:
         self.users = db.users
         self.meals = db.meals
 
-    async def create_order(self, order_data: OrderCreate) -> Order:
-        """Create new order and notify chef and admins"""
+    async def create_order(self, order_data: OrderCreate, order_id: Optional[ObjectId] = None) -> Order:
+        """Create new order and notify chef and admins.
+
+        The meal, chef and subscriber are read together once. The total is
+        computed here from the meal price, quantity and any coupon (the
+        client's total_price is not trusted), and their details are stored on
+        the order as a snapshot so nothing needs to be joined again afterwards.
+        A caller-chosen order_id makes a repeated attempt collide on insert
+        (DuplicateKeyError) instead of creating a second order.
+        """
+        meal, chef, subscriber = await self._load_order_parties(
+            order_data.meal_id, order_data.chef_id, order_data.subscriber_id
+        )
+        self._validate_order(order_data, meal)
+
+        # The id is chosen up front so a coupon redemption can reference the order
+        order_id = order_id or ObjectId()
+        subtotal = round(meal['price'] * order_data.quantity, 2)
+
         order_dict = order_data.dict()
+        order_dict['_id'] = order_id
         order_dict['subscriber_id'] = ObjectId(order_data.subscriber_id)
         order_dict['chef_id'] = ObjectId(order_data.chef_id)
         order_dict['meal_id'] = ObjectId(order_data.meal_id)
+        order_dict['subtotal'] = subtotal
+        order_dict['discount'] = 0.0
+        order_dict['coupon_code'] = None
+        order_dict['total_price'] = subtotal
         order_dict['status'] = OrderStatus.PENDING
         order_dict['timestamp'] = datetime.utcnow()
-
-        result = await self.collection.insert_one(order_dict)
+        order_dict['snapshot'] = build_order_snapshot(meal, chef, subscriber)
+
+        if order_data.coupon_code:
+            coupon_code = order_data.coupon_code.strip().upper()
+
+            async def insert_discounted_order(discount: float, session):
+                # Runs inside the coupon redemption (in its transaction when the
+                # server supports one), so a failed insert gives the coupon use back
+                order_dict['discount'] = round(discount, 2)
+                order_dict['coupon_code'] = coupon_code
+                order_dict['total_price'] = round(max(subtotal - order_dict['discount'], 0), 2)
+                await self.collection.insert_one(order_dict, session=session)
+
+            applied, message, _ = await CouponService(self.db).apply_coupon(
+                coupon_code, order_data.subscriber_id, str(order_id), subtotal,
+                on_redeemed=insert_discounted_order
+            )
+            if not applied:
+                raise OrderValidationError(message)
+        else:
+            await self.collection.insert_one(order_dict)
 
         # Convert ObjectIds to strings for Pydantic model
-        order_dict['_id'] = str(result.inserted_id)
+        order_dict['_id'] = str(order_id)
         order_dict['subscriber_id'] = str(order_dict['subscriber_id'])
         order_dict['chef_id'] = str(order_dict['chef_id'])
         order_dict['meal_id'] = str(order_dict['meal_id'])
 
         order = Order(**order_dict)
+        self._publish_status(order)
 
         # Send notifications asynchronously
         asyncio.create_task(self._notify_new_order(order))
 
         return order
 
+    async def _load_order_parties(self, meal_id: str, chef_id: str, subscriber_id: str):
+        """Meal, chef and subscriber documents, fetched concurrently"""
+        meal, people = await asyncio.gather(
+            self.meals.find_one({"_id": ObjectId(meal_id)}),
+            self.users.find(
+                {"_id": {"$in": [ObjectId(chef_id), ObjectId(subscriber_id)]}}
+            ).to_list(length=2)
+        )
+        by_id = {str(person['_id']): person for person in people}
+        return meal, by_id.get(str(chef_id)), by_id.get(str(subscriber_id))
+
+    def _validate_order(self, order_data: OrderCreate, meal: Optional[dict]):
+        if not meal:
+            raise OrderValidationError(f"Meal not found: {order_data.meal_id}")
+        if str(meal['chef_id']) != str(order_data.chef_id):
+            raise OrderValidationError("Meal does not belong to this chef")
+        if meal.get('meal_visibility') is False:
+            raise OrderValidationError("Meal is not available for ordering")
+        if order_data.quantity < 1:
+            raise OrderValidationError("Quantity must be at least 1")
+
     async def get_orders_by_chef(self, chef_id: str) -> List[Order]:
         """Get all orders for a chef"""
         cursor = self.collection.find({"chef_id": ObjectId(chef_id)})
@@ -82,24 +186,21 @@ class OrderService:
 
     async def update_order_status(self, order_id: str, status: OrderStatus):
         """Update order status and notify relevant parties"""
-        # Get order details before updating
-        order_doc = await self.collection.find_one({"_id": ObjectId(order_id)})
-        if not order_doc:
-            raise ValueError(f"Order not found: {order_id}")
-
-        # Update the status
-        await self.collection.update_one(
+        order_doc = await self.collection.find_one_and_update(
             {"_id": ObjectId(order_id)},
-            {"$set": {"status": status}}
+            {"$set": {"status": status}},
+            return_document=ReturnDocument.AFTER
         )
+        if not order_doc:
+            raise ValueError(f"Order not found: {order_id}")
 
         # Convert to Order object for notifications
         order_doc['_id'] = str(order_doc['_id'])
         order_doc['subscriber_id'] = str(order_doc['subscriber_id'])
         order_doc['chef_id'] = str(order_doc['chef_id'])
         order_doc['meal_id'] = str(order_doc['meal_id'])
-        order_doc['status'] = status  # Use the new status
         order = Order(**order_doc)
+        self._publish_status(order)
 
         # Send notifications asynchronously
         asyncio.create_task(self._notify_order_status_change(order, status))
@@ -119,21 +220,77 @@ class OrderService:
         except:
             return None
 
+    def _publish_status(self, order: Order):
+        """Push an order status transition to the subscriber's, chef's and admins' live feeds"""
+        status_hub.publish([order.subscriber_id, order.chef_id, ADMIN_TOPIC], {
+            "type": "order.status",
+            "order_id": str(order.id),
+            "status": order.status,
+            "updated_at": datetime.utcnow()
+        })
+
+    async def _get_snapshot(self, order: Order) -> Optional[dict]:
+        """The order's snapshot, rebuilt from current data for orders that predate snapshots"""
+        if order.snapshot:
+            return order.snapshot
+        meal, chef, subscriber = await self._load_order_parties(
+            str(order.meal_id), str(order.chef_id), str(order.subscriber_id)
+        )
+        return build_order_snapshot(meal, chef, subscriber) if meal else None
+
+    async def migrate_order_snapshots(self, batch_size: int = 500) -> int:
+        """Store snapshots on orders created before they were recorded"""
+        migrated = 0
+        cursor = self.collection.find(
+            {"snapshot": {"$exists": False}},
+            {"meal_id": 1, "chef_id": 1, "subscriber_id": 1}
+        )
+        batch = []
+        async for order_doc in cursor:
+            batch.append(order_doc)
+            if len(batch) >= batch_size:
+                migrated += await self._snapshot_batch(batch)
+                batch = []
+        if batch:
+            migrated += await self._snapshot_batch(batch)
+
+        if migrated:
+            logger.info(f"Backfilled snapshots for {migrated} orders")
+        return migrated
+
+    async def _snapshot_batch(self, order_docs: List[dict]) -> int:
+        meal_ids = list({doc['meal_id'] for doc in order_docs})
+        user_ids = list({doc['chef_id'] for doc in order_docs} | {doc['subscriber_id'] for doc in order_docs})
+        meals = {doc['_id']: doc async for doc in self.meals.find({"_id": {"$in": meal_ids}})}
+        users = {doc['_id']: doc async for doc in self.users.find({"_id": {"$in": user_ids}})}
+
+        operations = []
+        for order_doc in order_docs:
+            meal = meals.get(order_doc['meal_id'])
+            if not meal:
+                # Meal deleted since; nothing meaningful to record
+                continue
+            snapshot = build_order_snapshot(
+                meal, users.get(order_doc['chef_id']), users.get(order_doc['subscriber_id'])
+            )
+            operations.append(UpdateOne({"_id": order_doc['_id']}, {"$set": {"snapshot": snapshot}}))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+        return len(operations)
+
     # Notification Methods
     async def _notify_new_order(self, order: Order):
         """Notify chef and admins about new order"""
         try:
-            # Get chef, subscriber, and meal details
-            chef = await self.users.find_one({"_id": ObjectId(order.chef_id)})
-            subscriber = await self.users.find_one({"_id": ObjectId(order.subscriber_id)})
-            meal = await self.meals.find_one({"_id": ObjectId(order.meal_id)})
-
-            if not chef or not subscriber or not meal:
+            # Chef, subscriber and meal details come from the order snapshot
+            snapshot = await self._get_snapshot(order)
+            if not snapshot:
                 logger.error("Missing user or meal data for order notifications")
                 return
+            chef, subscriber, meal = snapshot['chef'], snapshot['subscriber'], snapshot['meal']
 
             # Get all admins
-            admin_cursor = self.users.find({"role": UserRole.ADMIN})
+            admin_cursor = self.users.find({"role": UserRole.ADMIN}, {"email": 1, "phone": 1})
             admins = await admin_cursor.to_list(None)
 
             order_time = order.timestamp.strftime("%B %d, %Y at %I:%M %p")
@@ -244,14 +401,12 @@ Monitor order progress in admin panel.
     async def _notify_order_status_change(self, order: Order, new_status: OrderStatus):
         """Notify relevant parties about order status changes"""
         try:
-            # Get chef, subscriber, and meal details
-            chef = await self.users.find_one({"_id": ObjectId(order.chef_id)})
-            subscriber = await self.users.find_one({"_id": ObjectId(order.subscriber_id)})
-            meal = await self.meals.find_one({"_id": ObjectId(order.meal_id)})
-
-            if not chef or not subscriber or not meal:
+            # Chef, subscriber and meal details come from the order snapshot
+            snapshot = await self._get_snapshot(order)
+            if not snapshot:
                 logger.error("Missing user or meal data for status change notifications")
                 return
+            chef, subscriber, meal = snapshot['chef'], snapshot['subscriber'], snapshot['meal']
 
             notification_tasks = []
 
@@ -310,7 +465,7 @@ Thank you for your order!
             # Notify Admins only for DELIVERED status
             if new_status == OrderStatus.DELIVERED:
                 # Get all admins
-                admin_cursor = self.users.find({"role": UserRole.ADMIN})
+                admin_cursor = self.users.find({"role": UserRole.ADMIN}, {"email": 1, "phone": 1})
                 admins = await admin_cursor.to_list(None)
 
                 admin_subject = "Order Completed - Khayal Healthcare"
@@ -0,0 +1,207 @@
+from typing import Dict, List, Optional
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.models.user import CareVisitRequestStatus
+from app.services.visit_workflow import VisitWorkflow, VisitType, SCHEDULED_STATUSES, VISIT_SLOT_MINUTES
+from app.utils.assignment import solve_assignment, INFEASIBLE
+from datetime import datetime, timedelta
+from decouple import config
+import asyncio
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pending requests considered per matching run
+MATCHING_BATCH_LIMIT = config('MATCHING_BATCH_LIMIT', default=200, cast=int)
+# Requests one provider can be proposed for in a single run
+MATCHING_MAX_PER_PROVIDER = config('MATCHING_MAX_PER_PROVIDER', default=3, cast=int)
+
+# Score weights: higher is a better match
+CITY_MATCH_WEIGHT = 3.0
+CITY_UNKNOWN_WEIGHT = 1.0
+EXPERIENCE_WEIGHT = 2.0
+EXPERIENCE_CAP_YEARS = 10
+LOAD_PENALTY = 0.5
+
+def _proposed_time(preferred_date: datetime, now: datetime) -> datetime:
+    """The subscriber's preferred time, or the next full hour if that has passed"""
+    if preferred_date >= now:
+        return preferred_date
+    return now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+
+def _is_free(schedule: List[datetime], when: datetime) -> bool:
+    """Whether a sorted list of appointment times leaves a slot at `when`"""
+    slot = timedelta(minutes=VISIT_SLOT_MINUTES)
+    index = bisect.bisect_left(schedule, when - slot + timedelta(microseconds=1))
+    return index == len(schedule) or schedule[index] >= when + slot
+
+class ProviderMatcher:
+    """Propose provider assignments for a batch of pending visit requests.
+
+    Every (request, provider) pair is scored on availability at the preferred
+    time, the provider's current load, city and experience; the batch is then
+    solved as one assignment problem so the total score is maximised.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, workflow: VisitWorkflow):
+        self.db = db
+        self.workflow = workflow
+        self.visit_type: VisitType = workflow.visit_type
+
+    async def propose(self, limit: int = MATCHING_BATCH_LIMIT) -> dict:
+        """Score pending requests against approved providers and solve the batch"""
+        now = datetime.utcnow()
+        requests = await self.workflow.collection.find(
+            {"status": CareVisitRequestStatus.PENDING}
+        ).sort("preferred_date", 1).limit(limit).to_list(length=limit)
+        providers = await self.workflow.get_approved_providers()
+        if not requests or not providers:
+            return {
+                "proposals": [],
+                "unmatched": [str(request['_id']) for request in requests],
+                "providers_considered": len(providers)
+            }
+
+        times = {request['_id']: _proposed_time(request['preferred_date'], now) for request in requests}
+        schedules, loads = await self._load_schedules(
+            [provider['_id'] for provider in providers], min(times.values()), max(times.values()), now
+        )
+        cities = await self._subscriber_cities(requests)
+
+        loop = asyncio.get_running_loop()
+        matches = await loop.run_in_executor(
+            None, self._solve, requests, providers, times, schedules, loads, cities
+        )
+
+        proposals = []
+        unmatched = []
+        for request, match in zip(requests, matches):
+            if match is None:
+                unmatched.append(str(request['_id']))
+                continue
+            provider, score, same_city = match
+            proposals.append({
+                "request_id": str(request['_id']),
+                "subscriber_id": str(request['subscriber_id']),
+                "provider_id": str(provider['_id']),
+                "provider_name": provider.get('name'),
+                "appointment_date_time": times[request['_id']],
+                "score": round(score, 3),
+                "current_load": loads.get(provider['_id'], 0),
+                "same_city": same_city
+            })
+
+        return {
+            "proposals": proposals,
+            "unmatched": unmatched,
+            "providers_considered": len(providers)
+        }
+
+    async def apply(self, proposals: List[dict]) -> dict:
+        """Assign every proposal through the workflow; failures are reported, not raised"""
+        assigned = []
+        failed = []
+        for proposal in proposals:
+            try:
+                await self.workflow.assign(
+                    proposal["request_id"], proposal["provider_id"], proposal["appointment_date_time"]
+                )
+                assigned.append(proposal["request_id"])
+            except ValueError as e:
+                failed.append({"request_id": proposal["request_id"], "error": str(e)})
+        return {"assigned": assigned, "failed": failed}
+
+    async def _load_schedules(self, provider_ids: List[ObjectId], first: datetime, last: datetime, now: datetime):
+        """Sorted appointment times near the batch window, and the upcoming load, per provider"""
+        slot = timedelta(minutes=VISIT_SLOT_MINUTES)
+        provider_field = self.visit_type.provider_field
+        cursor = self.workflow.collection.aggregate([
+            {"$match": {
+                provider_field: {"$in": provider_ids},
+                "status": {"$in": SCHEDULED_STATUSES},
+                "appointment_date_time": {"$gt": min(first, now) - slot}
+            }},
+            {"$group": {
+                "_id": f"${provider_field}",
+                "times": {"$push": "$appointment_date_time"},
+                "load": {"$sum": {"$cond": [{"$gte": ["$appointment_date_time", now]}, 1, 0]}}
+            }}
+        ])
+        schedules: Dict[ObjectId, List[datetime]] = {}
+        loads: Dict[ObjectId, int] = {}
+        async for row in cursor:
+            schedules[row["_id"]] = sorted(t for t in row["times"] if t < last + slot)
+            loads[row["_id"]] = row["load"]
+        return schedules, loads
+
+    async def _subscriber_cities(self, requests: List[dict]) -> Dict[ObjectId, Optional[str]]:
+        if not self.visit_type.include_subscriber_address:
+            return {}
+        subscriber_ids = list({request['subscriber_id'] for request in requests})
+        cursor = self.db.users.find({"_id": {"$in": subscriber_ids}}, {"city": 1})
+        return {doc['_id']: doc.get('city') async for doc in cursor}
+
+    def _score(self, request: dict, provider: dict, load: int, cities: Dict[ObjectId, Optional[str]]):
+        score = EXPERIENCE_WEIGHT * min(provider.get('experience') or 0, EXPERIENCE_CAP_YEARS) / EXPERIENCE_CAP_YEARS
+        score -= LOAD_PENALTY * load
+
+        same_city = None
+        if self.visit_type.include_subscriber_address:
+            # Home visits: prefer providers in the subscriber's city
+            subscriber_city = (cities.get(request['subscriber_id']) or "").strip().lower()
+            provider_city = (provider.get('city') or "").strip().lower()
+            if subscriber_city and provider_city:
+                same_city = subscriber_city == provider_city
+                score += CITY_MATCH_WEIGHT if same_city else 0.0
+            else:
+                score += CITY_UNKNOWN_WEIGHT
+        return score, same_city
+
+    def _solve(self, requests, providers, times, schedules, loads, cities):
+        """Build the cost matrix and solve it (CPU-bound; runs in the default executor).
+
+        Each provider contributes MATCHING_MAX_PER_PROVIDER columns; the k-th
+        column carries k extra units of load so work is spread out. Proposals
+        that overlap within the batch for the same provider are dropped.
+        """
+        columns = []
+        for provider in providers:
+            for extra in range(MATCHING_MAX_PER_PROVIDER):
+                columns.append((provider, extra))
+
+        costs = []
+        details = []
+        for request in requests:
+            when = times[request['_id']]
+            row = []
+            row_details = []
+            for provider, extra in columns:
+                if not _is_free(schedules.get(provider['_id'], []), when):
+                    row.append(INFEASIBLE)
+                    row_details.append(None)
+                    continue
+                score, same_city = self._score(request, provider, loads.get(provider['_id'], 0) + extra, cities)
+                row.append(-score)
+                row_details.append((score, same_city))
+            costs.append(row)
+            details.append(row_details)
+
+        assignment = solve_assignment(costs)
+
+        matches = [None] * len(requests)
+        booked: Dict[ObjectId, List[datetime]] = {}
+        # Earliest first, so later requests give way when a provider is double-booked
+        for index in sorted(range(len(requests)), key=lambda i: times[requests[i]['_id']]):
+            column = assignment[index]
+            if column is None:
+                continue
+            provider = columns[column][0]
+            when = times[requests[index]['_id']]
+            taken = booked.setdefault(provider['_id'], [])
+            if not _is_free(taken, when):
+                continue
+            bisect.insort(taken, when)
+            score, same_city = details[index][column]
+            matches[index] = (provider, score, same_city)
+        return matches
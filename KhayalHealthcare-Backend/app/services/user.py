@@ -1,39 +1,59 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import User, UserRole, ApprovalStatus, SubscriptionStatus
 from app.schemas.user import UserCreate, UserUpdate
-from app.utils.auth import get_password_hash
+from app.utils.auth import get_password_hash_async, normalize_username
 from datetime import datetime
 from app.services.notification import send_email_async, send_whatsapp_async
-from pymongo.errors import DuplicateKeyError
+from app.services.meal import invalidate_meal_catalog
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 import logging
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+class DuplicateUserError(ValueError):
+    """Raised when a username, email or phone number is already registered"""
+
+    def __init__(self, fields: List[str], message: str):
+        super().__init__(message)
+        self.fields = fields
+
+def pad_phone(phone: str) -> str:
+    """Phone numbers shorter than 10 digits are stored right-padded with zeros"""
+    return phone.ljust(10, '0') if len(phone) < 10 else phone
+
+def duplicate_user_message(field: str, username: str, email: str, phone: str) -> str:
+    """Message for a username/email/phone that is already registered"""
+    if field == "username":
+        return f"Username '{username}' is already taken"
+    if field == "email":
+        return f"Email '{email}' is already registered"
+    return f"Phone number '{phone}' is already registered"
+
+def _duplicate_key_field(error: DuplicateKeyError) -> Optional[str]:
+    """Which user identifier a unique index violation was on"""
+    key_pattern = (error.details or {}).get("keyPattern") or {}
+    candidates = list(key_pattern) or [str(error)]
+    for candidate in candidates:
+        for field in ("username", "email", "phone"):
+            if field in candidate:
+                return field
+    return None
+
 class UserService:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
         self.collection = db.users
 
     async def create_user(self, user_data: UserCreate, email_verified: bool = False, phone_verified: bool = False) -> User:
-        """Create a new user and notify admins"""
-        # Check if username already exists
-        existing_user = await self.get_user_by_username(user_data.username)
-        if existing_user:
-            raise ValueError(f"Username '{user_data.username}' is already taken")
-        
-        # Check if email already exists
-        existing_email = await self.get_user_by_email(user_data.email)
-        if existing_email:
-            raise ValueError(f"Email '{user_data.email}' is already registered")
-        
-        # Check if phone number already exists
-        existing_phone = await self.get_user_by_phone(user_data.phone)
-        if existing_phone:
-            raise ValueError(f"Phone number '{user_data.phone}' is already registered")
-    
+        """Create a new user and notify admins.
+
+        Duplicates are detected by the unique indexes on insert; callers that want
+        an early answer use find_conflicting_identifiers first.
+        """
         # Validate and hash password
         try:
             # Additional validation to ensure password length is within BCrypt limits
@@ -42,7 +62,7 @@ class UserService:
             if len(user_data.password) < 6:
                 raise ValueError('Password must be at least 6 characters long.')
 
-            hashed_password = get_password_hash(user_data.password)
+            hashed_password = await get_password_hash_async(user_data.password)
         except Exception as e:
             # Handle any password-related errors
             if "72 bytes" in str(e) or "truncate manually" in str(e):
@@ -52,6 +72,7 @@ class UserService:
         # Create user document
         user_dict = user_data.dict()
         user_dict['password'] = hashed_password
+        user_dict['username_lower'] = normalize_username(user_data.username)
         user_dict['approval_status'] = ApprovalStatus.PENDING
         user_dict['created_at'] = datetime.utcnow()
         user_dict['updated_at'] = datetime.utcnow()
@@ -70,22 +91,16 @@ class UserService:
                 user_dict['city'] = "Default City"
     
         # Pad phone number if needed
-        if len(user_dict['phone']) < 10:
-            user_dict['phone'] = user_dict['phone'].ljust(10, '0')
+        user_dict['phone'] = pad_phone(user_dict['phone'])
     
         try:
             result = await self.collection.insert_one(user_dict)
         except DuplicateKeyError as e:
-            # Handle database-level duplicate key errors
-            error_msg = str(e)
-            if 'username' in error_msg:
-                raise ValueError(f"Username '{user_data.username}' is already taken")
-            elif 'email' in error_msg:
-                raise ValueError(f"Email '{user_data.email}' is already registered")
-            elif 'phone' in error_msg:
-                raise ValueError(f"Phone number '{user_data.phone}' is already registered")
-            else:
-                raise ValueError("A user with these credentials already exists")
+            # The unique indexes are the source of truth for duplicates
+            field = _duplicate_key_field(e)
+            if field:
+                raise DuplicateUserError([field], duplicate_user_message(field, user_data.username, user_data.email, user_data.phone))
+            raise DuplicateUserError([], "A user with these credentials already exists")
     
         # Convert ObjectId to string for Pydantic model
         user_dict['_id'] = str(result.inserted_id)
@@ -104,6 +119,31 @@ class UserService:
         return new_user
 
     
+    async def find_conflicting_identifiers(self, username: str, email: str, phone: str) -> List[str]:
+        """Return which of username, email and phone are already registered, in one query"""
+        username_lower = normalize_username(username)
+        phones = list({phone, pad_phone(phone)})
+        cursor = self.collection.find(
+            {"$or": [
+                {"username_lower": username_lower},
+                {"email": email},
+                {"phone": {"$in": phones}}
+            ]},
+            {"_id": 0, "username_lower": 1, "email": 1, "phone": 1}
+        ).limit(3)
+        
+        conflicts = set()
+        async for user_doc in cursor:
+            if user_doc.get("username_lower") == username_lower:
+                conflicts.add("username")
+            if user_doc.get("email") == email:
+                conflicts.add("email")
+            if user_doc.get("phone") in phones:
+                conflicts.add("phone")
+        
+        # Report in the order the old sequential checks used
+        return [field for field in ("username", "email", "phone") if field in conflicts]
+
     async def get_user_by_email(self, email: str) -> Optional[User]:
         """Get user by email"""
         user_doc = await self.collection.find_one({"email": email})
@@ -161,6 +201,8 @@ class UserService:
             {"_id": ObjectId(user_id)},
             {"$set": {"approval_status": status, "updated_at": datetime.utcnow()}}
         )
+        if user.role == UserRole.CHEF:
+            invalidate_meal_catalog()
         
         # Notify user if approved or rejected
         if status in [ApprovalStatus.APPROVED, ApprovalStatus.REJECTED]:
@@ -194,6 +236,7 @@ class UserService:
             )
             
             if result.modified_count > 0:
+                invalidate_meal_catalog()
                 return await self.get_user_by_id(user_id)
             return None
         except Exception as e:
@@ -225,17 +268,94 @@ class UserService:
     async def get_user_by_username_case_insensitive(self, username: str) -> Optional[User]:
         """Get user by username (case-insensitive)"""
         try:
-            # Create case-insensitive regex pattern
-            user_doc = await self.collection.find_one({
-                "username": {"$regex": f"^{username}$", "$options": "i"}
-            })
-            if user_doc:
-                user_doc['_id'] = str(user_doc['_id'])
-                return User(**user_doc)
-            return None
+            # Point lookup on the indexed normalized username. Legacy users may
+            # differ only by case; prefer the one whose username matches exactly.
+            user_docs = await self.collection.find({
+                "username_lower": normalize_username(username)
+            }).limit(2).to_list(length=2)
+            if not user_docs:
+                return None
+            user_doc = next((doc for doc in user_docs if doc.get('username') == username), user_docs[0])
+            user_doc['_id'] = str(user_doc['_id'])
+            return User(**user_doc)
         except Exception as e:
             raise
 
+    async def migrate_username_lower(self, batch_size: int = 500) -> int:
+        """Backfill username_lower for users created before it was stored, then index it.
+
+        The index is unique only when no two users' usernames differ by case
+        alone; otherwise a plain index is used so every user can still log in.
+        """
+        # Once the unique index is in place there can be no collisions to look for
+        indexes = await self.collection.index_information()
+        if indexes.get("username_lower_1", {}).get("unique"):
+            collisions = {}
+        else:
+            collisions = await self._find_username_case_collisions()
+        if collisions:
+            sample = ", ".join(sorted(collisions)[:10])
+            logger.warning(
+                f"{len(collisions)} usernames are shared by users differing only by case "
+                f"({sample}); username_lower will not be unique"
+            )
+            await self._create_username_lower_index(unique=False)
+        
+        migrated = 0
+        cursor = self.collection.find({"username_lower": {"$exists": False}}, {"username": 1})
+        operations = []
+        async for user_doc in cursor:
+            operations.append(UpdateOne(
+                {"_id": user_doc["_id"]},
+                {"$set": {"username_lower": normalize_username(user_doc["username"])}}
+            ))
+            if len(operations) >= batch_size:
+                migrated += await self._write_username_lower_batch(operations)
+                operations = []
+        
+        if operations:
+            migrated += await self._write_username_lower_batch(operations)
+        
+        if migrated:
+            logger.info(f"Backfilled username_lower for {migrated} users")
+        
+        if not collisions:
+            await self._create_username_lower_index(unique=True)
+        return migrated
+
+    async def _find_username_case_collisions(self) -> Dict[str, int]:
+        """Lowercased usernames held by more than one user, with their counts (grouped server-side)"""
+        cursor = self.collection.aggregate([
+            {"$group": {"_id": {"$toLower": "$username"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}}
+        ], allowDiskUse=True)
+        return {row["_id"]: row["count"] async for row in cursor}
+
+    async def _write_username_lower_batch(self, operations: List[UpdateOne]) -> int:
+        """Write one backfill batch; a failed document is logged and the rest still land"""
+        try:
+            result = await self.collection.bulk_write(operations, ordered=False)
+            return result.modified_count
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                logger.warning(f"Could not backfill username_lower: {error.get('errmsg')}")
+            return e.details.get("nModified", 0)
+
+    async def _create_username_lower_index(self, unique: bool):
+        """Index username_lower, replacing a unique index that existing data no longer allows"""
+        try:
+            if unique:
+                await self.collection.create_index("username_lower", unique=True, sparse=True)
+                return
+            indexes = await self.collection.index_information()
+            if indexes.get("username_lower_1", {}).get("unique"):
+                await self.collection.drop_index("username_lower_1")
+            await self.collection.create_index("username_lower", name="username_lower_lookup")
+        except Exception as idx_error:
+            logger.warning(f"Could not create username_lower index: {idx_error}")
+            if unique:
+                await self._create_username_lower_index(unique=False)
+
     # Notification methods
     async def _notify_admins_new_registration(self, new_user: User):
         """Notify all admins about new user registration"""
@@ -4,6 +4,7 @@ from typing import Optional, Tuple
 from datetime import datetime, timedelta
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 from app.models.verification import (
     VerificationCode, VerificationType, VerificationMethod, 
     VerificationStatus, AccountRestriction
@@ -29,6 +30,7 @@ class VerificationService:
         self.RESEND_COOLDOWN_MINUTES = 5
         self.MAX_RESEND_ATTEMPTS = 3
         self.RESTRICTION_DAYS = 4
+        self.MAX_VERIFY_ATTEMPTS = 5
     
     def generate_code(self) -> str:
         """Generate a 6-digit verification code"""
@@ -150,57 +152,81 @@ class VerificationService:
         code: str, 
         type: VerificationType
     ) -> Tuple[bool, str, Optional[dict]]:
-        """Verify the code"""
+        """Verify the code in a single conditional update.
+
+        The attempt counter is incremented and, when the code matches, the record
+        is marked verified in the same atomic operation, so concurrent guesses
+        cannot exceed MAX_VERIFY_ATTEMPTS.
+        """
         try:
-            # Find the verification record
-            verification = await self.verifications.find_one({
-                "email": email,
-                "phone": phone,
-                "type": type,
-                "status": VerificationStatus.PENDING
-            })
-            
-            if not verification:
-                return False, "No pending verification found", None
-            
-            # Check expiry
-            if datetime.utcnow() > verification['expires_at']:
-                await self.verifications.update_one(
-                    {"_id": verification['_id']},
-                    {"$set": {"status": VerificationStatus.EXPIRED}}
-                )
-                return False, "Verification code has expired", None
-            
-            # Increment attempts
-            attempts = verification.get('attempts', 0) + 1
-            await self.verifications.update_one(
-                {"_id": verification['_id']},
-                {"$inc": {"attempts": 1}}
+            now = datetime.utcnow()
+            code_matches = {"$eq": ["$code", {"$literal": code}]}
+            verification = await self.verifications.find_one_and_update(
+                {
+                    "email": email,
+                    "phone": phone,
+                    "type": type,
+                    "status": VerificationStatus.PENDING,
+                    "expires_at": {"$gt": now},
+                    "attempts": {"$lt": self.MAX_VERIFY_ATTEMPTS}
+                },
+                [{"$set": {
+                    "attempts": {"$add": [{"$ifNull": ["$attempts", 0]}, 1]},
+                    "status": {"$cond": [code_matches, VerificationStatus.VERIFIED.value, "$status"]},
+                    "verified_at": {"$cond": [code_matches, now, "$$REMOVE"]}
+                }}],
+                sort=[("created_at", -1)],
+                return_document=ReturnDocument.AFTER
             )
             
-            # Check code
-            if verification['code'] != code:
-                if attempts >= 5:
-                    await self._create_restriction(email, phone, "Too many incorrect verification attempts")
-                    return False, "Too many incorrect attempts. Account restricted", None
-                return False, f"Invalid code. {5 - attempts} attempts remaining", None
+            if not verification:
+                return await self._explain_unverifiable(email, phone, type, now)
             
-            # Mark as verified
-            await self.verifications.update_one(
-                {"_id": verification['_id']},
-                {"$set": {
-                    "status": VerificationStatus.VERIFIED,
-                    "verified_at": datetime.utcnow()
-                }}
-            )
+            if verification['status'] == VerificationStatus.VERIFIED:
+                # Return registration data if available
+                return True, "Code verified successfully", verification.get('registration_data')
             
-            # Return registration data if available
-            return True, "Code verified successfully", verification.get('registration_data')
+            attempts = verification['attempts']
+            if attempts >= self.MAX_VERIFY_ATTEMPTS:
+                await self._create_restriction(email, phone, "Too many incorrect verification attempts")
+                return False, "Too many incorrect attempts. Account restricted", None
+            return False, f"Invalid code. {self.MAX_VERIFY_ATTEMPTS - attempts} attempts remaining", None
             
         except Exception as e:
             logger.error(f"Error verifying code: {str(e)}")
             return False, "Verification failed", None
     
+    async def _explain_unverifiable(
+        self,
+        email: str,
+        phone: str,
+        type: VerificationType,
+        now: datetime
+    ) -> Tuple[bool, str, Optional[dict]]:
+        """Work out why no pending code could be checked (only on the failure path)"""
+        verification = await self.verifications.find_one(
+            {
+                "email": email,
+                "phone": phone,
+                "type": type,
+                "status": VerificationStatus.PENDING
+            },
+            {"expires_at": 1, "attempts": 1},
+            sort=[("created_at", -1)]
+        )
+        
+        if not verification:
+            return False, "No pending verification found", None
+        
+        if now > verification['expires_at']:
+            await self.verifications.update_one(
+                {"_id": verification['_id'], "status": VerificationStatus.PENDING},
+                {"$set": {"status": VerificationStatus.EXPIRED}}
+            )
+            return False, "Verification code has expired", None
+        
+        return False, "Too many incorrect attempts. Account restricted", None
+    
     async def resend_code(self, email: str, phone: str, type: VerificationType) -> Tuple[bool, str]:
         """Resend verification code"""
         data = VerificationCodeCreate(
@@ -355,9 +381,48 @@ If you didn't request this, please ignore this message.
             logger.error(f"Failed to send WhatsApp to {phone}: {str(e)}")
             return False
     
-    async def cleanup_expired_codes(self):
+    async def cleanup_expired_codes(self) -> int:
         """Clean up expired verification codes"""
-        await self.verifications.delete_many({
+        result = await self.verifications.delete_many({
             "status": VerificationStatus.PENDING,
             "expires_at": {"$lt": datetime.utcnow()}
         })
+        return result.deleted_count
+    
+    async def delete_oversized_password_batch(
+        self,
+        after_id: Optional[ObjectId],
+        batch_size: int
+    ) -> Tuple[int, int, Optional[ObjectId]]:
+        """Delete one batch of pending registrations whose password exceeds bcrypt's 72 bytes.
+
+        The byte-length check runs in the query. Returns (matched, deleted, last_id);
+        last_id is None once no matching records remain after after_id.
+        """
+        password = "$registration_data.password"
+        query = {
+            "status": VerificationStatus.PENDING,
+            "$expr": {"$gt": [
+                {"$cond": [{"$eq": [{"$type": password}, "string"]}, {"$strLenBytes": password}, 0]},
+                72
+            ]}
+        }
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        
+        ids = [
+            doc["_id"] async for doc in
+            self.verifications.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)
+        ]
+        if not ids:
+            return 0, 0, None
+        
+        result = await self.verifications.delete_many({"_id": {"$in": ids}})
+        return len(ids), result.deleted_count, ids[-1]
+    
+    async def cleanup_lapsed_restrictions(self) -> int:
+        """Clean up account restrictions that have ended"""
+        result = await self.restrictions.delete_many({
+            "restricted_until": {"$lte": datetime.utcnow()}
+        })
+        return result.deleted_count
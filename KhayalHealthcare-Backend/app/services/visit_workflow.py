@@ -0,0 +1,814 @@
+from typing import Dict, List, Optional, Set, Type
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from app.models.user import CareVisitRequest, PsychologistVisitRequest, CareVisitRequestStatus, UserRole, ApprovalStatus, User
+from app.services.notification import send_email_async, send_whatsapp_async
+from app.utils.realtime import status_hub, ADMIN_TOPIC
+from datetime import datetime, timedelta
+from decouple import config
+import logging
+import asyncio
+
+logger = logging.getLogger(__name__)
+
+# MongoDB error code returned when transactions are used against a standalone server
+ILLEGAL_OPERATION_CODE = 20
+
+# Length of one appointment; two appointments for a provider closer than this conflict
+VISIT_SLOT_MINUTES = config('VISIT_SLOT_MINUTES', default=60, cast=int)
+
+# Which statuses a visit request may move to from each status.
+# Re-assignment is allowed until the visit starts, and after a cancellation.
+ALLOWED_TRANSITIONS: Dict[CareVisitRequestStatus, Set[CareVisitRequestStatus]] = {
+    CareVisitRequestStatus.PENDING: {
+        CareVisitRequestStatus.ASSIGNED,
+        CareVisitRequestStatus.CANCELLED,
+    },
+    CareVisitRequestStatus.ASSIGNED: {
+        CareVisitRequestStatus.ASSIGNED,
+        CareVisitRequestStatus.ACCEPTED,
+        CareVisitRequestStatus.IN_PROGRESS,
+        CareVisitRequestStatus.CANCELLED,
+    },
+    CareVisitRequestStatus.ACCEPTED: {
+        CareVisitRequestStatus.ASSIGNED,
+        CareVisitRequestStatus.IN_PROGRESS,
+        CareVisitRequestStatus.CANCELLED,
+    },
+    CareVisitRequestStatus.IN_PROGRESS: {
+        CareVisitRequestStatus.COMPLETED,
+        CareVisitRequestStatus.CANCELLED,
+    },
+    CareVisitRequestStatus.COMPLETED: set(),
+    CareVisitRequestStatus.CANCELLED: {
+        CareVisitRequestStatus.ASSIGNED,
+    },
+}
+
+# Status changes that subscribers and admins are notified about
+NOTIFIED_STATUSES = {
+    CareVisitRequestStatus.ACCEPTED,
+    CareVisitRequestStatus.IN_PROGRESS,
+    CareVisitRequestStatus.COMPLETED,
+    CareVisitRequestStatus.CANCELLED,
+}
+
+# Statuses in which an appointment occupies the provider's schedule
+SCHEDULED_STATUSES = [
+    CareVisitRequestStatus.ASSIGNED,
+    CareVisitRequestStatus.ACCEPTED,
+    CareVisitRequestStatus.IN_PROGRESS,
+]
+
+# Subscriber profile fields embedded in provider assignment listings
+ASSIGNMENT_SUBSCRIBER_FIELDS = ["_id", "name", "phone", "email", "address", "city", "age", "previous_illness"]
+
+def statuses_leading_to(status: CareVisitRequestStatus) -> List[CareVisitRequestStatus]:
+    """Statuses from which a request may move to `status`"""
+    return [source for source, targets in ALLOWED_TRANSITIONS.items() if status in targets]
+
+class VisitRequestNotFound(ValueError):
+    """The visit request does not exist"""
+
+class VisitRequestNotAssigned(ValueError):
+    """The visit request is not assigned to the provider acting on it"""
+
+class InvalidStatusTransition(ValueError):
+    """The visit request cannot move from its current status to the requested one"""
+
+class ScheduleConflict(ValueError):
+    """The provider already has an appointment overlapping the requested time"""
+
+    def __init__(self, message: str, conflicting_request_id: Optional[str] = None):
+        super().__init__(message)
+        self.conflicting_request_id = conflicting_request_id
+
+class VisitType:
+    """Everything that differs between kinds of visit request.
+
+    Adding a new provider type means adding one of these; the workflow
+    engine, state machine and notifications are shared.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        collection: str,
+        provider_field: str,
+        provider_role: UserRole,
+        model: Type[BaseModel],
+        texts: Dict[str, str],
+        status_messages: Dict[CareVisitRequestStatus, str],
+        include_subscriber_address: bool = False
+    ):
+        self.key = key
+        self.collection = collection
+        self.provider_field = provider_field
+        self.provider_role = provider_role
+        self.model = model
+        self.texts = texts
+        self.status_messages = status_messages
+        self.include_subscriber_address = include_subscriber_address
+
+CARE_VISIT = VisitType(
+    key="care",
+    collection="care_visit_requests",
+    provider_field="caretaker_id",
+    provider_role=UserRole.CARETAKER,
+    model=CareVisitRequest,
+    include_subscriber_address=True,
+    texts={
+        "request_label": "care visit",
+        "request_title": "Care",
+        "provider_noun": "caretaker",
+        "provider_title": "Caretaker",
+        "provider_prefix": "",
+        "provider_default_name": "Caretaker",
+        "session_noun": "visit",
+        "appointment_label": "care visit appointment",
+        "confirmed_subject": "Care Visit Appointment Confirmed - Khayal Healthcare",
+        "confirmed_whatsapp_title": "Care Visit Confirmed",
+        "status_subject": "Care Visit Status Update - Khayal Healthcare",
+        "status_whatsapp_title": "Care Visit Update",
+        "status_default": "Your care visit status: {status}",
+        "admin_status_subject": "Care Visit Status Changed - Request {request_id}",
+        "admin_status_label": "The care visit",
+        "admin_status_whatsapp_title": "Care Visit Status Changed",
+        "provider_status_subject": "Care Visit Status Update - {status}",
+        "provider_status_body": "The care visit for {subscriber} has been marked as: {status}.",
+        "provider_status_whatsapp_title": "Care Visit Update",
+    },
+    status_messages={
+        CareVisitRequestStatus.ACCEPTED: "Your care visit has been accepted by the caretaker.",
+        CareVisitRequestStatus.IN_PROGRESS: "Your care visit session has started.",
+        CareVisitRequestStatus.COMPLETED: "Your care visit session has been completed.",
+        CareVisitRequestStatus.CANCELLED: "Your care visit appointment has been cancelled.",
+    },
+)
+
+PSYCHOLOGIST_VISIT = VisitType(
+    key="psychologist",
+    collection="psychologist_visit_requests",
+    provider_field="psychologist_id",
+    provider_role=UserRole.PSYCHOLOGIST,
+    model=PsychologistVisitRequest,
+    texts={
+        "request_label": "psychology visit",
+        "request_title": "Psychology",
+        "provider_noun": "psychologist",
+        "provider_title": "Psychologist",
+        "provider_prefix": "Dr. ",
+        "provider_default_name": "Doctor",
+        "session_noun": "session",
+        "appointment_label": "psychology appointment",
+        "confirmed_subject": "Psychology Appointment Confirmed - Khayal Healthcare",
+        "confirmed_whatsapp_title": "Appointment Confirmed",
+        "status_subject": "Appointment Status Update - Khayal Healthcare",
+        "status_whatsapp_title": "Appointment Update",
+        "status_default": "Your appointment status: {status}",
+        "admin_status_subject": "Psychology Appointment Status Changed - Request {request_id}",
+        "admin_status_label": "The psychology appointment",
+        "admin_status_whatsapp_title": "Appointment Status Changed",
+        "provider_status_subject": "Session Status Update - {status}",
+        "provider_status_body": "The session for {subscriber} has been marked as: {status}.",
+        "provider_status_whatsapp_title": "Session Update",
+    },
+    status_messages={
+        CareVisitRequestStatus.ACCEPTED: "Your appointment has been accepted by the psychologist.",
+        CareVisitRequestStatus.IN_PROGRESS: "Your psychology session has started.",
+        CareVisitRequestStatus.COMPLETED: "Your psychology session has been completed.",
+        CareVisitRequestStatus.CANCELLED: "Your psychology appointment has been cancelled.",
+    },
+)
+
+VISIT_TYPES: Dict[str, VisitType] = {
+    CARE_VISIT.key: CARE_VISIT,
+    PSYCHOLOGIST_VISIT.key: PSYCHOLOGIST_VISIT,
+}
+
+class VisitWorkflow:
+    """Create, assign and move visit requests of one VisitType through their states.
+
+    Every transition is a single conditional find_one_and_update that returns
+    the post-image, so the state check, the write and the data needed for
+    notifications come from one round trip.
+    """
+
+    # Flipped off the first time the server rejects a transaction (standalone mongod)
+    transactions_supported = True
+
+    def __init__(self, db: AsyncIOMotorDatabase, visit_type: VisitType):
+        self.db = db
+        self.visit_type = visit_type
+        self.collection = db[visit_type.collection]
+        self.users = db.users
+        # One document per provider, written by every assignment to serialize them
+        self.schedule_locks = db.provider_schedule_locks
+
+    # Reads
+    def _to_model(self, request_doc: dict) -> BaseModel:
+        """Convert ObjectId fields to strings and build the request model"""
+        request_doc['_id'] = str(request_doc['_id'])
+        request_doc['subscriber_id'] = str(request_doc['subscriber_id'])
+        provider_field = self.visit_type.provider_field
+        if request_doc.get(provider_field):
+            request_doc[provider_field] = str(request_doc[provider_field])
+        return self.visit_type.model(**request_doc)
+
+    async def find(self, query: dict) -> List[BaseModel]:
+        return [self._to_model(doc) async for doc in self.collection.find(query)]
+
+    async def get_all(self) -> List[BaseModel]:
+        return await self.find({})
+
+    async def get_by_subscriber(self, subscriber_id: str) -> List[BaseModel]:
+        return await self.find({"subscriber_id": ObjectId(subscriber_id)})
+
+    async def get_by_provider(self, provider_id: str) -> List[BaseModel]:
+        return await self.find({self.visit_type.provider_field: ObjectId(provider_id)})
+
+    async def get_by_id(self, request_id: str) -> Optional[BaseModel]:
+        try:
+            request_doc = await self.collection.find_one({"_id": ObjectId(request_id)})
+            return self._to_model(request_doc) if request_doc else None
+        except Exception as e:
+            logger.error(f"Error getting {self.visit_type.key} visit request {request_id}: {str(e)}")
+            return None
+
+    def _provider_match(
+        self,
+        provider_id: str,
+        statuses: Optional[List[CareVisitRequestStatus]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> dict:
+        query = {self.visit_type.provider_field: ObjectId(provider_id)}
+        if statuses:
+            query["status"] = {"$in": list(statuses)}
+        if start or end:
+            window = {}
+            if start:
+                window["$gte"] = start
+            if end:
+                window["$lt"] = end
+            query["appointment_date_time"] = window
+        return query
+
+    async def get_provider_assignments(
+        self,
+        provider_id: str,
+        statuses: Optional[List[CareVisitRequestStatus]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List[dict]:
+        """A provider's requests with the subscriber's profile embedded, in one aggregation"""
+        cursor = self.collection.aggregate([
+            {"$match": self._provider_match(provider_id, statuses, start, end)},
+            {"$sort": {"appointment_date_time": 1, "_id": 1}},
+            {"$lookup": {
+                "from": "users",
+                "localField": "subscriber_id",
+                "foreignField": "_id",
+                "as": "subscriber"
+            }},
+            # Keep only the profile fields the dashboards show
+            {"$set": {"subscriber": {"$let": {
+                "vars": {"subscriber": {"$arrayElemAt": ["$subscriber", 0]}},
+                "in": {field: f"$$subscriber.{field}" for field in ASSIGNMENT_SUBSCRIBER_FIELDS}
+            }}}}
+        ])
+
+        assignments = []
+        async for request_doc in cursor:
+            subscriber = request_doc.pop("subscriber", None)
+            assignment = self._to_model(request_doc).dict(by_alias=True)
+            if subscriber and subscriber.get("_id"):
+                assignment["subscriber"] = {"id": str(subscriber["_id"])}
+                assignment["subscriber"].update(
+                    (field, subscriber.get(field)) for field in ASSIGNMENT_SUBSCRIBER_FIELDS if field != "_id"
+                )
+            else:
+                assignment["subscriber"] = None
+            assignments.append(assignment)
+        return assignments
+
+    async def get_provider_subscribers(
+        self,
+        provider_id: str,
+        statuses: Optional[List[CareVisitRequestStatus]] = None
+    ) -> List[dict]:
+        """Distinct subscribers with requests assigned to a provider, in one aggregation"""
+        cursor = self.collection.aggregate([
+            {"$match": self._provider_match(provider_id, statuses)},
+            {"$group": {"_id": "$subscriber_id"}},
+            {"$lookup": {
+                "from": "users",
+                "localField": "_id",
+                "foreignField": "_id",
+                "as": "subscriber"
+            }},
+            {"$unwind": "$subscriber"},
+            {"$project": {"name": "$subscriber.name"}},
+            {"$sort": {"name": 1}}
+        ])
+        return [{"id": str(row["_id"]), "name": row.get("name")} async for row in cursor]
+
+    # Transitions
+    async def create(self, request_data: BaseModel) -> BaseModel:
+        """Create a pending request and notify admins"""
+        request_dict = request_data.dict()
+        request_dict['subscriber_id'] = ObjectId(request_data.subscriber_id)
+        request_dict['status'] = CareVisitRequestStatus.PENDING
+        request_dict['created_at'] = datetime.utcnow()
+
+        result = await self.collection.insert_one(request_dict)
+        request_dict['_id'] = result.inserted_id
+
+        # Notify all admins - Don't wait for this to complete
+        asyncio.create_task(self._notify_admins_new_request(dict(request_dict)))
+
+        return self._to_model(request_dict)
+
+    async def assign(self, request_id: str, provider_id: str, appointment_datetime: datetime) -> dict:
+        """Assign a provider and appointment time; returns the updated request document"""
+        if not ObjectId.is_valid(request_id):
+            raise ValueError(f"Invalid request ID: {request_id}")
+        if not ObjectId.is_valid(provider_id):
+            raise ValueError(f"Invalid {self.visit_type.texts['provider_noun']} ID: {provider_id}")
+
+        request = None
+        if VisitWorkflow.transactions_supported:
+            try:
+                async with await self.db.client.start_session() as session:
+                    request = await session.with_transaction(
+                        lambda txn_session: self._claim_and_assign(
+                            request_id, provider_id, appointment_datetime, txn_session
+                        )
+                    )
+            except DuplicateKeyError:
+                # Two first-ever assignments for the provider created the lock together
+                raise ScheduleConflict(
+                    f"{self.visit_type.texts['provider_title']} is being scheduled by another request, please retry"
+                )
+            except OperationFailure as e:
+                if e.code != ILLEGAL_OPERATION_CODE:
+                    raise
+                logger.warning("MongoDB transactions unavailable, checking provider schedules without a transaction")
+                VisitWorkflow.transactions_supported = False
+
+        if not VisitWorkflow.transactions_supported:
+            request = await self._claim_and_assign(request_id, provider_id, appointment_datetime)
+
+        if not request:
+            await self._raise_transition_error(request_id, CareVisitRequestStatus.ASSIGNED)
+
+        self._publish_status(request)
+        asyncio.create_task(self._notify_assignment(request))
+        return request
+
+    async def _claim_and_assign(
+        self,
+        request_id: str,
+        provider_id: str,
+        appointment_datetime: datetime,
+        session=None
+    ) -> Optional[dict]:
+        """Check the provider's schedule and assign the request.
+
+        Inside a transaction the provider's lock document is written first, so
+        concurrent assignments of the same provider conflict; the retried one
+        then sees the committed appointment and fails the schedule check.
+        """
+        if session:
+            await self.schedule_locks.update_one(
+                {"_id": f"{self.visit_type.key}:{provider_id}"},
+                {"$set": {"updated_at": datetime.utcnow()}},
+                upsert=True,
+                session=session
+            )
+
+        conflict = await self.find_schedule_conflict(
+            provider_id, appointment_datetime, exclude_request_id=request_id, session=session
+        )
+        if conflict:
+            raise ScheduleConflict(
+                f"{self.visit_type.texts['provider_title']} already has an appointment at "
+                f"{conflict['appointment_date_time'].isoformat()}",
+                str(conflict['_id'])
+            )
+
+        return await self.collection.find_one_and_update(
+            {
+                "_id": ObjectId(request_id),
+                "status": {"$in": statuses_leading_to(CareVisitRequestStatus.ASSIGNED)}
+            },
+            {"$set": {
+                self.visit_type.provider_field: ObjectId(provider_id),
+                "appointment_date_time": appointment_datetime,
+                "status": CareVisitRequestStatus.ASSIGNED
+            }},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+
+    async def update_status(
+        self,
+        request_id: str,
+        status: CareVisitRequestStatus,
+        provider_id: Optional[str] = None
+    ) -> dict:
+        """Move a request to `status`; when provider_id is given it must be the assigned provider"""
+        if not ObjectId.is_valid(request_id):
+            raise VisitRequestNotFound(f"Request not found: {request_id}")
+
+        query = {
+            "_id": ObjectId(request_id),
+            "status": {"$in": statuses_leading_to(status)}
+        }
+        if provider_id:
+            query[self.visit_type.provider_field] = ObjectId(provider_id)
+
+        request = await self.collection.find_one_and_update(
+            query,
+            {"$set": {"status": status, "status_updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not request:
+            await self._raise_transition_error(request_id, status, provider_id)
+
+        self._publish_status(request)
+        if status in NOTIFIED_STATUSES:
+            asyncio.create_task(self._notify_status_change(request, status))
+        return request
+
+    # Provider schedules
+    def _schedule_query(self, start: datetime, end: datetime) -> dict:
+        """Scheduled appointments overlapping [start, end), given each lasts one slot.
+
+        Together with the (provider, appointment_date_time) index this is a
+        bounded range scan per provider rather than a scan of all requests.
+        """
+        return {
+            "status": {"$in": SCHEDULED_STATUSES},
+            "appointment_date_time": {
+                "$gt": start - timedelta(minutes=VISIT_SLOT_MINUTES),
+                "$lt": end
+            }
+        }
+
+    async def find_schedule_conflict(
+        self,
+        provider_id: str,
+        appointment_datetime: datetime,
+        exclude_request_id: Optional[str] = None,
+        session=None
+    ) -> Optional[dict]:
+        """The provider's scheduled request overlapping a slot at appointment_datetime, if any"""
+        query = self._schedule_query(
+            appointment_datetime, appointment_datetime + timedelta(minutes=VISIT_SLOT_MINUTES)
+        )
+        query[self.visit_type.provider_field] = ObjectId(provider_id)
+        if exclude_request_id:
+            query["_id"] = {"$ne": ObjectId(exclude_request_id)}
+        return await self.collection.find_one(query, {"appointment_date_time": 1}, session=session)
+
+    async def get_busy_provider_ids(self, provider_ids: List[ObjectId], start: datetime, end: datetime) -> Set[ObjectId]:
+        """Which of the given providers have an appointment overlapping [start, end)"""
+        if not provider_ids:
+            return set()
+        provider_field = self.visit_type.provider_field
+        query = self._schedule_query(start, end)
+        query[provider_field] = {"$in": provider_ids}
+        cursor = self.collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": f"${provider_field}"}}
+        ])
+        return {row["_id"] async for row in cursor}
+
+    async def get_approved_providers(self) -> List[dict]:
+        return await self.users.find({
+            "role": self.visit_type.provider_role,
+            "approval_status": ApprovalStatus.APPROVED
+        }).to_list(None)
+
+    async def get_free_providers(self, start: datetime, end: Optional[datetime] = None) -> List[User]:
+        """Approved providers with no appointment overlapping [start, end); end defaults to one slot"""
+        end = end or start + timedelta(minutes=VISIT_SLOT_MINUTES)
+        providers = await self.get_approved_providers()
+        busy = await self.get_busy_provider_ids([p['_id'] for p in providers], start, end)
+
+        free = []
+        for provider in providers:
+            if provider['_id'] in busy:
+                continue
+            provider['_id'] = str(provider['_id'])
+            free.append(User(**provider))
+        return free
+
+    async def _raise_transition_error(
+        self,
+        request_id: str,
+        status: CareVisitRequestStatus,
+        provider_id: Optional[str] = None
+    ):
+        """Explain why a conditional transition matched nothing (failure path only)"""
+        provider_field = self.visit_type.provider_field
+        current = await self.collection.find_one(
+            {"_id": ObjectId(request_id)}, {"status": 1, provider_field: 1}
+        )
+        if not current:
+            raise VisitRequestNotFound(f"Request not found: {request_id}")
+        if provider_id and str(current.get(provider_field)) != str(provider_id):
+            raise VisitRequestNotAssigned("You can only update requests assigned to you")
+        raise InvalidStatusTransition(
+            f"Cannot change status from {current['status']} to {status.value}"
+        )
+
+    def _publish_status(self, request: dict):
+        """Push a status transition to the subscriber's, provider's and admins' live feeds"""
+        provider_id = request.get(self.visit_type.provider_field)
+        recipients = [request['subscriber_id'], ADMIN_TOPIC]
+        if provider_id:
+            recipients.append(provider_id)
+        status_hub.publish(recipients, {
+            "type": "visit_request.status",
+            "kind": self.visit_type.key,
+            "request_id": str(request['_id']),
+            "status": request['status'],
+            "provider_id": str(provider_id) if provider_id else None,
+            "appointment_date_time": request.get('appointment_date_time'),
+            "updated_at": datetime.utcnow()
+        })
+
+    # Notifications
+    async def _get_people(self, request: dict) -> Dict[str, Optional[dict]]:
+        """Subscriber and assigned provider of a request in one query"""
+        provider_id = request.get(self.visit_type.provider_field)
+        ids = [request['subscriber_id']] + ([provider_id] if provider_id else [])
+        people = {doc['_id']: doc async for doc in self.users.find({"_id": {"$in": ids}})}
+        return {
+            "subscriber": people.get(request['subscriber_id']),
+            "provider": people.get(provider_id) if provider_id else None
+        }
+
+    async def _get_admins(self) -> List[dict]:
+        return await self.users.find(
+            {"role": UserRole.ADMIN}, {"email": 1, "phone": 1}
+        ).to_list(None)
+
+    def _queue_email(self, person: Optional[dict], subject: str, body: str, recipient_type: str):
+        if person and person.get('email'):
+            self._send_email_notification(person['email'], subject, body, f"{recipient_type} {person['email']}")
+
+    def _queue_whatsapp(self, person: Optional[dict], message: str, recipient_type: str):
+        if person and person.get('phone'):
+            self._send_whatsapp_notification(person['phone'], message, f"{recipient_type} {person['phone']}")
+
+    async def _notify_admins_new_request(self, request: dict):
+        """Notify all admins about a new visit request"""
+        try:
+            t = self.visit_type.texts
+            subscriber, admins = await asyncio.gather(
+                self.users.find_one({"_id": request['subscriber_id']}),
+                self._get_admins()
+            )
+            if not admins:
+                logger.warning("No admin users found to notify")
+                return
+
+            subscriber_name = subscriber.get('name', 'Unknown') if subscriber else 'Unknown'
+            subscriber_phone = subscriber.get('phone', 'Unknown') if subscriber else 'Unknown'
+
+            subject = f"New {t['request_title']} Visit Request - Khayal Healthcare"
+            email_body = f"""
+Dear Admin,
+
+A new {t['request_label']} request has been submitted:
+
+Subscriber Details:
+- Name: {subscriber_name}
+- Phone: {subscriber_phone}
+- Request ID: {request['_id']}
+
+Please log in to the admin portal to review and assign a {t['provider_noun']}.
+
+Best regards,
+Khayal Healthcare System
+"""
+
+            whatsapp_message = f"""🔔 *New {t['request_title']} Visit Request*
+
+*Subscriber:* {subscriber_name}
+*Phone:* {subscriber_phone}
+*Request ID:* {request['_id']}
+
+Please assign a {t['provider_noun']} through the admin portal.
+
+- Khayal Healthcare"""
+
+            for admin in admins:
+                self._queue_email(admin, subject, email_body, "admin")
+                self._queue_whatsapp(admin, whatsapp_message, "admin")
+
+        except Exception as e:
+            logger.error(f"Error in admin {self.visit_type.key} request notifications: {str(e)}")
+
+    async def _notify_assignment(self, request: dict):
+        """Notify the provider and subscriber about an assignment"""
+        try:
+            t = self.visit_type.texts
+            people = await self._get_people(request)
+            subscriber, provider = people["subscriber"], people["provider"]
+            formatted_date = request['appointment_date_time'].strftime("%B %d, %Y at %I:%M %p")
+
+            subscriber_name = subscriber.get('name', 'Unknown') if subscriber else 'Unknown'
+            subscriber_phone = subscriber.get('phone', 'Unknown') if subscriber else 'Unknown'
+            provider_name = f"{t['provider_prefix']}{provider.get('name', 'Unknown')}" if provider else 'Unknown'
+
+            # Notify provider
+            if provider:
+                address_lines = ""
+                address_whatsapp = ""
+                if self.visit_type.include_subscriber_address:
+                    address = subscriber.get('address', 'Not provided') if subscriber else 'Not provided'
+                    city = subscriber.get('city', 'Not provided') if subscriber else 'Not provided'
+                    address_lines = f"- Address: {address}\n- City: {city}\n"
+                    address_whatsapp = f"*Address:* {address}\n"
+
+                provider_subject = "New Patient Assignment - Khayal Healthcare"
+                provider_email_body = f"""
+Dear {t['provider_prefix']}{provider.get('name', t['provider_default_name'])},
+
+You have been assigned a new patient:
+
+Patient Details:
+- Name: {subscriber_name}
+- Phone: {subscriber_phone}
+{address_lines}- Appointment: {formatted_date}
+
+Please prepare for the {t['session_noun']} and contact the patient if needed.
+
+Best regards,
+Khayal Healthcare
+"""
+
+                provider_whatsapp = f"""🔔 *New Patient Assignment*
+
+*Patient:* {subscriber_name}
+*Phone:* {subscriber_phone}
+{address_whatsapp}*Appointment:* {formatted_date}
+
+Please prepare for the {t['session_noun']}.
+
+- Khayal Healthcare"""
+
+                self._queue_email(provider, provider_subject, provider_email_body, t['provider_noun'])
+                self._queue_whatsapp(provider, provider_whatsapp, t['provider_noun'])
+
+            # Notify subscriber
+            if subscriber:
+                sub_email_body = f"""
+Dear {subscriber.get('name', 'Valued Customer')},
+
+Your {t['appointment_label']} has been confirmed:
+
+{t['provider_title']}: {provider_name}
+Date & Time: {formatted_date}
+
+The {t['provider_noun']} will contact you shortly. Please be available at the scheduled time.
+
+Best regards,
+Khayal Healthcare
+"""
+
+                sub_whatsapp = f"""✔️ *{t['confirmed_whatsapp_title']}*
+
+*{t['provider_title']}:* {provider_name}
+*Date & Time:* {formatted_date}
+
+Please be available at the scheduled time.
+
+- Khayal Healthcare"""
+
+                self._queue_email(subscriber, t['confirmed_subject'], sub_email_body, "subscriber")
+                self._queue_whatsapp(subscriber, sub_whatsapp, "subscriber")
+
+        except Exception as e:
+            logger.error(f"Error in {self.visit_type.key} assignment notifications: {str(e)}")
+
+    async def _notify_status_change(self, request: dict, new_status: CareVisitRequestStatus):
+        """Notify subscriber, admins and (for visit progress) the provider about a status change"""
+        try:
+            t = self.visit_type.texts
+            people, admins = await asyncio.gather(self._get_people(request), self._get_admins())
+            subscriber, provider = people["subscriber"], people["provider"]
+            if not subscriber:
+                logger.warning(f"Subscriber not found for request {request['_id']}")
+                return
+
+            subscriber_name = subscriber.get('name', 'Unknown')
+            provider_name = provider.get('name', 'Not Assigned') if provider else 'Not Assigned'
+            message = self.visit_type.status_messages.get(
+                new_status, t['status_default'].format(status=new_status)
+            )
+
+            # Notify subscriber
+            email_body = f"""
+Dear {subscriber.get('name', 'Valued Customer')},
+
+{message}
+
+For any queries, please contact support.
+
+Best regards,
+Khayal Healthcare
+"""
+
+            whatsapp_msg = f"""🔔 *{t['status_whatsapp_title']}*
+
+{message}
+
+For any queries, please contact support.
+
+- Khayal Healthcare"""
+
+            self._queue_email(subscriber, t['status_subject'], email_body, "subscriber")
+            self._queue_whatsapp(subscriber, whatsapp_msg, "subscriber")
+
+            # Notify admins
+            admin_subject = t['admin_status_subject'].format(request_id=request['_id'])
+            admin_body = f"""
+Dear Admin,
+
+{t['admin_status_label']} with Request ID {request['_id']} has changed status to: {new_status}.
+
+Subscriber: {subscriber_name}
+{t['provider_title']}: {provider_name}
+
+Please review if any action is needed.
+
+Best regards,
+Khayal Healthcare System
+"""
+
+            admin_whatsapp_msg = f"""🔔 *{t['admin_status_whatsapp_title']}*
+
+Request ID: {request['_id']}
+Subscriber: {subscriber_name}
+{t['provider_title']}: {provider_name}
+New Status: {new_status}
+
+Please review accordingly.
+
+- Khayal Healthcare"""
+
+            for admin in admins:
+                self._queue_email(admin, admin_subject, admin_body, "admin")
+                self._queue_whatsapp(admin, admin_whatsapp_msg, "admin")
+
+            # Notify provider if status is relevant to them
+            if provider and new_status in [CareVisitRequestStatus.IN_PROGRESS, CareVisitRequestStatus.COMPLETED]:
+                provider_subject = t['provider_status_subject'].format(status=new_status)
+                provider_body = f"""
+Dear {t['provider_prefix']}{provider.get('name', t['provider_default_name'])},
+
+{t['provider_status_body'].format(subscriber=subscriber_name, status=new_status)}
+
+Thank you for your service.
+
+Best regards,
+Khayal Healthcare
+"""
+                provider_whatsapp = f"""🔔 *{t['provider_status_whatsapp_title']}*
+
+Patient: {subscriber_name}
+Status: {new_status}
+
+Thank you for your service.
+
+- Khayal Healthcare"""
+
+                self._queue_email(provider, provider_subject, provider_body, t['provider_noun'])
+                self._queue_whatsapp(provider, provider_whatsapp, t['provider_noun'])
+
+        except Exception as e:
+            logger.error(f"Error in {self.visit_type.key} status change notification: {str(e)}")
+
+    def _send_email_notification(self, email: str, subject: str, body: str, recipient_type: str):
+        """Queue email notification without delaying the request."""
+        try:
+            asyncio.create_task(send_email_async(email, subject, body, timeout=3.0))
+            logger.info(f"Queued email notification to {recipient_type}")
+        except Exception as e:
+            logger.error(f"Failed to queue email to {recipient_type}: {str(e)}")
+
+    def _send_whatsapp_notification(self, phone: str, message: str, recipient_type: str):
+        """Queue WhatsApp notification without delaying the request."""
+        try:
+            asyncio.create_task(send_whatsapp_async(phone, message, timeout=3.0))
+            logger.info(f"Queued WhatsApp notification to {recipient_type}")
+        except Exception as e:
+            logger.error(f"Failed to queue WhatsApp to {recipient_type}: {str(e)}")
@@ -3,6 +3,11 @@
 from app.utils.auth import (
     verify_password,
     get_password_hash,
+    verify_password_async,
+    verify_and_update_password_async,
+    get_password_hash_async,
+    password_hash_stats,
+    benchmark_bcrypt_rounds_async,
     create_access_token,
     verify_token,
     SECRET_KEY,
@@ -22,6 +27,11 @@ __all__ = [
     # Auth utilities
     "verify_password",
     "get_password_hash",
+    "verify_password_async",
+    "verify_and_update_password_async",
+    "get_password_hash_async",
+    "password_hash_stats",
+    "benchmark_bcrypt_rounds_async",
     "create_access_token",
     "verify_token",
 
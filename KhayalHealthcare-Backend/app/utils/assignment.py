@@ -0,0 +1,80 @@
+from typing import List, Optional
+
+# Cost marking a pair that must never be matched
+INFEASIBLE = float("inf")
+
+def solve_assignment(costs: List[List[float]]) -> List[Optional[int]]:
+    """Minimum-cost assignment of rows to columns (Hungarian algorithm).
+
+    `costs` is a rectangular rows x columns matrix; INFEASIBLE entries are
+    never used. Returns, for each row, the matched column or None when the
+    row is left unmatched. Runs in O(n^2 m) time for n <= m.
+    """
+    rows = len(costs)
+    cols = len(costs[0]) if rows else 0
+    if not rows or not cols:
+        return [None] * rows
+
+    # The algorithm needs rows <= columns; solve the transpose otherwise
+    if rows > cols:
+        transposed = [[costs[r][c] for r in range(rows)] for c in range(cols)]
+        col_matches = solve_assignment(transposed)
+        matches: List[Optional[int]] = [None] * rows
+        for col, row in enumerate(col_matches):
+            if row is not None:
+                matches[row] = col
+        return matches
+
+    # Stand-in for infeasible pairs: larger than any complete feasible assignment
+    finite = [abs(cost) for row in costs for cost in row if cost != INFEASIBLE]
+    big = (max(finite) if finite else 1.0) * 2 * (rows + 1) + 1.0
+    matrix = [[big if cost == INFEASIBLE else cost for cost in row] for row in costs]
+
+    # Potentials-based shortest augmenting path (1-indexed, column 0 is a sentinel)
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (cols + 1)
+    match_col = [0] * (cols + 1)
+    way = [0] * (cols + 1)
+
+    for row in range(1, rows + 1):
+        match_col[0] = row
+        col0 = 0
+        min_to = [float("inf")] * (cols + 1)
+        used = [False] * (cols + 1)
+        while True:
+            used[col0] = True
+            row0 = match_col[col0]
+            delta = float("inf")
+            col1 = 0
+            cost_row = matrix[row0 - 1]
+            u_row0 = u[row0]
+            for col in range(1, cols + 1):
+                if used[col]:
+                    continue
+                reduced = cost_row[col - 1] - u_row0 - v[col]
+                if reduced < min_to[col]:
+                    min_to[col] = reduced
+                    way[col] = col0
+                if min_to[col] < delta:
+                    delta = min_to[col]
+                    col1 = col
+            for col in range(cols + 1):
+                if used[col]:
+                    u[match_col[col]] += delta
+                    v[col] -= delta
+                else:
+                    min_to[col] -= delta
+            col0 = col1
+            if match_col[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            match_col[col0] = match_col[col1]
+            col0 = col1
+
+    matches = [None] * rows
+    for col in range(1, cols + 1):
+        row = match_col[col]
+        if row and costs[row - 1][col - 1] != INFEASIBLE:
+            matches[row - 1] = col - 1
+    return matches
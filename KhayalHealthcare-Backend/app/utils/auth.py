@@ -1,17 +1,101 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple, List
+from concurrent.futures import ThreadPoolExecutor
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from passlib.hash import bcrypt as bcrypt_hash
 from decouple import config
+import asyncio
 import logging
+import time
 
 SECRET_KEY = config('SECRET_KEY')
 ALGORITHM = config('ALGORITHM')
 ACCESS_TOKEN_EXPIRE_MINUTES = int(config('ACCESS_TOKEN_EXPIRE_MINUTES'))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=2, cast=int)
+PASSWORD_HASH_MAX_QUEUE = config('PASSWORD_HASH_MAX_QUEUE', default=64, cast=int)
+
+# bcrypt cost factor; hashes at any other cost are rehashed on the next login
+BCRYPT_ROUNDS = config('BCRYPT_ROUNDS', default=12, cast=int)
+# Target time for a single bcrypt hash, used when benchmarking cost factors
+PASSWORD_HASH_SLO_MS = config('PASSWORD_HASH_SLO_MS', default=250, cast=int)
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS
+)
 logger = logging.getLogger(__name__)
 
+_password_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
+# Benchmarks take seconds, so they get their own thread rather than a password pool worker
+_benchmark_executor = ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix="bcrypt-benchmark"
+)
+
+class PasswordHashingBusy(RuntimeError):
+    """Raised when too many password hash jobs are already waiting"""
+
+class _PasswordHashStats:
+    submitted = 0
+    completed = 0
+    failed = 0
+    rejected = 0
+    in_flight = 0  # queued or running
+    max_in_flight = 0
+    total_seconds = 0.0
+
+_stats = _PasswordHashStats()
+
+def password_hash_stats() -> dict:
+    """Queue depth and throughput of the password hashing pool"""
+    return {
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "in_flight": _stats.in_flight,
+        "queued": max(_stats.in_flight - PASSWORD_HASH_WORKERS, 0),
+        "max_in_flight": _stats.max_in_flight,
+        "submitted": _stats.submitted,
+        "completed": _stats.completed,
+        "failed": _stats.failed,
+        "rejected": _stats.rejected,
+        "avg_ms": round(_stats.total_seconds * 1000 / _stats.completed, 2) if _stats.completed else 0.0
+    }
+
+async def _run_in_password_pool(func, *args):
+    """Run a bcrypt call in the bounded password hashing pool"""
+    if _stats.in_flight >= PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE:
+        _stats.rejected += 1
+        logger.warning(f"Password hashing pool saturated ({_stats.in_flight} jobs in flight)")
+        raise PasswordHashingBusy("Password hashing is temporarily overloaded")
+
+    _stats.submitted += 1
+    _stats.in_flight += 1
+    _stats.max_in_flight = max(_stats.max_in_flight, _stats.in_flight)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    try:
+        result = await loop.run_in_executor(_password_executor, func, *args)
+    except BaseException:
+        _stats.failed += 1
+        raise
+    finally:
+        _stats.in_flight -= 1
+    # Only successful jobs feed the throughput figures
+    _stats.completed += 1
+    _stats.total_seconds += loop.time() - started
+    return result
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     try:
@@ -26,6 +110,32 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         logger.error(f"Password verification error: {str(e)}")
         return False
 
+def normalize_username(username: str) -> str:
+    """Lowercased username used for case-insensitive lookups (stored as username_lower)"""
+    return username.lower()
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash if the stored one is outdated.
+
+    Returns (valid, new_hash). new_hash is set for legacy plain text passwords and
+    for bcrypt hashes whose cost differs from BCRYPT_ROUNDS.
+    """
+    try:
+        if hashed_password.startswith(('$2a$', '$2b$', '$2y$')):
+            return pwd_context.verify_and_update(plain_password, hashed_password)
+
+        # Legacy plain text password support
+        if plain_password != hashed_password:
+            return False, None
+        try:
+            return True, get_password_hash(plain_password)
+        except ValueError:
+            logger.warning("Plain text password is too long to hash - leaving it unchanged")
+            return True, None
+    except Exception as e:
+        logger.error(f"Password verification error: {str(e)}")
+        return False, None
+
 def validate_password_length(password: str) -> str:
     """Validate password length and return safe password"""
     if len(password.encode('utf-8')) > 72:
@@ -44,6 +154,51 @@ def get_password_hash(password: str) -> str:
             raise ValueError('Password is too long. Please use a shorter password (maximum 72 bytes).')
         raise e
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password without blocking the event loop"""
+    return await _run_in_password_pool(verify_password, plain_password, hashed_password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and compute any replacement hash without blocking the event loop"""
+    return await _run_in_password_pool(verify_and_update_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password without blocking the event loop"""
+    return await _run_in_password_pool(get_password_hash, password)
+
+def benchmark_bcrypt_rounds(min_rounds: int = 10, max_rounds: int = 14, samples: int = 3) -> dict:
+    """Time bcrypt hashing at each cost factor on this node.
+
+    The recommended cost is the highest one whose average hash time stays
+    within PASSWORD_HASH_SLO_MS.
+    """
+    results: List[dict] = []
+    recommended = None
+    for rounds in range(min_rounds, max_rounds + 1):
+        hasher = bcrypt_hash.using(rounds=rounds)
+        started = time.perf_counter()
+        for _ in range(samples):
+            hasher.hash("benchmark-password")
+        avg_ms = (time.perf_counter() - started) * 1000 / samples
+        within_slo = avg_ms <= PASSWORD_HASH_SLO_MS
+        if within_slo:
+            recommended = rounds
+        results.append({"rounds": rounds, "avg_ms": round(avg_ms, 2), "within_slo": within_slo})
+
+    return {
+        "current_rounds": BCRYPT_ROUNDS,
+        "slo_ms": PASSWORD_HASH_SLO_MS,
+        "recommended_rounds": recommended,
+        "results": results
+    }
+
+async def benchmark_bcrypt_rounds_async(min_rounds: int = 10, max_rounds: int = 14, samples: int = 3) -> dict:
+    """Run the bcrypt benchmark off the event loop, outside the password hashing pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _benchmark_executor, benchmark_bcrypt_rounds, min_rounds, max_rounds, samples
+    )
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PeriodicJob:
+    """A named coroutine run on a fixed interval, with its run history"""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval_seconds: float,
+        timeout_seconds: Optional[float] = None,
+        initial_delay_seconds: float = 0
+    ):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.timeout_seconds = timeout_seconds
+        self.initial_delay_seconds = initial_delay_seconds
+        self.task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.restarts = 0
+        self.last_started_at: Optional[datetime] = None
+        self.last_success_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.last_result = None
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "running": self.task is not None and not self.task.done(),
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "restarts": self.restarts,
+            "last_started_at": self.last_started_at,
+            "last_success_at": self.last_success_at,
+            "last_error": self.last_error,
+            "last_result": self.last_result
+        }
+
+class BackgroundTaskManager:
+    """Runs periodic maintenance jobs and restarts any that die unexpectedly.
+
+    Each job runs in its own task; a failing run is logged and retried on the
+    next interval, and a supervisor loop restarts job tasks that exit.
+    """
+
+    SUPERVISOR_INTERVAL_SECONDS = 30
+
+    def __init__(self):
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self.one_off: Dict[str, asyncio.Task] = {}
+        self._supervisor: Optional[asyncio.Task] = None
+
+    def register(
+        self,
+        name: str,
+        func: Callable[[], Awaitable],
+        interval_seconds: float,
+        timeout_seconds: Optional[float] = None,
+        initial_delay_seconds: float = 0
+    ) -> PeriodicJob:
+        """Register a periodic job; jobs registered after start() begin immediately"""
+        if name in self.jobs:
+            raise ValueError(f"Background job '{name}' is already registered")
+
+        job = PeriodicJob(name, func, interval_seconds, timeout_seconds, initial_delay_seconds)
+        self.jobs[name] = job
+        if self._supervisor is not None:
+            self._start_job(job)
+        return job
+
+    def run_once(self, name: str, func: Callable[[], Awaitable]) -> bool:
+        """Start a one-off job; returns False if one with this name is still running"""
+        if self.is_running(name):
+            return False
+
+        task = asyncio.create_task(func(), name=f"background-job:{name}")
+        task.add_done_callback(lambda done: self._log_one_off(name, done))
+        self.one_off[name] = task
+        return True
+
+    def is_running(self, name: str) -> bool:
+        task = self.one_off.get(name)
+        return task is not None and not task.done()
+
+    def _log_one_off(self, name: str, task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background job '{name}' failed: {task.exception()}")
+
+    def start(self):
+        """Start every registered job and the supervisor"""
+        if self._supervisor is not None:
+            return
+        for job in self.jobs.values():
+            self._start_job(job)
+        self._supervisor = asyncio.create_task(self._supervise())
+        logger.info(f"Started background jobs: {', '.join(self.jobs) or 'none'}")
+
+    async def stop(self):
+        """Cancel the supervisor and every job task"""
+        tasks = [job.task for job in self.jobs.values() if job.task]
+        tasks.extend(task for task in self.one_off.values() if not task.done())
+        if self._supervisor:
+            tasks.append(self._supervisor)
+            self._supervisor = None
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for job in self.jobs.values():
+            job.task = None
+        logger.info("Stopped background jobs")
+
+    def status(self) -> list:
+        """Run history of every registered job"""
+        return [job.status() for job in self.jobs.values()]
+
+    def _start_job(self, job: PeriodicJob):
+        job.task = asyncio.create_task(self._run_job(job), name=f"background-job:{job.name}")
+
+    async def _run_job(self, job: PeriodicJob):
+        if job.initial_delay_seconds:
+            await asyncio.sleep(job.initial_delay_seconds)
+
+        while True:
+            job.runs += 1
+            job.last_started_at = datetime.utcnow()
+            try:
+                if job.timeout_seconds:
+                    job.last_result = await asyncio.wait_for(job.func(), timeout=job.timeout_seconds)
+                else:
+                    job.last_result = await job.func()
+                job.last_success_at = datetime.utcnow()
+                job.consecutive_failures = 0
+                job.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                job.failures += 1
+                job.consecutive_failures += 1
+                job.last_error = f"Timed out after {job.timeout_seconds} seconds"
+                logger.error(f"Background job '{job.name}' timed out after {job.timeout_seconds} seconds")
+            except Exception as e:
+                job.failures += 1
+                job.consecutive_failures += 1
+                job.last_error = str(e)
+                logger.error(f"Background job '{job.name}' failed: {str(e)}", exc_info=True)
+
+            await asyncio.sleep(job.interval_seconds)
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(self.SUPERVISOR_INTERVAL_SECONDS)
+            for job in self.jobs.values():
+                if job.task is None or not job.task.done():
+                    continue
+                if not job.task.cancelled() and job.task.exception():
+                    logger.error(f"Background job '{job.name}' crashed: {job.task.exception()}")
+                job.restarts += 1
+                logger.warning(f"Restarting background job '{job.name}'")
+                self._start_job(job)
+
+# Process-wide manager started and stopped with the application
+background_tasks = BackgroundTaskManager()
@@ -0,0 +1,52 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Stored for keys that are known not to exist (negative caching)
+MISSING = object()
+
+class TTLCache:
+    """Small in-process cache with per-entry expiry and LRU eviction.
+
+    Entries are local to the worker process, so the TTL bounds how stale a
+    value can get when another worker changes the underlying data.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, MISSING for a cached miss, or None if not cached"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Cache a value; pass MISSING to remember that the key does not exist"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Drop a single entry"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
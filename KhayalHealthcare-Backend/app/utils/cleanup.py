@@ -1,26 +1,102 @@
-import asyncio
 from datetime import datetime
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.services.verification import VerificationService
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def cleanup_expired_verifications(db: AsyncIOMotorDatabase):
-    """Clean up expired verification codes periodically"""
-    while True:
-        try:
-            # Delete expired verification codes
-            result = await db.verification_codes.delete_many({
-                "status": "pending",
-                "expires_at": {"$lt": datetime.utcnow()}
-            })
-            
-            if result.deleted_count > 0:
-                logger.info(f"Cleaned up {result.deleted_count} expired verification codes")
-            
-            # Wait for 1 hour before next cleanup
-            await asyncio.sleep(3600)
+async def cleanup_expired_verifications(db: AsyncIOMotorDatabase) -> dict:
+    """Delete expired verification codes and lapsed account restrictions.
+
+    TTL indexes remove these too; this sweep covers deployments where the
+    indexes could not be created and runs as a periodic background job.
+    """
+    verification_service = VerificationService(db)
+    codes_deleted = await verification_service.cleanup_expired_codes()
+    restrictions_deleted = await verification_service.cleanup_lapsed_restrictions()
+    
+    if codes_deleted or restrictions_deleted:
+        logger.info(
+            f"Cleaned up {codes_deleted} expired verification codes "
+            f"and {restrictions_deleted} lapsed account restrictions"
+        )
+    
+    return {
+        "verification_codes_deleted": codes_deleted,
+        "account_restrictions_deleted": restrictions_deleted
+    }
+
+OVERSIZED_PASSWORD_JOB = "verification-password-cleanup"
+
+async def get_cleanup_progress(db: AsyncIOMotorDatabase, job_id: str = OVERSIZED_PASSWORD_JOB) -> dict:
+    """Saved progress of a resumable cleanup job"""
+    progress = await db.maintenance_jobs.find_one({"_id": job_id}, {"last_id": 0})
+    if not progress:
+        return {"job": job_id, "status": "never_run"}
+    progress["job"] = progress.pop("_id")
+    return progress
+
+async def purge_oversized_registration_passwords(
+    db: AsyncIOMotorDatabase,
+    batch_size: int = 500,
+    restart: bool = False
+) -> dict:
+    """Delete pending registrations whose stored password bcrypt cannot hash.
+
+    Works in _id-ordered batches and saves a checkpoint after each one in
+    maintenance_jobs, so an interrupted run resumes where it stopped.
+    """
+    jobs = db.maintenance_jobs
+    verification_service = VerificationService(db)
+    
+    progress = await jobs.find_one({"_id": OVERSIZED_PASSWORD_JOB})
+    if restart or not progress or progress.get("status") == "completed":
+        progress = {
+            "_id": OVERSIZED_PASSWORD_JOB,
+            "status": "running",
+            "last_id": None,
+            "batches": 0,
+            "matched": 0,
+            "deleted": 0,
+            "started_at": datetime.utcnow(),
+            "finished_at": None,
+            "error": None
+        }
+    else:
+        logger.info(f"Resuming {OVERSIZED_PASSWORD_JOB} after {progress.get('last_id')}")
+        progress["status"] = "running"
+        progress["error"] = None
+    progress["updated_at"] = datetime.utcnow()
+    await jobs.replace_one({"_id": OVERSIZED_PASSWORD_JOB}, progress, upsert=True)
+    
+    try:
+        while True:
+            matched, deleted, last_id = await verification_service.delete_oversized_password_batch(
+                progress["last_id"], batch_size
+            )
+            if last_id is None:
+                break
             
-        except Exception as e:
-            logger.error(f"Error in cleanup task: {str(e)}")
-            await asyncio.sleep(3600)
+            progress["last_id"] = last_id
+            progress["batches"] += 1
+            progress["matched"] += matched
+            progress["deleted"] += deleted
+            progress["updated_at"] = datetime.utcnow()
+            await jobs.update_one({"_id": OVERSIZED_PASSWORD_JOB}, {"$set": progress})
+            logger.info(
+                f"{OVERSIZED_PASSWORD_JOB}: batch {progress['batches']} deleted {deleted} "
+                f"({progress['deleted']} total)"
+            )
+    except Exception as e:
+        await jobs.update_one(
+            {"_id": OVERSIZED_PASSWORD_JOB},
+            {"$set": {"status": "failed", "error": str(e), "updated_at": datetime.utcnow()}}
+        )
+        raise
+    
+    progress["status"] = "completed"
+    progress["finished_at"] = progress["updated_at"] = datetime.utcnow()
+    await jobs.update_one({"_id": OVERSIZED_PASSWORD_JOB}, {"$set": progress})
+    logger.info(f"{OVERSIZED_PASSWORD_JOB} completed: deleted {progress['deleted']} records")
+    
+    return await get_cleanup_progress(db)
@@ -1,3 +1,4 @@
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.utils.auth import verify_token
@@ -34,6 +35,13 @@ async def get_current_user(
     
     return user
 
+async def get_user_from_token(token: str, db) -> Optional[User]:
+    """Resolve a bearer token to its user, for connections that cannot use the Authorization header"""
+    username = verify_token(token) if token else None
+    if username is None:
+        return None
+    return await UserService(db).get_user_by_username(username)
+
 async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
     """Ensure current user is admin"""
     if current_user.role != UserRole.ADMIN:
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from decouple import config
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long a completed request's response is replayed for; a TTL index removes older keys
+IDEMPOTENCY_TTL_SECONDS = config('IDEMPOTENCY_TTL_SECONDS', default=86400, cast=int)
+# How long a claim on a key holds before a retry may take it over (the holder may have died)
+IDEMPOTENCY_LOCK_SECONDS = config('IDEMPOTENCY_LOCK_SECONDS', default=60, cast=int)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+class IdempotencyKeyConflict(ValueError):
+    """The key is in use by a request that is still running"""
+
+class IdempotencyKeyMismatch(ValueError):
+    """The key was already used with a different request body"""
+
+def request_fingerprint(payload: dict) -> str:
+    """Stable hash of a request body, so a reused key with a different body is detected"""
+    encoded = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class IdempotencyStore:
+    """Remember the outcome of POSTs that carry an Idempotency-Key header.
+
+    The first request with a key claims it with an insert (the _id is unique,
+    so concurrent retries cannot both claim it); later requests with the same
+    key get the stored response back instead of repeating the side effects.
+    A claim is a lease: if its holder never completes or releases it, a retry
+    can take it over once `locked_until` has passed. Before doing its side
+    effect the holder records the id of what it creates (`resource_id`), so a
+    takeover can find and replay that instead of creating it again.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db.idempotency_keys
+
+    def _record_id(self, scope: str, user_id: str, key: str) -> str:
+        return f"{scope}:{user_id}:{key}"
+
+    async def begin(self, scope: str, user_id: str, key: str, fingerprint: str) -> Optional[dict]:
+        """Claim a key.
+
+        Returns None if newly claimed. Otherwise returns the stored record:
+        a completed one to replay, or an in-progress one this call has taken
+        over, whose resource_id (if set) is what the first attempt created.
+        """
+        now = datetime.utcnow()
+        record_id = self._record_id(scope, user_id, key)
+        try:
+            await self.collection.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "status": IN_PROGRESS,
+                "created_at": now,
+                "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+                "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        record = await self.collection.find_one({"_id": record_id})
+        if not record:
+            # Expired between the insert and the read; claim it again
+            return await self.begin(scope, user_id, key, fingerprint)
+        if record["fingerprint"] != fingerprint:
+            raise IdempotencyKeyMismatch("Idempotency-Key was already used with a different request")
+        if record["status"] == COMPLETED:
+            return record
+
+        # Take over a claim whose lease ran out; only one retry can win the update
+        taken_over = await self.collection.find_one_and_update(
+            {"_id": record_id, "status": IN_PROGRESS, "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+            return_document=ReturnDocument.AFTER
+        )
+        if taken_over:
+            logger.warning(f"Took over expired idempotency claim {record_id}")
+            return taken_over
+        raise IdempotencyKeyConflict("A request with this Idempotency-Key is still being processed")
+
+    async def set_resource(self, scope: str, user_id: str, key: str, resource_id: str):
+        """Record the id of what the claimed request is about to create"""
+        await self.collection.update_one(
+            {"_id": self._record_id(scope, user_id, key), "status": IN_PROGRESS},
+            {"$set": {"resource_id": resource_id}}
+        )
+
+    async def complete(self, scope: str, user_id: str, key: str, response: dict, status_code: int):
+        """Store the response so retries replay it"""
+        await self.collection.update_one(
+            {"_id": self._record_id(scope, user_id, key)},
+            {"$set": {
+                "status": COMPLETED,
+                "status_code": status_code,
+                "response": response,
+                "completed_at": datetime.utcnow()
+            }}
+        )
+
+    async def release(self, scope: str, user_id: str, key: str):
+        """Forget a claimed key after a failed request so the client can retry it"""
+        await self.collection.delete_one({
+            "_id": self._record_id(scope, user_id, key),
+            "status": IN_PROGRESS
+        })
@@ -1,6 +1,6 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.models.user import User, UserRole, ApprovalStatus
-from app.utils.auth import get_password_hash
+from app.utils.auth import get_password_hash_async, normalize_username
 from datetime import datetime
 import logging
 
@@ -41,12 +41,13 @@ async def create_default_admins(db: AsyncIOMotorDatabase):
         ]
         
         # Hash the default password
-        hashed_password = get_password_hash("admin123")
+        hashed_password = await get_password_hash_async("admin123")
         
         # Create admin users
         for admin_data in default_admins:
             admin_user = {
                 "username": admin_data["username"],
+                "username_lower": normalize_username(admin_data["username"]),
                 "email": admin_data["email"],
                 "password": hashed_password,
                 "name": admin_data["name"],
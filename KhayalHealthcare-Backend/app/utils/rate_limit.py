@@ -0,0 +1,276 @@
+import secrets
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Optional shared backend so limits hold across workers
+try:
+    import redis.asyncio as redis_asyncio
+    REDIS_AVAILABLE = True
+except Exception:
+    REDIS_AVAILABLE = False
+
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_REDIS_URL = config('RATE_LIMIT_REDIS_URL', default='')
+# Behind the hosting proxy uvicorn runs with --proxy-headers, so request.client is
+# already the caller. Only set this when a proxy forwards headers but uvicorn
+# is not told to trust them; the last X-Forwarded-For entry is then used.
+RATE_LIMIT_TRUST_PROXY = config('RATE_LIMIT_TRUST_PROXY', default=False, cast=bool)
+RATE_LIMIT_MAX_KEYS = config('RATE_LIMIT_MAX_KEYS', default=100000, cast=int)
+
+def _parse_rule(value: str) -> Tuple[int, int]:
+    """Parse a "<limit>/<window seconds>" rule"""
+    limit, window = value.split('/')
+    return int(limit), int(window)
+
+# Per endpoint: (kind of key, "<limit>/<window seconds>"). Per-IP limits are
+# sized for many users sharing one address (mobile carriers, offices); the
+# per-account and per-contact limits are the tight ones.
+AUTH_RATE_LIMITS: Dict[str, List[Tuple[str, Tuple[int, int]]]] = {
+    "login": [
+        ("ip", _parse_rule(config('RATE_LIMIT_LOGIN_IP', default='120/300'))),
+    ],
+    # Failed logins per account; only failures are recorded and a success clears them
+    "login-failure": [
+        ("identifier", _parse_rule(config('RATE_LIMIT_LOGIN_IDENTIFIER', default='10/300'))),
+    ],
+    "register": [
+        ("ip", _parse_rule(config('RATE_LIMIT_REGISTER_IP', default='60/3600'))),
+        ("email", _parse_rule(config('RATE_LIMIT_REGISTER_CONTACT', default='5/3600'))),
+        ("phone", _parse_rule(config('RATE_LIMIT_REGISTER_CONTACT', default='5/3600'))),
+    ],
+    "resend-code": [
+        ("ip", _parse_rule(config('RATE_LIMIT_RESEND_IP', default='60/3600'))),
+        ("email", _parse_rule(config('RATE_LIMIT_RESEND_CONTACT', default='5/3600'))),
+        ("phone", _parse_rule(config('RATE_LIMIT_RESEND_CONTACT', default='5/3600'))),
+    ],
+    "forgot-password": [
+        ("ip", _parse_rule(config('RATE_LIMIT_FORGOT_PASSWORD_IP', default='60/3600'))),
+        ("identifier", _parse_rule(config('RATE_LIMIT_FORGOT_PASSWORD_IDENTIFIER', default='5/3600'))),
+    ],
+}
+
+class InMemoryRateLimitBackend:
+    """Sliding-window log per key, local to this worker process"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._hits: Dict[str, Deque[float]] = {}
+        self._windows: Dict[str, float] = {}
+
+    async def hit(self, key: str, limit: int, window_seconds: int) -> Optional[float]:
+        """Record a hit; return seconds until retry if the key is over its limit"""
+        now = time.monotonic()
+        hits = self._hits.get(key)
+        if hits is None:
+            if len(self._hits) >= self.max_keys:
+                self.prune()
+                while len(self._hits) >= self.max_keys:
+                    oldest = next(iter(self._hits))
+                    self._hits.pop(oldest)
+                    self._windows.pop(oldest, None)
+            hits = self._hits[key] = deque()
+            self._windows[key] = window_seconds
+
+        while hits and hits[0] <= now - window_seconds:
+            hits.popleft()
+
+        if len(hits) >= limit:
+            return hits[0] + window_seconds - now
+
+        hits.append(now)
+        return None
+
+    async def peek(self, key: str, limit: int, window_seconds: int) -> Optional[float]:
+        """Seconds until retry if the key is over its limit, without recording a hit"""
+        now = time.monotonic()
+        hits = self._hits.get(key)
+        if not hits:
+            return None
+        while hits and hits[0] <= now - window_seconds:
+            hits.popleft()
+        if len(hits) >= limit:
+            return hits[0] + window_seconds - now
+        return None
+
+    async def reset(self, key: str):
+        self._hits.pop(key, None)
+        self._windows.pop(key, None)
+
+    def prune(self) -> int:
+        """Drop keys with no hits inside their window"""
+        now = time.monotonic()
+        stale = [
+            key for key, hits in self._hits.items()
+            if not hits or hits[-1] <= now - self._windows.get(key, 0)
+        ]
+        for key in stale:
+            self._hits.pop(key, None)
+            self._windows.pop(key, None)
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+class RedisRateLimitBackend:
+    """Sliding-window log in a Redis sorted set, shared by all workers"""
+
+    def __init__(self, url: str):
+        self.client = redis_asyncio.from_url(url)
+
+    async def hit(self, key: str, limit: int, window_seconds: int) -> Optional[float]:
+        now = time.time()
+        redis_key = f"rate-limit:{key}"
+        member = f"{now}:{secrets.token_hex(4)}"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(redis_key, 0, now - window_seconds)
+            pipe.zadd(redis_key, {member: now})
+            pipe.zcard(redis_key)
+            pipe.zrange(redis_key, 0, 0, withscores=True)
+            pipe.expire(redis_key, window_seconds)
+            _, _, count, oldest, _ = await pipe.execute()
+
+        if count > limit:
+            # Rejected hits do not count against the window
+            await self.client.zrem(redis_key, member)
+            oldest_at = oldest[0][1] if oldest else now
+            return oldest_at + window_seconds - now
+        return None
+
+    async def peek(self, key: str, limit: int, window_seconds: int) -> Optional[float]:
+        now = time.time()
+        redis_key = f"rate-limit:{key}"
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(redis_key, 0, now - window_seconds)
+            pipe.zcard(redis_key)
+            pipe.zrange(redis_key, 0, 0, withscores=True)
+            _, count, oldest = await pipe.execute()
+        if count >= limit:
+            oldest_at = oldest[0][1] if oldest else now
+            return oldest_at + window_seconds - now
+        return None
+
+    async def reset(self, key: str):
+        await self.client.delete(f"rate-limit:{key}")
+
+    def prune(self) -> int:
+        # Redis expires keys itself
+        return 0
+
+class RateLimiter:
+    """Checks request keys against the configured limits before any DB work"""
+
+    def __init__(self):
+        self.memory = InMemoryRateLimitBackend()
+        self.shared = None
+        if RATE_LIMIT_REDIS_URL:
+            if REDIS_AVAILABLE:
+                self.shared = RedisRateLimitBackend(RATE_LIMIT_REDIS_URL)
+            else:
+                logger.warning("RATE_LIMIT_REDIS_URL is set but redis is not installed - using in-memory limits")
+        self.rejected = 0
+
+    def _rules(self, scope: str, keys: Dict[str, Optional[str]]):
+        """(kind, key, limit, window) for every rule of the scope that has a value"""
+        for kind, (limit, window_seconds) in AUTH_RATE_LIMITS[scope]:
+            value = keys.get(kind)
+            if value:
+                yield kind, f"{scope}:{kind}:{value.strip().lower()}", limit, window_seconds
+
+    async def check(self, scope: str, keys: Dict[str, Optional[str]]) -> Optional[float]:
+        """Record a hit; return seconds until retry if any key is over its limit for this scope"""
+        for kind, key, limit, window_seconds in self._rules(scope, keys):
+            retry_after = await self._call("hit", key, limit, window_seconds)
+            if retry_after is not None:
+                self.rejected += 1
+                logger.warning(f"Rate limit exceeded for {scope} by {kind}")
+                return retry_after
+        return None
+
+    async def blocked(self, scope: str, keys: Dict[str, Optional[str]]) -> Optional[float]:
+        """Like check, but without recording a hit"""
+        for kind, key, limit, window_seconds in self._rules(scope, keys):
+            retry_after = await self._call("peek", key, limit, window_seconds)
+            if retry_after is not None:
+                self.rejected += 1
+                logger.warning(f"Rate limit exceeded for {scope} by {kind}")
+                return retry_after
+        return None
+
+    async def reset(self, scope: str, keys: Dict[str, Optional[str]]):
+        """Forget the recorded hits of these keys"""
+        for _, key, _, _ in self._rules(scope, keys):
+            await self._call("reset", key)
+
+    async def _call(self, method: str, key: str, *args):
+        if self.shared is not None:
+            try:
+                return await getattr(self.shared, method)(key, *args)
+            except Exception as e:
+                logger.error(f"Shared rate limit backend failed, using in-memory limits: {str(e)}")
+        return await getattr(self.memory, method)(key, *args)
+
+    def prune(self) -> int:
+        """Drop idle in-memory keys (run periodically)"""
+        return self.memory.prune()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": RATE_LIMIT_ENABLED,
+            "shared_backend": self.shared is not None,
+            "tracked_keys": len(self.memory),
+            "rejected": self.rejected
+        }
+
+rate_limiter = RateLimiter()
+
+def client_ip(request: Request) -> Optional[str]:
+    """Client address, taken from X-Forwarded-For only when the proxy is trusted.
+
+    The last entry is the one our proxy appended; earlier ones are client-supplied.
+    """
+    if RATE_LIMIT_TRUST_PROXY:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else None
+
+def _too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests. Please try again later.",
+        headers={"Retry-After": str(max(int(retry_after) + 1, 1))}
+    )
+
+async def enforce_rate_limit(request: Request, scope: str, **keys: Optional[str]):
+    """Raise 429 if the caller's IP or any identifier is over the limit for this endpoint"""
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    retry_after = await rate_limiter.check(scope, {"ip": client_ip(request), **keys})
+    if retry_after is not None:
+        raise _too_many_requests(retry_after)
+
+async def enforce_failure_limit(scope: str, **keys: Optional[str]):
+    """Raise 429 if the identifiers already have too many recorded failures"""
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    retry_after = await rate_limiter.blocked(scope, keys)
+    if retry_after is not None:
+        raise _too_many_requests(retry_after)
+
+async def record_failure(scope: str, **keys: Optional[str]):
+    """Count a failed attempt against the identifiers"""
+    if RATE_LIMIT_ENABLED:
+        await rate_limiter.check(scope, keys)
+
+async def clear_failures(scope: str, **keys: Optional[str]):
+    """Forget failed attempts after a success"""
+    if RATE_LIMIT_ENABLED:
+        await rate_limiter.reset(scope, keys)
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Dict, Iterable, Set
+from decouple import config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per connection before a slow client is disconnected
+REALTIME_QUEUE_SIZE = config('REALTIME_QUEUE_SIZE', default=100, cast=int)
+
+class Subscription:
+    """One connected client's queue of pending events"""
+
+    def __init__(self, user_id: str, maxsize: int = REALTIME_QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+class EventHub:
+    """In-process pub/sub keyed by user id.
+
+    Each worker only knows its own connections; in multi-worker deployments a
+    bridge (e.g. a Mongo change stream) feeds every worker's hub instead of
+    publishers calling it directly.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(str(user_id))
+        self._subscribers.setdefault(subscription.user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if not subscribers:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+
+    def publish(self, user_ids: Iterable[str], event: dict):
+        """Queue an event for every connection of the given users (never blocks)"""
+        self.published += 1
+        for user_id in set(str(user_id) for user_id in user_ids):
+            for subscription in list(self._subscribers.get(user_id, ())):
+                try:
+                    subscription.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # The client is not keeping up; its connection is closed and it re-syncs
+                    subscription.overflowed = True
+                    self.dropped += 1
+
+    def is_connected(self, user_id: str) -> bool:
+        return bool(self._subscribers.get(str(user_id)))
+
+    def stats(self) -> dict:
+        return {
+            "connected_users": len(self._subscribers),
+            "connections": sum(len(subs) for subs in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+# Topic every admin's status feed subscribes to in addition to their user id
+ADMIN_TOPIC = "role:admin"
+
+# Process-wide hub for chat messages
+event_hub = EventHub()
+
+# Process-wide hub for visit-request and order status transitions
+status_hub = EventHub()
@@ -71,7 +71,6 @@ interface Coupon {
   created_by: string;
   created_at: string;
   updated_at: string;
-  user_usage_count: Record<string, number>;
 }
 
 interface CouponFormData {